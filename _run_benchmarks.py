@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+import hprof
+
+from test.bench.bench_model import BENCHMARKS, FIXTURES
+
+def git(*args):
+	try:
+		return subprocess.check_output(('git',) + args, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def load(fixture):
+	src = FIXTURES[fixture]()
+	if isinstance(src, str):
+		return hprof.open(src)
+	return hprof.parse(src)
+
+parser = argparse.ArgumentParser(description='Run the object model microbenchmarks.')
+parser.add_argument('patterns',
+	nargs='*',
+	help='only run benchmarks whose names contain one of these')
+parser.add_argument('--repeat',
+	type=int,
+	default=5,
+	help='best of how many runs (default: 5)')
+parser.add_argument('--output',
+	default='bench_results',
+	help='directory to store results in, one file per commit (default: bench_results)')
+parser.add_argument('--compare',
+	metavar='FILE',
+	help='show changes relative to an earlier results file')
+args = parser.parse_args()
+
+commit = git('rev-parse', 'HEAD') or 'unknown'
+dirty = bool(git('status', '--porcelain', '--untracked-files=no'))
+
+results = {}
+loaded = {}
+try:
+	for name, fixture, fn in BENCHMARKS:
+		key = '%s[%s]' % (name, fixture)
+		if args.patterns and not any(p in key for p in args.patterns):
+			continue
+		if fixture not in loaded:
+			loaded[fixture] = load(fixture)
+		run, nops = fn(loaded[fixture])
+		run() # warm up; e.g. materializes arrays on first access
+		best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+		results[key] = 1e9 * best / max(nops, 1)
+		print('%12.1f ns/op  %s' % (results[key], key))
+finally:
+	# the last benchmark may still hold on to heap objects
+	run = None
+	for hf in loaded.values():
+		hf.close()
+
+report = {
+	'commit': commit,
+	'dirty': dirty,
+	'python': sys.version,
+	'results': results,
+}
+os.makedirs(args.output, exist_ok=True)
+outpath = os.path.join(args.output, '%s%s.json' % (commit[:12], '-dirty' if dirty else ''))
+with open(outpath, 'w') as f:
+	json.dump(report, f, indent=1)
+print('results written to', outpath)
+
+if args.compare:
+	with open(args.compare) as f:
+		baseline = json.load(f)
+	print()
+	print('COMPARED TO %s:' % baseline['commit'][:12])
+	for key, nsop in results.items():
+		if key in baseline['results']:
+			before = baseline['results'][key]
+			print('%12.1f %12.1f %+7.1f%%  %s' % (before, nsop, 100 * (nsop - before) / before, key))
@@ -45,5 +45,11 @@ Lolvo
 '''
 
 from . import error
+from . import server
+from . import tracing
 from ._parsing import open, parse # pylint: disable=redefined-builtin
+from ._async import open_async
+from ._estimate import estimate
+from ._scan import histogram, summarize
+from ._sketch import triage
 from .heap import cast
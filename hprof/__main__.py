@@ -0,0 +1,12 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Runs the command line interface; see `python -m hprof --help`.
+'''
+
+import sys
+
+from ._cli import main
+
+sys.exit(main())
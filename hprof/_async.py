@@ -0,0 +1,127 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Loading hprof files without blocking an asyncio event loop.
+
+>>> import asyncio, hprof
+>>> async def load(path):
+...     loader = hprof.open_async(path)
+...     labels = []
+...     async for label, done, total in loader:
+...         if label not in labels:
+...             labels.append(label)
+...     return labels, await loader
+>>> labels, hf2 = asyncio.run(load('testdata/example-java.hprof.bz2'))
+>>> labels[:3]
+['opening', 'extracting', 'parsing']
+>>> len(hf2.heaps)
+1
+>>> hf2.close()
+'''
+
+import asyncio
+import threading
+
+from . import _parsing
+from .error import Cancelled
+
+_DONE = object()
+
+
+def open_async(path, executor=None):
+	''' Like `open()`, but loads the file in an executor, returning an object
+	that can be awaited for the resulting `HprofFile`:
+
+	    hf = await hprof.open_async(path)
+
+	The same object is also an async iterator over progress events; each event
+	is a (label, done, total) tuple, just like the arguments to the
+	`progress_callback` of `open()`. Iteration ends when loading does:
+
+	    loader = hprof.open_async(path)
+	    async for label, done, total in loader:
+	        print(label, done, total)
+	    hf = await loader
+
+	Loading starts the first time the object is awaited or iterated over, and
+	runs in `executor` (the event loop's default executor if None).
+
+	If the awaiting task is cancelled, or if `cancel()` is called, loading is
+	stopped at the next progress report. Any temporary file and file mapping
+	is released before the awaiting task sees the `CancelledError`.
+	'''
+	return _AsyncOpen(path, executor)
+
+
+class _AsyncOpen(object):
+	''' returned by open_async(). '''
+
+	def __init__(self, path, executor):
+		self._path = path
+		self._executor = executor
+		self._cancelled = threading.Event()
+		self._task = None
+		self._events = None
+
+	def _start(self):
+		if self._task is None:
+			loop = asyncio.get_running_loop()
+			self._events = asyncio.Queue()
+			self._task = loop.create_task(self._run(loop))
+		return self._task
+
+	def __await__(self):
+		return self._start().__await__()
+
+	def __aiter__(self):
+		self._start()
+		return self
+
+	async def __anext__(self):
+		self._start()
+		event = await self._events.get()
+		if event is _DONE:
+			self._events.put_nowait(_DONE) # keep ending further iterations
+			raise StopAsyncIteration
+		return event
+
+	def cancel(self):
+		''' Stop loading. The awaiting task will get a CancelledError. '''
+		self._cancelled.set()
+		if self._task is not None:
+			self._task.cancel()
+
+	async def _run(self, loop):
+		events = self._events
+		def post(event):
+			loop.call_soon_threadsafe(events.put_nowait, event)
+
+		def progress(label, done, total):
+			if self._cancelled.is_set():
+				raise Cancelled()
+			post((label, done, total))
+
+		def load():
+			try:
+				hf = _parsing.open(self._path, progress)
+				if self._cancelled.is_set():
+					hf.close()
+					raise Cancelled()
+				return hf
+			finally:
+				post(_DONE)
+
+		future = loop.run_in_executor(self._executor, load)
+		try:
+			return await asyncio.shield(future)
+		except asyncio.CancelledError:
+			self._cancelled.set()
+			# wait for the worker to let go of the file before we let go.
+			try:
+				await future
+			except Exception: # pylint: disable=broad-except
+				pass # most likely Cancelled; either way, there is no file.
+			else:
+				future.result().close()
+			raise
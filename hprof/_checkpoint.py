@@ -0,0 +1,105 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Saves and restores the state of a parse in progress, so that an interrupted
+`open()` can continue where it left off.
+
+A state file holds a pickled dict with the top-level tables (names, class
+loads, stack traces...), the offset of the next unparsed record, and, for each
+heap, the offsets of its class dump records. The deferred queues of each heap
+follow the pickle as raw packed records. Heap classes are recreated on restore
+by parsing their class dumps again; everything else is read back as is.
+'''
+
+import builtins
+import os
+import pickle
+import zlib
+
+from . import _heap_parsing
+from . import _parsing
+
+_VERSION = 2
+
+# the deferred queues of a heap, in the order they are written
+_QUEUES = ('_deferred_objects', '_deferred_objarrays', '_deferred_primarrays')
+
+_TABLES = ('unhandled', 'names', 'stackframes', 'threads', 'stacktraces',
+		'classloads', 'classloads_by_id')
+
+
+def fingerprint(data):
+	''' identifies the file contents well enough to notice a different file. '''
+	return (len(data), zlib.crc32(data[:1 << 16]), zlib.crc32(data[-(1 << 16):]))
+
+
+def _options(hf):
+	''' the parse options that change what is queued. '''
+	include = None if hf._include is None else hf._include.pattern
+	return (include, hf._include_depth)
+
+
+def save(path, hf, pos, data):
+	''' writes the state of hf, which has parsed everything up to pos in data,
+	to path. The file is replaced atomically. '''
+	heaps = list(hf.heaps)
+	if hf._pending_heap is not None:
+		heaps.append(hf._pending_heap)
+	state = {
+		'version': _VERSION,
+		'fingerprint': fingerprint(data),
+		'options': _options(hf),
+		'pos': pos,
+		'pending': hf._pending_heap is not None,
+		'heaps': [
+			(heap._class_records, [getattr(heap, q).nbytes for q in _QUEUES])
+			for heap in heaps
+		],
+	}
+	for name in _TABLES:
+		state[name] = getattr(hf, name)
+	tmp = path + '.tmp'
+	with builtins.open(tmp, 'wb') as f:
+		pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+		for heap in heaps:
+			for q in _QUEUES:
+				getattr(heap, q).write_to(f)
+	os.replace(tmp, path)
+
+
+def restore(path, hf, data, idsize):
+	''' loads the state in path into hf, if path exists and was saved while
+	parsing the same data. Returns the offset to continue parsing from, or
+	None if there was nothing to restore. '''
+	try:
+		f = builtins.open(path, 'rb')
+	except FileNotFoundError:
+		return None
+	with f:
+		try:
+			state = pickle.load(f)
+		except Exception: # pylint: disable=broad-except
+			return None # not a state file, or a truncated one
+		if (not isinstance(state, dict)
+				or state.get('version') != _VERSION
+				or state['fingerprint'] != fingerprint(data)
+				or state['options'] != _options(hf)):
+			return None
+		for name in _TABLES:
+			setattr(hf, name, state[name])
+		hf.names.attach(data)
+		heaps = []
+		for class_records, sizes in state['heaps']:
+			heap = _parsing._new_heap(hf, idsize)
+			for start, end in class_records:
+				reader = _parsing.PrimitiveReader(data[start:end], idsize, start)
+				_heap_parsing.parse_class(hf, heap, reader)
+				heap._class_records.append((start, end))
+			for q, nbytes in zip(_QUEUES, sizes):
+				getattr(heap, q).read_from(f, nbytes)
+			heaps.append(heap)
+	if state['pending']:
+		hf._pending_heap = heaps.pop()
+	hf.heaps = heaps
+	return state['pos']
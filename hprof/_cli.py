@@ -0,0 +1,272 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+The command line interface, `python -m hprof`.
+'''
+
+import argparse
+import datetime
+import getpass
+import os
+import re
+import sys
+import tempfile
+
+from collections import Counter
+from contextlib import contextmanager
+
+from . import _scan
+from ._parsing import open # pylint: disable=redefined-builtin
+
+_SIZE = re.compile(r'^(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?$', re.IGNORECASE)
+
+def parse_size(text):
+	''' parses a byte count, like "512M" or "4G".
+
+	>>> parse_size('4G')
+	4294967296
+	>>> parse_size('1.5k')
+	1536
+	'''
+	m = _SIZE.match(text.strip())
+	if m is None:
+		raise argparse.ArgumentTypeError('not a size: %r' % text)
+	number, unit = m.groups()
+	shift = 10 * 'kmgt'.find(unit.lower()) + 10 if unit else 0
+	return int(float(number) * (1 << shift))
+
+def default_socket():
+	''' the default server socket path for the current user. '''
+	return os.path.join(tempfile.gettempdir(), 'hprof-%s.sock' % getpass.getuser())
+
+def _address(args):
+	if args.port is not None:
+		return ('127.0.0.1', args.port)
+	return args.socket
+
+def _log(msg):
+	print(msg, file=sys.stderr)
+
+def _progress(path):
+	''' returns a progress callback that draws on stderr, if it is a terminal. '''
+	if not sys.stderr.isatty():
+		return None
+	def progress(label, done, total):
+		if total:
+			msg = '%s: %s %d%%' % (path, label, 100 * done // total)
+		else:
+			msg = '%s: %s...' % (path, label)
+		print(msg[:79].ljust(79), end='\r', file=sys.stderr)
+	return progress
+
+def _clear_progress():
+	if sys.stderr.isatty():
+		print(79 * ' ', end='\r', file=sys.stderr)
+
+@contextmanager
+def _scanned(path):
+	progress = _progress(path)
+	with _scan.mapped(path, progress) as mview:
+		scan = _scan.Scan(mview, progress)
+		try:
+			yield scan
+		finally:
+			_clear_progress()
+
+def _tag_name(names, tag):
+	return names.get(tag, 'unknown 0x%02x' % tag)
+
+def _limited(items, limit):
+	return items[:limit] if limit else items
+
+def cmd_summary(args):
+	''' show record counts and other basic facts about each file '''
+	for path in args.paths:
+		with _scanned(path) as scan:
+			summary = _scan.Summary(scan)
+		print(path)
+		print('    format:  %s, %d-byte ids' % (summary.version, summary.idsize))
+		when = datetime.datetime.fromtimestamp(summary.timestamp / 1000, datetime.timezone.utc)
+		print('    written: %s' % when.strftime('%Y-%m-%d %H:%M:%S UTC'))
+		print('    records:       count        bytes')
+		for tag, (n, nbytes) in sorted(summary.records.items()):
+			print('    %16d %12d  %s' % (n, nbytes, _tag_name(_scan.TAG_NAMES, tag)))
+		print('    heap dump contents:')
+		for tag, (n, nbytes) in sorted(summary.heap_records.items()):
+			print('    %16d %12d  %s' % (n, nbytes, _tag_name(_scan.HEAP_TAG_NAMES, tag)))
+		print('    primitive arrays:')
+		for name, n in sorted(summary.primitive_arrays.items()):
+			print('    %16d  %s[]' % (n, name))
+		print('    %16d  bytes of object data' % summary.object_bytes)
+	return 0
+
+def cmd_histogram(args):
+	''' count instances and data bytes per class, without loading the heap '''
+	if args.sample is not None:
+		return _estimated_histogram(args)
+	with _scanned(args.path) as scan:
+		hist = _scan.class_histogram(scan)
+	column = 1 if args.sort == 'bytes' else 0
+	rows = sorted(hist.items(), key=lambda item: (-item[1][column], item[0]))
+	print('%10s %12s  %s' % ('count', 'bytes', 'class'))
+	for name, (count, nbytes) in _limited(rows, args.limit):
+		print('%10d %12d  %s' % (count, nbytes, name))
+	return 0
+
+def _estimated_histogram(args):
+	from ._estimate import estimate
+	hist = estimate(args.path, args.sample, _progress(args.path))
+	_clear_progress()
+	column = 2 if args.sort == 'bytes' else 0
+	rows = sorted(hist.items(), key=lambda item: (-item[1][column], item[0]))
+	print('%10s %23s %12s %27s  %s' % ('count', '(range)', 'bytes', '(range)', 'class'))
+	for name, (count, (clow, chigh), nbytes, (blow, bhigh)) in _limited(rows, args.limit):
+		print('%10d %23s %12d %27s  %s' % (count, '(%d-%s)' % (clow, chigh), nbytes, '(%d-%s)' % (blow, bhigh), name))
+	return 0
+
+def cmd_strings(args):
+	''' count the occurrences of each java.lang.String text '''
+	with _scanned(args.path) as scan:
+		counts = _scan.strings(scan)
+	if counts is None:
+		# an unfamiliar String layout; let the object model figure it out.
+		counts = Counter()
+		with open(args.path, _progress(args.path)) as hf:
+			for heap in hf.heaps:
+				if 'java.lang.String' in heap.classes:
+					counts.update(str(s) for s in heap.exact_instances('java.lang.String'))
+			_clear_progress()
+	if args.contains is not None:
+		counts = Counter({text: n for text, n in counts.items() if args.contains in text})
+	for text, n in _limited(counts.most_common(), args.limit):
+		print('%10d  %r' % (n, text))
+	return 0
+
+def cmd_top_arrays(args):
+	''' list the largest arrays '''
+	with _scanned(args.path) as scan:
+		arrays = _scan.top_arrays(scan, args.limit)
+	print('%12s %10s %18s  %s' % ('bytes', 'length', 'id', 'class'))
+	for nbytes, length, objid, name in arrays:
+		print('%12d %10d %18s  %s' % (nbytes, length, '0x%x' % objid, name))
+	return 0
+
+def cmd_triage(args):
+	''' estimate duplicated data per class, in one pass with bounded memory '''
+	from ._sketch import triage
+	result = triage(args.path, _progress(args.path))
+	_clear_progress()
+	rows = sorted(result.items(), key=lambda item: (-item[1].wasted_bytes, item[0]))
+	print('%10s %10s %12s %12s  %s' % ('count', 'distinct', 'bytes', 'wasted', 'class'))
+	for name, t in _limited(rows, args.limit):
+		if not t.wasted_bytes:
+			break
+		print('%10d %10d %12d %12d  %s' % (t.count, t.distinct, t.nbytes, t.wasted_bytes, name))
+		for n, size, objid in t.top[:args.top]:
+			print('%10d %23s %12d    e.g. 0x%x' % (n, '', size, objid))
+	return 0
+
+def cmd_unhandled(args):
+	''' list the top-level records that hprof does not handle '''
+	for path in args.paths:
+		with _scanned(path) as scan:
+			unhandled = scan.unhandled()
+		print(path)
+		if not unhandled:
+			print('    <no unhandled records>')
+		for tag in sorted(unhandled):
+			print('    0x%02x %-20s %d' % (tag, _tag_name(_scan.TAG_NAMES, tag), unhandled[tag]))
+	return 0
+
+def cmd_serve(args):
+	''' run an analysis server that keeps parsed files in memory '''
+	from .server import Server
+	with Server(_address(args), args.memory_budget, _log) as server:
+		_log('listening on %s' % (server.address,))
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+	return 0
+
+def _add_address_args(parser):
+	parser.add_argument('--socket',
+		default=default_socket(),
+		help='unix domain socket path (default: %(default)s)')
+	parser.add_argument('--port',
+		type=int,
+		help='listen on this TCP port on localhost instead of a unix socket')
+
+def _add_command(sub, name, fn):
+	parser = sub.add_parser(name, help=fn.__doc__, description=fn.__doc__)
+	parser.set_defaults(func=fn)
+	return parser
+
+def _add_limit_arg(parser):
+	parser.add_argument('--limit',
+		type=int,
+		default=20,
+		metavar='N',
+		help='show at most N rows; 0 shows all (default: %(default)s)')
+
+def make_parser():
+	''' returns the ArgumentParser for `python -m hprof`. '''
+	parser = argparse.ArgumentParser(prog='python -m hprof',
+		description='Query Java/Android .hprof heap dumps.')
+	sub = parser.add_subparsers(dest='command', metavar='COMMAND')
+	sub.required = True
+
+	summary = _add_command(sub, 'summary', cmd_summary)
+	summary.add_argument('paths', nargs='+', metavar='FILE')
+
+	histogram = _add_command(sub, 'histogram', cmd_histogram)
+	histogram.add_argument('path', metavar='FILE')
+	histogram.add_argument('--sort',
+		choices=('count', 'bytes'),
+		default='count',
+		help='sort by instance count or data bytes (default: %(default)s)')
+	histogram.add_argument('--sample',
+		type=float,
+		metavar='FRACTION',
+		help='estimate from a random sample of about this fraction of the heap '
+		'dump, e.g. 0.01, with 95%% confidence ranges')
+	_add_limit_arg(histogram)
+
+	strings = _add_command(sub, 'strings', cmd_strings)
+	strings.add_argument('path', metavar='FILE')
+	strings.add_argument('--contains',
+		metavar='TEXT',
+		help='only show strings containing TEXT')
+	_add_limit_arg(strings)
+
+	top_arrays = _add_command(sub, 'top-arrays', cmd_top_arrays)
+	top_arrays.add_argument('path', metavar='FILE')
+	_add_limit_arg(top_arrays)
+
+	triage = _add_command(sub, 'triage', cmd_triage)
+	triage.add_argument('path', metavar='FILE')
+	triage.add_argument('--top',
+		type=int,
+		default=3,
+		metavar='N',
+		help='show the N most duplicated contents of each class (default: %(default)s)')
+	_add_limit_arg(triage)
+
+	unhandled = _add_command(sub, 'unhandled', cmd_unhandled)
+	unhandled.add_argument('paths', nargs='+', metavar='FILE')
+
+	serve = sub.add_parser('serve', help=cmd_serve.__doc__, description=cmd_serve.__doc__)
+	_add_address_args(serve)
+	serve.add_argument('--memory-budget',
+		type=parse_size,
+		metavar='SIZE',
+		help='close least recently used files when the estimated memory use '
+		'of loaded files exceeds this, e.g. 8G (default: no limit)')
+	serve.set_defaults(func=cmd_serve)
+	return parser
+
+def main(argv=None):
+	''' runs the command line interface; returns the exit status. '''
+	args = make_parser().parse_args(argv)
+	return args.func(args)
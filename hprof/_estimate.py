@@ -0,0 +1,116 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Approximate class histograms from a random sample of the heap dump, for a
+first look at files too large to read in full.
+'''
+
+import math
+import random
+
+from collections import namedtuple
+from statistics import NormalDist
+
+from . import _scan
+
+Estimate = namedtuple('Estimate', 'count count_range nbytes nbytes_range')
+Estimate.__doc__ = ''' The estimated instance count and data bytes of a class.
+The ranges are (low, high) confidence intervals; high may be infinite if the
+sample is too small to say anything about the spread. '''
+
+
+def estimate(path, fraction=0.01, progress_callback=None, confidence=0.95, seed=None):
+	''' Estimate the class histogram of an hprof file, reading only about
+	`fraction` of its heap dump.
+
+	Returns {class name: Estimate}, like `histogram()` but with confidence
+	intervals. Classes without any instances in the sample are not included.
+
+	The sample is made of whole heap dump segments, picked at random; the
+	counts in each are scaled up by the ratio of total to sampled heap dump
+	bytes. Files with fewer segments give coarser samples. A file whose heap
+	dump is a single record is read in full, and the result is exact.
+
+	`seed` makes the sample repeatable.
+	'''
+	if not 0 < fraction <= 1:
+		raise ValueError('fraction must be in (0, 1]; got %r' % fraction)
+	if not 0 < confidence < 1:
+		raise ValueError('confidence must be in (0, 1); got %r' % confidence)
+	with _scan.mapped(path, progress_callback) as mview:
+		scan = _scan.Scan(mview, progress_callback)
+		scan._progress = None # report sampling progress per segment instead
+		ranges = _sample(scan.heap_ranges, fraction, random.Random(seed))
+		samples = []
+		for ix, rng in enumerate(ranges):
+			if progress_callback:
+				progress_callback('sampling', ix, len(ranges))
+			samples.append((rng[1] - rng[0], _scan.class_histogram(scan, [rng])))
+		if progress_callback:
+			progress_callback('sampling', len(ranges), len(ranges))
+		population = [end - start for start, end in scan.heap_ranges]
+		del scan
+	z = NormalDist().inv_cdf(0.5 + confidence / 2)
+	names = set()
+	for _, hist in samples:
+		names.update(hist)
+	out = {}
+	for name in names:
+		counts = [(size, hist.get(name, (0, 0))[0]) for size, hist in samples]
+		nbytes = [(size, hist.get(name, (0, 0))[1]) for size, hist in samples]
+		count, count_range = _ratio_estimate(counts, population, z)
+		nbyte, nbytes_range = _ratio_estimate(nbytes, population, z)
+		out[name] = Estimate(count, count_range, nbyte, nbytes_range)
+	return out
+
+
+def _sample(ranges, fraction, rng):
+	''' picks random ranges until they cover `fraction` of all range bytes, and
+	at least two of them (if there are two), since `_ratio_estimate()` needs
+	two clusters to estimate the spread. '''
+	target = fraction * sum(end - start for start, end in ranges)
+	order = list(ranges)
+	rng.shuffle(order)
+	picked = []
+	covered = 0
+	for start, end in order:
+		if len(picked) >= 2 and covered >= target:
+			break
+		picked.append((start, end))
+		covered += end - start
+	return picked
+
+
+def _ratio_estimate(sample, population, z):
+	''' estimates a population total from a cluster sample.
+
+	sample is a list of (cluster size, observed value), population a list of
+	all cluster sizes. Returns (estimate, (low, high)), rounded to ints. The
+	interval comes from the usual variance approximation for ratio estimators.
+
+	>>> _ratio_estimate([(10, 5), (10, 7)], [10, 10], 1.96)
+	(12, (12, 12))
+	>>> _ratio_estimate([(10, 5), (20, 10)], [10, 20, 30, 40], 1.96)
+	(50, (50, 50))
+	>>> _ratio_estimate([(10, 5)], [10, 10], 1.96)
+	(10, (5, inf))
+	'''
+	n = len(sample)
+	npopulation = len(population)
+	x = sum(size for size, _ in sample)
+	y = sum(value for _, value in sample)
+	ratio = y / x if x else 0
+	total = ratio * sum(population)
+	if n == npopulation:
+		spread = 0
+	elif n < 2:
+		spread = math.inf
+	else:
+		residuals = sum((value - ratio * size) ** 2 for size, value in sample) / (n - 1)
+		spread = z * math.sqrt(npopulation ** 2 * (1 - n / npopulation) / n * residuals)
+	if spread == math.inf:
+		return int(round(total)), (y, math.inf)
+	low = max(y, int(round(total - spread)))
+	high = int(round(total + spread))
+	return int(round(total)), (low, high)
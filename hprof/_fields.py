@@ -0,0 +1,83 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Descriptors that give Java classes their fields, by their Java names.
+'''
+
+from .heap import JavaObject, _DeferredRef
+
+
+def instance_field(cls, name):
+	''' is name an instance field of cls or any of its superclasses? '''
+	while cls is not JavaObject:
+		if isinstance(cls.__dict__.get(name), InstanceField):
+			return True
+		cls = cls._hprof_super() or JavaObject
+	return False
+
+
+class FieldValues(object):
+	''' Reads or writes all instance fields of one class level of an object at
+	once, as a tuple: `cls._hprof_ifieldvals.__get__(obj)`. '''
+	__slots__ = ('slots',)
+
+	def __init__(self, slots):
+		self.slots = slots
+
+	def __get__(self, obj, objtype=None):
+		if obj is None:
+			return self
+		return tuple(slot.__get__(obj) for slot in self.slots)
+
+	def __set__(self, obj, vals):
+		assert len(vals) == len(self.slots), (vals, self.slots)
+		for slot, val in zip(self.slots, vals):
+			slot.__set__(obj, val)
+
+
+class InstanceField(object):
+	''' An instance field, by its Java name. The value is kept in a slot named
+	`_hprof_f<index>`, so that the slot itself is not a class attribute;
+	reading the field from the class finds the static fields instead. '''
+	__slots__ = ('slotname', 'slot', 'owner')
+
+	def __init__(self, slotname):
+		self.slotname = slotname
+		self.slot = None
+		self.owner = None
+
+	def __set_name__(self, owner, name):
+		self.slot = owner.__dict__[self.slotname]
+		self.owner = owner
+
+	def __get__(self, obj, objtype=None):
+		if obj is None:
+			raise AttributeError(self.slotname)
+		return self.slot.__get__(obj)
+
+
+class LazyRefField(InstanceField):
+	''' A reference field that is resolved the first time it is read. '''
+	__slots__ = ()
+
+	def __get__(self, obj, objtype=None):
+		if obj is None:
+			raise AttributeError(self.slotname)
+		val = self.slot.__get__(obj)
+		if type(val) is _DeferredRef: # pylint: disable=unidiomatic-typecheck
+			val = self.owner._hprof_heap._resolve(val)
+			self.slot.__set__(obj, val)
+		return val
+
+
+class StaticField(object):
+	''' A static field that hides an instance field of a superclass. '''
+	__slots__ = ('sfields', 'name')
+
+	def __init__(self, sfields, name):
+		self.sfields = sfields
+		self.name = name
+
+	def __get__(self, obj, objtype=None):
+		return self.sfields[self.name]
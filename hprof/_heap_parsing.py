@@ -6,14 +6,14 @@
 Parses the content of hprof files' heap dump records.
 '''
 
+from collections import defaultdict
+
+from . import _spill
 from . import heap as hprof_heap
 from ._parsing import jtype
-from .error import FormatError, MissingObject, UnexpectedEof
+from .error import FormatError, UnexpectedEof
 
-class DeferredRef(int):
-	''' Used to seperate int values from ref values that should be resolved when
-	the heap is complete. Not expected to be used by outsiders. '''
-	__slots__ = ()
+DeferredRef = hprof_heap._DeferredRef
 
 RECORD_PARSERS = {}
 
@@ -91,12 +91,13 @@ def parse_class(hf, heap, reader):
 	def create(objid, cname, supercls, staticattrs, iattr_names, iattr_types):
 		''' Creates a class instance. There may be deferred classes waiting for
 		this one; create those too. '''
-		clsname, cls = hprof_heap._create_class(heap.classtree, cname, supercls, staticattrs, iattr_names, iattr_types)
+		clsname, cls = hprof_heap._create_class(heap._classnames, cname, supercls, staticattrs, iattr_names, iattr_types, heap._lazy)
 		heap._instances[cls] = []
 		if clsname not in heap.classes:
 			heap.classes[clsname] = []
 		heap.classes[clsname].append(cls)
 		heap[objid] = cls
+		heap._numbering = None
 		if objid in heap._deferred_classes:
 			deferred = heap._deferred_classes.pop(objid)
 			for objid, cname, staticattrs, iattr_names, iattr_types in deferred:
@@ -107,100 +108,306 @@ RECORD_PARSERS[0x20] = parse_class
 
 def parse_instance(hf, heap, reader):
 	''' Reads in one object instance, adds it to the queue. '''
-	del hf # unused
 	objid = reader.id()
-	strace = reader.u4()
+	_      = reader.u4() # stacktrace serial
 	clsid = reader.id()
 	remaining = reader.u4()
-	raw_attrs = reader.bytes(remaining)
-	heap._deferred_objects.append((objid, strace, clsid, raw_attrs))
+	if _filtered_out(hf, heap, clsid):
+		reader.skip(remaining)
+		return
+	heap._deferred_objects.append((objid, clsid, reader._base + reader._pos, remaining))
+	reader.skip(remaining)
 RECORD_PARSERS[0x21] = parse_instance
 
+def use_compact_queues(heap, data, idsize, budget):
+	''' Makes the heap queue records as packed ids and offsets into data (the
+	whole file), rather than as tuples holding slices of it, and keep at most
+	about `budget` bytes of them in memory (no limit if None). Object arrays
+	will also look up their elements on access. '''
+	heap._data = data
+	heap._idsize = idsize
+	if budget is not None:
+		budget = max(budget // 4, 1 << 16)
+	heap._deferred_objects = _spill.SpillArray('=QQQI', budget) # objid, clsid, offset, length
+	heap._deferred_objarrays = _spill.SpillArray('=QQQI', budget) # objid, clsid, offset, count
+	heap._deferred_primarrays = _spill.SpillArray('=QBQI', budget) # objid, type, offset, count
+
+def _expanded_objects(heap, records=None):
+	''' iterates over the object queue (or some records from it), as
+	(objid, None, clsid, instance data). '''
+	if records is None:
+		records = heap._deferred_objects
+	data = heap._data
+	return (
+		(objid, None, clsid, data[offset:offset+length])
+		for objid, clsid, offset, length in records
+	)
+
+def _create_queued(heap, queue, create, progress):
+	''' Creates the objects for the records in queue, by calling
+	create(records, objects, instances, progress), which adds each object to
+	the objects dict and the instances lists by class.
+
+	When heap._threads is more than one, each thread creates the objects of
+	some of the records, into dicts of its own; they are added to the heap in
+	queue order, so the heap ends up the same either way. '''
+	threads = heap._threads
+	if threads <= 1 or len(queue) < 2:
+		create(queue, heap, heap._instances, progress)
+		return
+	from . import _parallel
+	ranges = list(_parallel.chunks(len(queue), 4 * threads))
+	def work(rng):
+		objects = {}
+		instances = defaultdict(list)
+		create(queue.iter_range(*rng), objects, instances, _no_progress)
+		return objects, instances
+	for (start, _), (objects, instances) in zip(ranges, _parallel.map_ordered(threads, work, ranges)):
+		progress(start)
+		heap.update(objects)
+		for cls, objs in instances.items():
+			heap._instances[cls].extend(objs)
+
+def _no_progress(n):
+	del n # unused
+
 def create_instances(heap, idsize, progress):
 	''' Creates all the queued object instances, adds them to the heap. '''
 	from ._parsing import PrimitiveReader
-	until_report = 0
-	for ix, (objid, _, clsid, raw_attrs) in enumerate(heap._deferred_objects):
-		if until_report == 0:
-			until_report = 4096
-			progress(ix)
-		until_report -= 1
-		reader = PrimitiveReader(raw_attrs, idsize)
-		exactcls = cls = heap[clsid]
-		obj = cls(objid)
-		while cls is not hprof_heap.JavaObject:
-			vals = tuple(
-					atype.read(reader)
-					for ix, atype
-					in enumerate(cls._hprof_ifieldtypes)
-			)
-			assert len(vals) == len(cls._hprof_ifieldix), (len(vals), len(cls._hprof_ifieldix))
-			cls._hprof_ifieldvals.__set__(obj, vals)
-			cls, = cls.__bases__
-		assert reader._pos == len(raw_attrs), (reader._pos, len(raw_attrs))
-		heap._instances[exactcls].append(obj)
-		heap[objid] = obj
+	if heap._include is not None and heap._include_depth and heap._keep is None:
+		select_included(heap, idsize)
+	keep = heap._keep
+	lazy = heap._lazy
+	if lazy:
+		for classes in heap.classes.values():
+			for cls in classes:
+				cls._hprof_heap = heap # where to resolve references
+
+	def create(records, objects, instances, progress):
+		''' creates the objects of some queued records. '''
+		until_report = 0
+		layouts = {}
+		for ix, (objid, _, clsid, raw_attrs) in enumerate(_expanded_objects(heap, records)):
+			if until_report == 0:
+				until_report = 4096
+				progress(ix)
+			until_report -= 1
+			if keep is not None and objid not in keep:
+				continue
+			reader = PrimitiveReader(raw_attrs, idsize)
+			exactcls = heap[clsid]
+			obj = exactcls(objid)
+			try:
+				fields = layouts[exactcls]
+			except KeyError:
+				fields = layouts[exactcls] = _field_layout(exactcls)
+			if lazy:
+				for slot, atype in fields:
+					slot.__set__(obj, _deferred(reader.id()) if atype is jtype.object else atype.read(reader))
+			else:
+				for slot, atype in fields:
+					slot.__set__(obj, atype.read(reader))
+			assert reader._pos == len(raw_attrs), (reader._pos, len(raw_attrs))
+			instances[exactcls].append(obj)
+			objects[objid] = obj
+
+	_create_queued(heap, heap._deferred_objects, create, progress)
 	heap._deferred_objects.clear()
 
+def _field_layout(cls):
+	''' the (slot, type) of each instance field of cls, in dump order. '''
+	out = []
+	while cls is not hprof_heap.JavaObject:
+		assert len(cls._hprof_ifieldslots) == len(cls._hprof_ifieldtypes)
+		out.extend(zip(cls._hprof_ifieldslots, cls._hprof_ifieldtypes))
+		cls, = cls.__bases__
+	return tuple(out)
+
+def _deferred(addr):
+	''' a reference field value that is resolved when it is accessed. '''
+	return DeferredRef(addr) if addr else None
+
 def parse_object_array(hf, heap, reader):
 	''' Reads in one object array, adds it to the queue. '''
-	del hf # unused
-	objid = reader.id()
-	strace = reader.u4()
+	objid  = reader.id()
+	_      = reader.u4() # stacktrace serial
 	length = reader.u4()
-	clsid = reader.id()
-	elems = tuple(reader.id() for ix in range(length))
-	heap._deferred_objarrays.append((objid, strace, clsid, elems))
+	clsid  = reader.id()
+	if _filtered_out(hf, heap, clsid):
+		reader.skip(length * reader._idsize)
+		return
+	heap._deferred_objarrays.append((objid, clsid, reader._base + reader._pos, length))
+	reader.skip(length * reader._idsize)
 RECORD_PARSERS[0x22] = parse_object_array
 
 def create_objarrays(heap, progress):
 	''' Creates all the queued object arrays, adds them to the heap. '''
-	until_report = 0
-	for ix, (objid, _, clsid, elems) in enumerate(heap._deferred_objarrays):
-		if until_report == 0:
-			until_report = 4096
-			progress(ix)
-		until_report -= 1
-		cls = heap[clsid]
-		arr = cls(objid, elems)
-		heap._instances[cls].append(arr)
-		heap[objid] = arr
+	keep = heap._keep
+
+	def create(records, objects, instances, progress):
+		''' creates the arrays of some queued records. '''
+		until_report = 0
+		records = (
+			(objid, clsid, hprof_heap._ObjectArrayData(heap, offset, length))
+			for objid, clsid, offset, length in records
+		)
+		for ix, (objid, clsid, elems) in enumerate(records):
+			if until_report == 0:
+				until_report = 4096
+				progress(ix)
+			until_report -= 1
+			if keep is not None and objid not in keep:
+				continue
+			cls = heap[clsid]
+			arr = cls(objid, elems)
+			instances[cls].append(arr)
+			objects[objid] = arr
+
+	_create_queued(heap, heap._deferred_objarrays, create, progress)
 	heap._deferred_objarrays.clear()
 
 def parse_primitive_array(hf, heap, reader):
 	''' Reads in one primitive array, adds it to the queue. '''
-	del hf # unused
 	objid  = reader.id()
-	strace = reader.u4()
+	_      = reader.u4() # stacktrace serial
 	length = reader.u4()
 	t = reader.jtype()
-	data = reader.bytes(length * t.size)
-	data = hprof_heap._DeferredArrayData(t, data)
-	heap._deferred_primarrays.append((objid, strace, data))
+	if _filtered_out(hf, heap, t):
+		reader.skip(length * t.size)
+		return
+	heap._deferred_primarrays.append((objid, t.value, reader._base + reader._pos, length))
+	reader.skip(length * t.size)
 RECORD_PARSERS[0x23] = parse_primitive_array
 
 def create_primarrays(heap, progress):
 	''' Creates all the queued primitive arrays, adds them to the heap. '''
-	until_report = 0
-	for ix, (objid, _, data) in enumerate(heap._deferred_primarrays):
-		if until_report == 0:
-			until_report = 4096
-			progress(ix)
-		until_report -= 1
-		t = data.jtype
-		clsname = t.name + '[]'
-		assert clsname in heap.classes, 'class %s not found' % clsname
-		classes = heap.classes[clsname]
-		assert len(classes) == 1, 'there are %d classes named %s' % (len(classes), clsname)
-		cls, = classes
-		# TODO: speed: the class lookup could be done once per array type
-		arr = cls(objid, data)
-		heap._instances[cls].append(arr)
-		heap[objid] = arr
+	keep = heap._keep
+
+	def create(records, objects, instances, progress):
+		''' creates the arrays of some queued records. '''
+		until_report = 0
+		filedata = heap._data
+		records = (
+			(objid, hprof_heap._DeferredArrayData(jtype(t), filedata[offset:offset+length*jtype(t).size]))
+			for objid, t, offset, length in records
+		)
+		for ix, (objid, data) in enumerate(records):
+			if until_report == 0:
+				until_report = 4096
+				progress(ix)
+			until_report -= 1
+			if keep is not None and objid not in keep:
+				continue
+			t = data.jtype
+			clsname = t.name + '[]'
+			assert clsname in heap.classes, 'class %s not found' % clsname
+			classes = heap.classes[clsname]
+			assert len(classes) == 1, 'there are %d classes named %s' % (len(classes), clsname)
+			cls, = classes
+			# TODO: speed: the class lookup could be done once per array type
+			arr = cls(objid, data)
+			instances[cls].append(arr)
+			objects[objid] = arr
+
+	_create_queued(heap, heap._deferred_primarrays, create, progress)
 	heap._deferred_primarrays.clear()
 
-def parse_heap(hf, heap, reader, progresscb):
+def _class_included(heap, clsid, hf=None):
+	''' does the include filter match the class with id clsid? Primitive
+	array classes are given by their element jtype instead. The class name
+	comes from hf's class loads, or from the heap when all classes are known. '''
+	try:
+		return heap._included_classes[clsid]
+	except KeyError:
+		pass
+	if isinstance(clsid, jtype):
+		name = clsid.name + '[]'
+	elif hf is None:
+		cls = heap.get(clsid)
+		name = None if cls is None else str(cls)
+	else:
+		load = hf.classloads_by_id.get(clsid)
+		name = None if load is None else hprof_heap._class_name(load.class_name)
+	included = name is not None and heap._include(name) is not None
+	heap._included_classes[clsid] = included
+	return included
+
+def _filtered_out(hf, heap, clsid):
+	''' should instances of clsid be skipped already while parsing? Only if
+	nothing else may need them, i.e. when there is an include filter without
+	a reference depth. '''
+	if heap._include is None or heap._include_depth:
+		return False
+	return not _class_included(heap, clsid, hf)
+
+def select_included(heap, idsize):
+	''' Works out which queued objects to create, when there is an include
+	filter with a reference depth: those of included classes, and those that
+	can be reached from them by following at most depth references. '''
+	keep = set()
+	for objid, _, clsid, _ in _expanded_objects(heap):
+		if _class_included(heap, clsid):
+			keep.add(objid)
+	for objid, clsid, _ in _objarray_elements(heap, idsize):
+		if _class_included(heap, clsid):
+			keep.add(objid)
+	for objid, t in _primarray_types(heap):
+		if _class_included(heap, t):
+			keep.add(objid)
+
+	offsets = {} # class id -> offsets of its object fields in instance data
+	frontier = keep
+	for _ in range(heap._include_depth):
+		found = set()
+		for objid, _, clsid, raw_attrs in _expanded_objects(heap):
+			if objid not in frontier:
+				continue
+			if clsid not in offsets:
+				offsets[clsid] = _object_field_offsets(heap[clsid], idsize)
+			for pos in offsets[clsid]:
+				found.add(int.from_bytes(raw_attrs[pos:pos+idsize], 'big'))
+		for objid, _, elems in _objarray_elements(heap, idsize):
+			if objid in frontier:
+				found.update(elems)
+		found.discard(0)
+		frontier = found - keep
+		if not frontier:
+			break
+		keep |= frontier
+	heap._keep = keep
+
+def _object_field_offsets(cls, idsize):
+	''' the offsets of object references in the instance data of cls. '''
+	out = []
+	pos = 0
+	while cls is not hprof_heap.JavaObject:
+		for atype in cls._hprof_ifieldtypes:
+			if atype is jtype.object:
+				out.append(pos)
+				pos += idsize
+			else:
+				pos += atype.size
+		cls, = cls.__bases__
+	return out
+
+def _objarray_elements(heap, idsize):
+	''' yields (objid, clsid, element ids) for each queued object array. '''
+	data = heap._data
+	for objid, clsid, offset, length in heap._deferred_objarrays:
+		yield objid, clsid, (
+			int.from_bytes(data[pos:pos+idsize], 'big')
+			for pos in range(offset, offset + length * idsize, idsize)
+		)
+
+def _primarray_types(heap):
+	''' yields (objid, jtype) for each queued primitive array. '''
+	for objid, t, _, _ in heap._deferred_primarrays:
+		yield objid, jtype(t)
+
+def parse_heap(hf, heap, reader, progresscb, parsers=None):
 	''' parse a heap dump or heap dump segment '''
+	if parsers is None:
+		parsers = RECORD_PARSERS
 	lastreport = 0
 	while True:
 		try:
@@ -211,38 +418,104 @@ def parse_heap(hf, heap, reader, progresscb):
 			lastreport = reader._pos
 			progresscb(lastreport)
 		try:
-			parser = RECORD_PARSERS[rtype]
+			parser = parsers[rtype]
 		except KeyError as e:
 			# impossible to handle; we don't know how long this record type is.
 			raise FormatError('unrecognized heap record type 0x%x' % rtype) from e
-		parser(hf, heap, reader)
+		if rtype == 0x20 and heap._class_records is not None:
+			start = reader._base + reader._pos
+			parser(hf, heap, reader)
+			heap._class_records.append((start, reader._base + reader._pos))
+		else:
+			parser(hf, heap, reader)
+
+def skip_class(hf, heap, reader):
+	''' Skips over one class dump, which is parsed later; see parse_segments(). '''
+	del hf, heap # unused
+	reader.skip(7 * reader._idsize + 8) # ids, stacktrace serial and object size
+	for _ in range(reader.u2()): # constant pool
+		reader.u2()
+		reader.jtype().read(reader)
+	for _ in range(reader.u2()): # static fields
+		reader.id()
+		reader.jtype().read(reader)
+	reader.skip(reader.u2() * (reader._idsize + 1)) # instance fields
+
+_SCAN_PARSERS = dict(RECORD_PARSERS)
+_SCAN_PARSERS[0x20] = skip_class
+
+def parse_segments(hf, heap):
+	''' Parses the heap dump segments listed in heap._segments, on hf._threads
+	threads.
+
+	Each thread queues the instances and arrays of a segment in a heap of its
+	own, and only notes where the class dumps are. Then the classes are
+	created, and the queues appended to heap's, in file order -- so the heap
+	ends up the same as if the segments had been parsed one by one. Each part
+	is merged as soon as it and those before it are done, and only a few
+	segments are parsed ahead, so the parts never hold much of the heap.
+	'''
+	from ._parsing import PrimitiveReader, _new_heap
+	data = hf._data
+	idsize = heap._idsize
+
+	def scan(segment):
+		offset, length = segment
+		part = _new_heap(hf, idsize)
+		part._class_records = []
+		reader = PrimitiveReader(data[offset:offset+length], idsize, offset)
+		parse_heap(hf, part, reader, None, _SCAN_PARSERS)
+		return part
+
+	from . import _parallel
+	segments, heap._segments = heap._segments, []
+	for part in _parallel.map_ordered(hf._threads, scan, segments):
+		for start, end in part._class_records:
+			reader = PrimitiveReader(data[start:end], idsize, start)
+			parse_class(hf, heap, reader)
+			if heap._class_records is not None:
+				heap._class_records.append((start, end))
+		for queue in ('_deferred_objects', '_deferred_objarrays', '_deferred_primarrays'):
+			getattr(heap, queue).extend(getattr(part, queue))
+			getattr(part, queue).clear()
 
 def resolve_heap_references(heap, progresscb):
 	''' Concretize all heap references from addresses to actual object refs. '''
-	def lookup(addr):
-		''' return the object at addr, or None if addr is 0. '''
-		if not addr:
-			return None
-		try:
-			return heap[addr]
-		except KeyError as e:
-			raise MissingObject(hex(addr)) from e
-
-	lastreport = 0
 	if progresscb:
 		progresscb(0)
-	for progress, obj in enumerate(heap.values()):
+	threads = heap._threads
+	if threads > 1 and len(heap) > 1:
+		# each object is only changed by the thread that resolves it
+		from . import _parallel
+		objects = list(heap.values())
+		ranges = list(_parallel.chunks(len(objects), 4 * threads))
+		def work(rng):
+			start, stop = rng
+			_resolve_objects(heap, objects[start:stop], None)
+		for (start, _), _ in zip(ranges, _parallel.map_ordered(threads, work, ranges)):
+			if progresscb:
+				progresscb(start)
+	else:
+		_resolve_objects(heap, heap.values(), progresscb)
+	if progresscb:
+		progresscb(len(heap))
+
+def _resolve_objects(heap, objects, progresscb):
+	''' resolves the references held by each of objects. '''
+	lookup = heap._resolve
+	lastreport = 0
+	kinds = {} # type -> _CLASS, _ARRAY or _OBJECT
+	for progress, obj in enumerate(objects):
 		if progresscb and progress - lastreport >= 10000:
 			progresscb(progress)
 			lastreport = progress
 		cls = type(obj)
-		if isinstance(obj, hprof_heap.JavaArray):
-			# it's an array; is it an *object* array?
-			old = obj._hprof_array_data
-			# TODO: this check is probably a bit too fragile
-			if not isinstance(old, hprof_heap._DeferredArrayData):
-				obj._hprof_array_data = tuple(lookup(addr) for addr in old)
-		elif isinstance(obj, hprof_heap.JavaClass):
+		kind = kinds.get(cls)
+		if kind is None:
+			kind = kinds[cls] = _kind(cls)
+		if kind is _ARRAY:
+			continue # object array elements are looked up when they are read
+		if kind is _CLASS:
 			for name, val in obj._hprof_sfields.items():
 				if isinstance(val, DeferredRef):
 					obj._hprof_sfields[name] = lookup(val)
@@ -257,5 +530,15 @@ def resolve_heap_references(heap, progresscb):
 				)
 				cls._hprof_ifieldvals.__set__(obj, new)
 				cls, = cls.__bases__
-	if progresscb:
-		progresscb(len(heap))
+
+_CLASS = 'class'
+_ARRAY = 'array'
+_OBJECT = 'object'
+
+def _kind(objtype):
+	''' what kind of heap object are instances of objtype? '''
+	if issubclass(objtype, hprof_heap.JavaClass):
+		return _CLASS
+	if issubclass(objtype, hprof_heap.JavaArray):
+		return _ARRAY
+	return _OBJECT
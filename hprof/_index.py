@@ -0,0 +1,185 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Tables over all the objects of a loaded heap: class numbers, dense object
+indexes and the reference graph. They are built on first use; see `Heap`.
+'''
+
+import itertools
+
+from array import array
+from bisect import bisect_left
+
+from ._parsing import jtype
+from .heap import Excluded, JavaArray, JavaClass, JavaObject, _DeferredRef, _ObjectArrayData
+
+
+class ClassNumbering(object):
+	''' Numbers the classes of a heap in the pre-order of its class hierarchy.
+
+	Each class gets its number as `_hprof_pre`, and the highest number within
+	its subtree as `_hprof_last`. A class is then a subclass of another if and
+	only if its number is within the other's range.
+
+	Numbers are unique across all numberings, so that classes from different
+	heaps are never mistaken for subclasses of each other.
+	'''
+
+	__slots__ = ('base', 'preorder', 'classix', 'objix', 'counts', 'counted')
+
+	_bases = itertools.count(0, 1 << 32)
+
+	def __init__(self, classes):
+		self.base = base = next(ClassNumbering._bases)
+		allclasses = [cls for lst in classes.values() for cls in lst]
+		known = set(allclasses)
+		roots = []
+		children = {}
+		for cls in allclasses:
+			supercls = cls._hprof_super()
+			if supercls in known:
+				children.setdefault(supercls, []).append(cls)
+			else:
+				roots.append(cls)
+
+		self.preorder = preorder = []
+		stack = roots[::-1]
+		while stack:
+			cls = stack.pop()
+			preorder.append(cls)
+			stack.extend(children.get(cls, ())[::-1])
+
+		sizes = {}
+		for ix in range(len(preorder)-1, -1, -1):
+			cls = preorder[ix]
+			size = 1 + sum(sizes[child] for child in children.get(cls, ()))
+			sizes[cls] = size
+			type.__setattr__(cls, '_hprof_pre', base + ix)
+			type.__setattr__(cls, '_hprof_last', base + ix + size - 1)
+
+		# the index (+1) that classes themselves have in instance masks.
+		self.classix = 0
+		for cls in classes.get('java.lang.Class', ()):
+			self.classix = cls._hprof_pre - base + 1
+			break
+		self.objix = None
+		self.counts = None
+		self.counted = None
+
+	def range_of(self, cls):
+		''' returns the (local) numbers of cls and of the last class in its
+		subtree. Raises ValueError if cls was not numbered by this numbering. '''
+		first = -1 if cls._hprof_pre is None else cls._hprof_pre - self.base
+		if not 0 <= first < len(self.preorder) or self.preorder[first] is not cls:
+			raise ValueError('%r is not a class in this heap' % cls)
+		return first, cls._hprof_last - self.base
+
+	def count_instances(self, instance_lists):
+		''' (re)computes the running totals of instance counts, in preorder.
+
+		counts[i] is the number of exact instances of the first i classes, so
+		a subtree's instance count is the difference of two entries.
+		'''
+		counts = array('Q', (0,))
+		total = 0
+		for cls in self.preorder:
+			total += sum(len(lst) for lst in instance_lists(cls))
+			counts.append(total)
+		self.counts = counts
+		return counts
+
+	def object_indexes(self, objects):
+		''' returns an array with the (+1) class index of each object. '''
+		base = self.base - 1
+		nclasses = len(self.preorder)
+		classix = self.classix
+		out = array('l')
+		for obj in objects:
+			if isinstance(obj, JavaClass):
+				out.append(classix)
+				continue
+			pre = type(obj)._hprof_pre
+			ix = 0 if pre is None else pre - base
+			out.append(ix if 0 < ix <= nclasses else 0) # 0 for classes of other heaps
+		return out
+
+
+class DenseIndex(object):
+	''' Maps the objects of a heap to dense indexes, 0 to N-1, in id order.
+
+	The ids are kept in a sorted array, and looked up by binary search.
+	'''
+
+	__slots__ = ('ids', 'objects', 'classids')
+
+	def __init__(self, heap):
+		self.ids = ids = array('Q', sorted(heap.keys()))
+		self.objects = [heap[objid] for objid in ids]
+		# classes don't know their own ids
+		self.classids = {
+			obj: objid for objid, obj in zip(ids, self.objects)
+			if isinstance(obj, JavaClass)
+		}
+
+	def lookup(self, objid):
+		''' returns the dense index of objid, or None if it is not in the heap. '''
+		ids = self.ids
+		ix = bisect_left(ids, objid)
+		if ix < len(ids) and ids[ix] == objid:
+			return ix
+		return None
+
+	def id_of(self, obj):
+		''' returns the id of an object or class, or None if it has none. '''
+		if isinstance(obj, JavaClass):
+			return self.classids.get(obj)
+		if isinstance(obj, JavaObject):
+			return JavaObject._hprof_id.__get__(obj)
+		return None
+
+
+def reference_graph(index):
+	''' builds the arrays of `Heap.reference_graph()`, for the objects of a
+	DenseIndex. '''
+	lookup = index.lookup
+	id_of = index.id_of
+	offsets = array('Q', (0,))
+	targets = array('I' if len(index.ids) <= 0xffffffff else 'Q')
+	kinds = {} # type -> JavaClass, JavaArray or JavaObject
+
+	def add(val):
+		if val is None or type(val) is Excluded: # pylint: disable=unidiomatic-typecheck
+			return
+		objid = int(val) if type(val) is _DeferredRef else id_of(val) # pylint: disable=unidiomatic-typecheck
+		if objid is not None:
+			ix = lookup(objid)
+			if ix is not None:
+				targets.append(ix)
+
+	for obj in index.objects:
+		t = type(obj)
+		kind = kinds.get(t)
+		if kind is None:
+			kind = kinds[t] = (JavaClass if issubclass(t, JavaClass)
+					else JavaArray if issubclass(t, JavaArray) else JavaObject)
+		if kind is JavaClass:
+			for val in obj._hprof_sfields.values():
+				if isinstance(val, (JavaObject, JavaClass)):
+					add(val)
+		elif kind is JavaArray:
+			data = obj._hprof_array_data
+			if isinstance(data, _ObjectArrayData):
+				for objid in data.ids():
+					ix = lookup(objid)
+					if ix is not None:
+						targets.append(ix)
+		else:
+			while t is not JavaObject:
+				vals = t._hprof_ifieldvals.__get__(obj)
+				for val, vtype in zip(vals, t._hprof_ifieldtypes):
+					if vtype is jtype.object:
+						add(val)
+				t, = t.__bases__
+		offsets.append(len(targets))
+	return offsets, targets
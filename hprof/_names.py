@@ -0,0 +1,112 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+The name table of an hprof file, decoded on demand.
+'''
+
+import threading
+
+from collections.abc import MutableMapping
+
+from .error import FormatError
+
+
+class NameTable(MutableMapping):
+	''' Maps name ids to strings, like a dict.
+
+	Names added with `add()` are kept as offsets into the file data, and only
+	decoded the first time they are looked up; most names in a heap dump never
+	are. Decoded names are cached. Names can also be stored directly, as in
+	any dict.
+
+	Names may be looked up from several threads at once; each is decoded
+	once, under a lock, and read without one after that.
+
+	>>> names = NameTable()
+	>>> names.add(0x10, b'xxHello!', 2, 5)
+	>>> names[0x10]
+	'Hello'
+	>>> len(names), 0x10 in names, 0x11 in names
+	(2, True, False)
+	'''
+
+	def __init__(self):
+		self._data = None
+		self._decoded = {0: None} # name id -> str
+		self._pending = {} # name id -> offset << 32 | length
+		self._lock = threading.Lock()
+
+	def add(self, nameid, data, offset, length):
+		''' adds the name of `length` bytes at `offset` in data, which must be
+		the same for all names added. '''
+		self._data = data
+		self._pending[nameid] = offset << 32 | length
+
+	def attach(self, data):
+		''' sets the data that names restored from a pickle refer into. '''
+		self._data = data
+
+	def detach(self):
+		''' drops the data, and any names that were never decoded. '''
+		self._data = None
+		self._pending.clear()
+
+	def __getitem__(self, nameid):
+		try:
+			return self._decoded[nameid]
+		except KeyError:
+			pass
+		with self._lock:
+			if nameid in self._decoded:
+				return self._decoded[nameid] # another thread got here first
+			loc = self._pending[nameid] # KeyError if not there at all
+			offset = loc >> 32
+			raw = self._data[offset:offset + (loc & 0xffffffff)]
+			try:
+				name = str(raw, 'ascii')
+			except UnicodeDecodeError:
+				try:
+					name = str(raw, 'utf8', 'hprof-mutf8')
+				except UnicodeError as e:
+					raise FormatError('bad name 0x%x' % nameid) from e
+			# added before it is removed, so __contains__ needs no lock
+			self._decoded[nameid] = name
+			del self._pending[nameid]
+		return name
+
+	def __setitem__(self, nameid, name):
+		with self._lock:
+			self._decoded[nameid] = name
+			self._pending.pop(nameid, None)
+
+	def __delitem__(self, nameid):
+		with self._lock:
+			if nameid in self._pending:
+				del self._pending[nameid]
+			else:
+				del self._decoded[nameid]
+
+	def __contains__(self, nameid):
+		return nameid in self._pending or nameid in self._decoded
+
+	def __iter__(self):
+		# a snapshot, since looking names up moves them between the dicts
+		with self._lock:
+			return iter(list(self._decoded) + list(self._pending))
+
+	def __len__(self):
+		with self._lock:
+			return len(self._decoded) + len(self._pending)
+
+	def __repr__(self):
+		return '<NameTable of %d names, %d decoded>' % (len(self), len(self._decoded))
+
+	def __getstate__(self):
+		return {'decoded': self._decoded, 'pending': self._pending}
+
+	def __setstate__(self, state):
+		self._data = None
+		self._lock = threading.Lock()
+		self._decoded = state['decoded']
+		self._pending = state['pending']
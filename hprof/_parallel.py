@@ -0,0 +1,63 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Helpers for parsing with several threads, on Python builds without the GIL.
+
+With the GIL, threads would only take turns parsing, so everything is done
+on the calling thread instead.
+'''
+
+import os
+import sys
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def thread_count():
+	''' how many threads to parse with: one per CPU if the GIL is disabled,
+	otherwise one.
+
+	>>> import sys
+	>>> thread_count() == 1 or not sys._is_gil_enabled()
+	True
+	'''
+	is_gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True) # always, before 3.13
+	if is_gil_enabled():
+		return 1
+	return os.cpu_count() or 1
+
+def chunks(n, count):
+	''' splits range(n) into at most count (start, stop) pairs of about the
+	same size.
+
+	>>> list(chunks(10, 3))
+	[(0, 4), (4, 8), (8, 10)]
+	'''
+	size = max(1, -(-n // count))
+	for start in range(0, n, size):
+		yield start, min(start + size, n)
+
+def map_ordered(threads, fn, items):
+	''' like map(fn, items), but on up to `threads` threads. Results are
+	yielded in the order of items.
+
+	At most 2 * threads items are started ahead of the one being waited for,
+	so results that are large, and dropped once used, do not pile up.
+
+	>>> list(map_ordered(2, abs, range(-5, 0)))
+	[5, 4, 3, 2, 1]
+	'''
+	pending = deque()
+	with ThreadPoolExecutor(threads) as pool:
+		try:
+			for item in items:
+				if len(pending) >= 2 * threads:
+					yield pending.popleft().result()
+				pending.append(pool.submit(fn, item))
+			while pending:
+				yield pending.popleft().result()
+		finally:
+			for future in pending:
+				future.cancel()
@@ -9,14 +9,19 @@ Parses hprof files' main record stream.
 import struct
 import codecs
 import gc
+import sys
 
-from contextlib import contextmanager
+from array import array
+
+from contextlib import contextmanager, ExitStack
 from enum import Enum
 
-from .error import FormatError, HprofError, UnexpectedEof, UnhandledError
+from .error import Cancelled, FormatError, HprofError, UnexpectedEof, UnhandledError
 from .heap import Heap
 from . import callstack
+from . import _parallel
 from . import _special_cases
+from ._names import NameTable
 
 class HprofFile(object):
 	''' Your hprof file. Must stay open as long as you have references to any
@@ -26,7 +31,7 @@ class HprofFile(object):
 	def __init__(self):
 		self._context = None
 		self.unhandled = {} # record tag -> count
-		self.names = {0: None}
+		self.names = NameTable() # name id -> str
 		self.stackframes = {}
 		self.threads = {0: None}
 		self.stacktraces = {}
@@ -34,6 +39,14 @@ class HprofFile(object):
 		self.classloads_by_id = {}
 		self.heaps = []
 		self._pending_heap = None
+		self._memory_budget = None
+		self._checkpoint = None # state file path
+		self._resume = False
+		self._include = None # compiled include filter
+		self._include_depth = 0
+		self._lazy_references = False
+		self._threads = 1 # parser threads; more only without the GIL
+		self._data = None # the whole file, when heaps refer to it by offset
 
 	def __enter__(self):
 		return self
@@ -44,6 +57,8 @@ class HprofFile(object):
 			self._context = None
 			# drop the heaps and force a GC to eliminate refs into file mappings
 			self.heaps = None
+			self._data = None
+			self.names.detach()
 			gc.collect()
 			return ctx.__exit__(exc_type, exc_val, tb)
 
@@ -77,7 +92,8 @@ class ClassLoad(object):
 		    and self.stacktrace == other.stacktrace)
 
 
-def open(path, progress_callback=None): # pylint: disable=redefined-builtin
+def open(path, progress_callback=None, memory_budget=None, checkpoint=None, resume=False, # pylint: disable=redefined-builtin
+		include=None, include_depth=0, lazy_references=False):
 	''' Open an hprof file.
 
 	Accepts .bz2, .gz, and .xz compressed hprof files for your convenience.
@@ -86,8 +102,50 @@ def open(path, progress_callback=None): # pylint: disable=redefined-builtin
 	parameters: (label, done, total). `label` is a string describing the current
 	action. `done` and `total` are ints describing the progress of that action.
 	`done` and `total` may be `None`.
+
+	While parsing, each heap dump record is kept as a few dozen bytes of ids and
+	file offsets, until all classes are known and the objects can be created.
+	Object array elements and unaccessed primitive array contents stay in the
+	(mapped) file, and are read when accessed.
+
+	memory_budget, if supplied, is the number of bytes that may be used for
+	those intermediate records; anything beyond that is moved to memory-mapped
+	temporary files. The heap objects themselves are still kept in memory.
+
+	checkpoint, if supplied, makes the parser save its progress to a state file
+	every few percent of the file, and once more before instantiating objects.
+	It may be a file name, or True for `path` + '.checkpoint'. With resume=True,
+	parsing continues from the state in that file, if there is one and it was
+	saved while parsing the same data; otherwise it starts from the beginning.
+	The state file is removed when the file has been opened successfully.
+
+	include, if supplied, is a list of class name patterns, like
+	['com.example.*', 'java.util.HashMap']; `*` and `?` work as in file names.
+	All classes are loaded, but only instances and arrays of matching classes
+	are created. If include_depth is above zero, so are the objects that can
+	be reached from those by following at most that many references. Records
+	of other objects are skipped without being decoded. References to objects
+	that were not loaded are `hprof.heap.Excluded` values.
+
+	lazy_references=True skips resolving the reference fields of every object
+	after loading. Instead, each object's reference fields are looked up when
+	one of them is first accessed. This makes opening faster when only a few
+	objects will be inspected; a reference to a missing object is then only
+	reported when it is accessed.
+
+	On Python builds with the GIL disabled, heap dump segments are parsed, and
+	objects created and resolved, on one thread per CPU. The resulting heap is
+	the same as when parsing on one thread. Not with checkpoint, though, since
+	checkpoints are saved between segments.
 	'''
+	if checkpoint is True or (resume and checkpoint is None):
+		checkpoint = path + '.checkpoint'
 	hf = HprofFile()
+	hf._memory_budget = memory_budget
+	_set_include(hf, include, include_depth)
+	hf._lazy_references = lazy_references
+	hf._checkpoint = checkpoint or None
+	hf._resume = resume
 	hf._context = _open_cm(hf, path, progress_callback)
 	hf._context.__enter__()
 	return hf
@@ -96,49 +154,72 @@ def open(path, progress_callback=None): # pylint: disable=redefined-builtin
 def _open_cm(hf, path, progress_callback):
 	if progress_callback:
 		progress_callback('opening', None, None)
+	with _open_file(path) as f:
+		with _parse_cm(hf, f, progress_callback):
+			yield hf
+
+def _open_file(path):
+	''' opens path for binary reading, decompressing it if necessary. '''
 	if path.endswith('.bz2'):
 		import bz2
-		with bz2.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
-				yield hf
-	elif path.endswith('.gz'):
+		return bz2.open(path, 'rb')
+	if path.endswith('.gz'):
 		import gzip
-		with gzip.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
-				yield hf
-	elif path.endswith('.xz'):
+		return gzip.open(path, 'rb')
+	if path.endswith('.xz'):
 		import lzma
-		with lzma.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
-				yield hf
-	else:
-		import builtins
-		with builtins.open(path, 'rb') as f:
-			with _parse_cm(hf, f, progress_callback):
-				yield hf
+		return lzma.open(path, 'rb')
+	import builtins
+	return builtins.open(path, 'rb')
 
-def parse(data, progress_callback=None):
+def parse(data, progress_callback=None, memory_budget=None, include=None, include_depth=0,
+		lazy_references=False):
 	''' Like `open()`, but when you already have the data in memory. '''
 	hf = HprofFile()
+	hf._memory_budget = memory_budget
+	_set_include(hf, include, include_depth)
+	hf._lazy_references = lazy_references
 	hf._context = _parse_cm(hf, data, progress_callback)
 	hf._context.__enter__()
 	return hf
 
+def _set_include(hf, include, include_depth):
+	''' compiles the include patterns into a single regex. '''
+	if include_depth < 0:
+		raise ValueError('include_depth must not be negative; got %r' % include_depth)
+	if include is None:
+		return
+	if isinstance(include, str):
+		include = [include]
+	import fnmatch
+	import re
+	patterns = [fnmatch.translate(pattern) for pattern in include] or ['(?!)'] # empty matches nothing
+	hf._include = re.compile('|'.join(patterns))
+	hf._include_depth = include_depth
+
 @contextmanager
 def _parse_cm(hf, data, progress_callback):
+	with _mapped_cm(data, progress_callback) as mview:
+		_parse(hf, mview, progress_callback)
+		yield hf
+
+@contextmanager
+def _mapped_cm(data, progress_callback):
+	''' yields a memoryview of data, which may be a bytes-like object or a
+	(possibly decompressing) binary file. Files that cannot be mapped directly
+	are extracted to a temporary file first. '''
+	with ExitStack() as stack:
+		yield _map(data, progress_callback, stack)
+
+def _map(data, progress_callback, stack):
+	''' returns the memoryview for `_mapped_cm()`. Whatever must stay open
+	while it is in use is entered on the ExitStack stack. '''
 	failures = []
 
 	# is it a bytes-like?
 	try:
-		with memoryview(data) as mview:
-			_parse(hf, mview, progress_callback)
-			yield hf
-			return
-	except (HprofError, BufferError):
-		# _parse failed
-		raise
-	except Exception as e: # pylint: disable=broad-except
-		# we failed before calling _parse
+		return stack.enter_context(memoryview(data))
+	except TypeError as e:
 		failures.append(('bytes-like?', e))
 
 	# can it be mmapped?
@@ -148,48 +229,42 @@ def _parse_cm(hf, data, progress_callback):
 	if isinstance(data, BufferedReader):
 		fno = data.fileno()
 		fsize = os.fstat(fno).st_size
-		with mmap(fno, fsize, access=ACCESS_READ) as mapped:
-			with memoryview(mapped) as mview:
-				_parse(hf, mview, progress_callback)
-				yield hf
-				return
+		mapped = stack.enter_context(mmap(fno, fsize, access=ACCESS_READ))
+		return stack.enter_context(memoryview(mapped))
 
 	# can it be read?
+	from tempfile import TemporaryFile
+	f = stack.enter_context(TemporaryFile())
 	try:
-		from tempfile import TemporaryFile
-		from io import FileIO
-		underlying_file = FileIO(data.fileno(), closefd=False)
-		insize = os.fstat(underlying_file.fileno()).st_size
-		with TemporaryFile() as f:
-			buf = bytearray(256 * 1024)
-			fsize = 0
-			while True:
-				if progress_callback:
-					progress_callback('extracting', min(underlying_file.tell(), insize-1), insize)
-				nread = data.readinto(buf)
-				if not nread:
-					break
-				fsize += nread
-				f.write(buf[:nread])
-			f.flush()
-			if progress_callback:
-				progress_callback('extracting', insize, insize)
-			with mmap(f.fileno(), fsize) as mapped:
-				with memoryview(mapped) as mview:
-					_parse(hf, mview, progress_callback)
-					yield hf
-					return
-	except BufferError as e:
+		fsize = _extract(data, f, progress_callback)
+	except HprofError:
 		raise
 	except Exception as e: # pylint: disable=broad-except
-		prev = e
-		while prev is not None:
-			if isinstance(prev, HprofError):
-				raise e
-			prev = prev.__context__ # pylint: disable=redefined-variable-type
 		failures.append(('tmpfile?', e))
+		raise TypeError('cannot handle `data` arg', data, *failures) from e
+	mapped = stack.enter_context(mmap(f.fileno(), fsize))
+	return stack.enter_context(memoryview(mapped))
 
-	raise TypeError('cannot handle `data` arg', data, *failures)
+def _extract(data, f, progress_callback):
+	''' copies everything from data to the file f; returns the byte count. '''
+	from io import FileIO
+	import os
+	underlying_file = FileIO(data.fileno(), closefd=False)
+	insize = os.fstat(underlying_file.fileno()).st_size
+	buf = bytearray(256 * 1024)
+	fsize = 0
+	while True:
+		if progress_callback:
+			progress_callback('extracting', min(underlying_file.tell(), insize-1), insize)
+		nread = data.readinto(buf)
+		if not nread:
+			break
+		fsize += nread
+		f.write(buf[:nread])
+	f.flush()
+	if progress_callback:
+		progress_callback('extracting', insize, insize)
+	return fsize
 
 
 def hprof_mutf8_error_handler(err):
@@ -227,15 +302,37 @@ def hprof_mutf8_error_handler(err):
 codecs.register_error('hprof-mutf8', hprof_mutf8_error_handler)
 
 
+# array typecodes for the usual id sizes
+_ID_TYPECODES = {array(t).itemsize: t for t in 'LIQ'}
+
+def decode_ids(raw, idsize):
+	''' decodes the big-endian ids in raw into an integer array, in bulk.
+
+	>>> list(decode_ids(b'\\0\\0\\1\\0\\0\\2', 3))
+	[1, 2]
+	'''
+	typecode = _ID_TYPECODES.get(idsize)
+	if typecode is None:
+		return array('Q', (
+			int.from_bytes(raw[pos:pos+idsize], 'big')
+			for pos in range(0, len(raw), idsize)
+		))
+	out = array(typecode)
+	out.frombytes(raw)
+	if sys.byteorder != 'big':
+		out.byteswap()
+	return out
+
 class PrimitiveReader(object):
 	''' Supports linear reads of various types.
 
 	One source of complications is that different hprof files may use different
 	byte counts for the "id" type, which is used for e.g. object references.
 	'''
-	def __init__(self, input_bytes, idsize):
+	def __init__(self, input_bytes, idsize, base=0):
 		self._bytes = input_bytes
 		self._pos = 0
+		self._base = base # the offset of input_bytes within the whole file
 		self._set_idsize(idsize)
 
 	def _set_idsize(self, idsize):
@@ -263,6 +360,16 @@ class PrimitiveReader(object):
 		self._pos += nbytes
 		return out
 
+	def ids(self, count):
+		''' read count ids into an integer array, in bulk '''
+		return decode_ids(self.bytes(count * self._idsize), self._idsize)
+
+	def skip(self, nbytes):
+		''' skip over n bytes of data '''
+		if self._pos + nbytes > len(self._bytes):
+			raise UnexpectedEof('tried to skip %d bytes, only %d left' % (nbytes, self.remaining))
+		self._pos += nbytes
+
 	def ascii(self):
 		''' read a zero-terminated ASCII string '''
 		end = self._pos
@@ -494,10 +601,13 @@ def parse_name_record(hf, reader, progresscb):
 	'''
 	del progresscb # unused
 	nameid = reader.id()
-	name = reader.utf8(reader.remaining)
 	if nameid in hf.names:
 		raise FormatError('duplicate name id 0x%x' % nameid)
-	hf.names[nameid] = name
+	if hf._data is not None:
+		# decoded on first use; most names never are
+		hf.names.add(nameid, hf._data, reader._base + reader._pos, reader.remaining)
+	else:
+		hf.names[nameid] = reader.utf8(reader.remaining)
 RECORD_PARSERS[0x01] = parse_name_record
 
 def parse_class_load_record(hf, reader, progresscb):
@@ -569,15 +679,36 @@ def parse_heap_record_segment(hf, reader, progresscb):
 	'''
 	from . import _heap_parsing
 	if hf._pending_heap is None:
-		hf._pending_heap = Heap()
+		hf._pending_heap = _new_heap(hf, reader._idsize)
+	if hf._threads > 1 and hf._data is not None:
+		# parsed together with the other segments, when the heap ends
+		hf._pending_heap._segments.append((reader._base + reader._pos, reader.remaining))
+		return
 	_heap_parsing.parse_heap(hf, hf._pending_heap, reader, progresscb)
 RECORD_PARSERS[0x1c] = parse_heap_record_segment
 
+def _new_heap(hf, idsize):
+	''' creates an empty heap, set up for the options in hf. '''
+	from . import _heap_parsing
+	heap = Heap()
+	_heap_parsing.use_compact_queues(heap, hf._data, idsize, hf._memory_budget)
+	if hf._checkpoint is not None:
+		heap._class_records = []
+	if hf._include is not None:
+		heap._include = hf._include.match
+		heap._include_depth = hf._include_depth
+	heap._lazy = hf._lazy_references
+	heap._threads = hf._threads
+	return heap
+
 def parse_heap_record_seg_end(hf, reader, progresscb):
 	''' Ends a segmented heap. '''
 	del reader, progresscb # unused
 	if hf._pending_heap is None:
 		raise FormatError('no pending heap to end')
+	if hf._pending_heap._segments:
+		from . import _heap_parsing
+		_heap_parsing.parse_segments(hf, hf._pending_heap)
 	hf.heaps.append(hf._pending_heap)
 	hf._pending_heap = None
 RECORD_PARSERS[0x2c] = parse_heap_record_seg_end
@@ -585,13 +716,44 @@ RECORD_PARSERS[0x2c] = parse_heap_record_seg_end
 def _parse(hf, data, progresscb):
 	try:
 		_parse_hprof(hf, data, progresscb)
-	except HprofError:
+		return
+	except Cancelled:
+		pass
+	except HprofError as e:
+		_drop_data_refs(hf, e)
 		raise
 	except Exception as e:
+		_drop_data_refs(hf, e)
 		raise UnhandledError() from e
+	# Cancelled; drop everything that may refer into the data, so the caller
+	# can release it. This is done outside the except block, so the traceback
+	# (and the parser frames it refers to) is already gone.
+	_drop_data_refs(hf, None)
+	raise Cancelled()
+
+def _drop_data_refs(hf, exc):
+	''' drops everything in hf, and in the frames of exc's traceback, that
+	may refer into the data, so that the caller can unmap it. The traceback
+	itself is kept, for error reports. '''
+	if exc is not None:
+		import traceback
+		traceback.clear_frames(exc.__traceback__)
+	if hf is not None:
+		hf.heaps = []
+		hf._pending_heap = None
+		hf._data = None
+		hf.names.detach()
+	gc.collect()
+
+# how often to save checkpoints, as a fraction of the file size
+_CHECKPOINT_SPACING = 0.05
 
 def _parse_hprof(hf, mview, progresscb):
 	reader = PrimitiveReader(mview, None)
+	checkpoint = hf._checkpoint
+	hf._data = mview # compact heap records and names refer into it
+	# checkpoints are saved between segments, so those are parsed in order
+	hf._threads = _parallel.thread_count() if checkpoint is None else 1
 	if progresscb:
 		progresscb('parsing', 0, len(mview))
 	hdr = reader.ascii()
@@ -600,6 +762,16 @@ def _parse_hprof(hf, mview, progresscb):
 	idsize = reader.u4()
 	reader._set_idsize(idsize)
 	reader.u8() # timestamp; ignore.
+	lastcheckpoint = reader._pos
+	spacing = len(mview) * _CHECKPOINT_SPACING
+	if checkpoint is not None:
+		from . import _checkpoint
+		if hf._resume:
+			pos = _checkpoint.restore(checkpoint, hf, mview, idsize)
+			if pos is not None:
+				reader._pos = lastcheckpoint = pos
+				if progresscb:
+					progresscb('resuming', pos, len(mview))
 	lastreport = -1<<32
 	def innerprogress(pos):
 		''' progress helper sent to record parsers '''
@@ -624,12 +796,26 @@ def _parse_hprof(hf, mview, progresscb):
 		except KeyError:
 			hf.unhandled[rtype] = hf.unhandled.get(rtype, 0) + 1
 		else:
-			parser(hf, PrimitiveReader(data, idsize), innerprogress)
+			parser(hf, PrimitiveReader(data, idsize, reader._pos - datasize), innerprogress)
+			if (checkpoint is not None and rtype in (0x0c, 0x1c, 0x2c)
+					and reader._pos - lastcheckpoint >= spacing):
+				lastcheckpoint = reader._pos
+				_checkpoint.save(checkpoint, hf, reader._pos, mview)
 	if progresscb:
 		progresscb('parsing', len(mview), len(mview))
+	if checkpoint is not None and lastcheckpoint != reader._pos:
+		_checkpoint.save(checkpoint, hf, reader._pos, mview)
 	_instantiate(hf, reader._idsize, progresscb)
 	_resolve_references(hf, progresscb)
+	if progresscb:
+		progresscb('setting up special cases', None, None)
 	_special_cases.setup_builtins(hf)
+	if checkpoint is not None:
+		import os
+		try:
+			os.remove(checkpoint)
+		except FileNotFoundError:
+			pass # nothing to parse, so nothing was saved
 
 def _instantiate(hf, idsize, progresscb):
 	from . import _heap_parsing
@@ -645,6 +831,7 @@ def _instantiate(hf, idsize, progresscb):
 				+ len(heap._deferred_objarrays)
 				+ len(heap._deferred_primarrays)
 			)
+		heap._get_numbering()
 		total = remaining()
 		label = 'instantiating heap %d/%d' % (heapix, len(hf.heaps))
 		if progresscb:
@@ -663,6 +850,7 @@ def _instantiate(hf, idsize, progresscb):
 		_heap_parsing.create_objarrays(heap, localprogress)
 		done = total - remaining()
 		_heap_parsing.create_primarrays(heap, localprogress)
+		heap._keep = None # only needed while creating the queued objects
 		done = total - remaining()
 		localprogress(0)
 
@@ -681,6 +869,8 @@ def _resolve_references(hf, progresscb):
 	from . import _heap_parsing
 	if hf._pending_heap is not None:
 		raise FormatError('unfinished segmented heap')
+	if hf._lazy_references:
+		return # fields are resolved on access instead
 	for heapix, heap in enumerate(hf.heaps, start=1):
 		n = len(heap)
 		label = 'resolving heap %d/%d' % (heapix, len(hf.heaps))
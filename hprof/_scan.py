@@ -0,0 +1,534 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Fast, streaming passes over the records of an hprof file, for queries that do
+not need the full object model. Nothing here creates a `Heap`; records are only
+decoded as far as each query needs, and most data is never copied.
+'''
+
+import heapq
+import struct
+
+from collections import Counter
+from contextlib import contextmanager
+
+from . import _parsing
+from .error import FormatError, UnexpectedEof
+from .heap import _class_name
+
+_HEADER = struct.Struct('>IQ') # id size, timestamp
+_RECORD = struct.Struct('>BII') # tag, timestamp, length
+_U2 = struct.Struct('>H')
+_U4 = struct.Struct('>I')
+_IDFMT = {4: 'I', 8: 'Q'}
+
+TAG_NAMES = {
+	0x01: 'STRING',
+	0x02: 'LOAD CLASS',
+	0x03: 'UNLOAD CLASS',
+	0x04: 'STACK FRAME',
+	0x05: 'STACK TRACE',
+	0x06: 'ALLOC SITES',
+	0x07: 'HEAP SUMMARY',
+	0x0a: 'START THREAD',
+	0x0b: 'END THREAD',
+	0x0c: 'HEAP DUMP',
+	0x0d: 'CPU SAMPLES',
+	0x0e: 'CONTROL SETTINGS',
+	0x1c: 'HEAP DUMP SEGMENT',
+	0x2c: 'HEAP DUMP END',
+}
+
+HEAP_TAG_NAMES = {
+	0xff: 'ROOT UNKNOWN',
+	0x01: 'ROOT JNI GLOBAL',
+	0x02: 'ROOT JNI LOCAL',
+	0x03: 'ROOT JAVA FRAME',
+	0x04: 'ROOT NATIVE STACK',
+	0x05: 'ROOT STICKY CLASS',
+	0x06: 'ROOT THREAD BLOCK',
+	0x07: 'ROOT MONITOR USED',
+	0x08: 'ROOT THREAD OBJECT',
+	0x20: 'CLASS DUMP',
+	0x21: 'INSTANCE DUMP',
+	0x22: 'OBJECT ARRAY DUMP',
+	0x23: 'PRIMITIVE ARRAY DUMP',
+	0x89: 'ROOT INTERNED STRING',
+	0x8b: 'ROOT DEBUGGER',
+	0x8d: 'ROOT VM INTERNAL',
+	0x8e: 'ROOT JNI MONITOR',
+	0xfe: 'HEAP DUMP INFO',
+}
+
+# heap root records: tag -> (number of ids, number of other bytes)
+_ROOT_SIZES = {
+	0xff: (1, 0),
+	0x01: (2, 0),
+	0x02: (1, 8),
+	0x03: (1, 8),
+	0x04: (1, 4),
+	0x05: (1, 0),
+	0x06: (1, 4),
+	0x07: (1, 0),
+	0x08: (1, 8),
+	0x89: (1, 0),
+	0x8b: (1, 0),
+	0x8d: (1, 0),
+	0x8e: (1, 8),
+	0xfe: (1, 4),
+}
+
+_PRIMITIVE_TYPES = {t.value: t for t in _parsing.jtype if t is not _parsing.jtype.object}
+
+
+@contextmanager
+def mapped(path, progress_callback=None):
+	''' yields a memoryview of the (decompressed) contents of the file. '''
+	if progress_callback:
+		progress_callback('opening', None, None)
+	with _parsing._open_file(path) as f:
+		with _parsing._mapped_cm(f, progress_callback) as mview:
+			yield mview
+
+
+class Scan(object):
+	''' One pass over the top-level records of an hprof file.
+
+	The heap dump contents are not read until `heap_records()` is iterated, and
+	names are not decoded until `name()` is called.
+
+	Members:
+	version -- the header string, e.g. 'JAVA PROFILE 1.0.2'
+	idsize -- the size of object ids, in bytes
+	timestamp -- milliseconds since the epoch, when the file was written
+	tags -- a Counter of top-level record tags
+	tag_bytes -- a Counter of top-level record bytes per tag, headers included
+	class_names -- maps class id to normalized Java class name
+	heap_ranges -- (start, end) of every heap dump (segment) record body
+	'''
+
+	def __init__(self, mview, progress_callback=None):
+		self._mview = mview
+		self._progress = progress_callback
+		# PrimitiveReaders refer to themselves, and would keep the data mapped
+		# until the next gc; avoid them here.
+		nul = bytes(mview[:64]).find(b'\0')
+		self.version = str(mview[:max(nul, 0)], 'ascii', 'replace')
+		if self.version not in ('JAVA PROFILE 1.0.1', 'JAVA PROFILE 1.0.2', 'JAVA PROFILE 1.0.3'):
+			raise FormatError('unknown header "%s"' % self.version)
+		try:
+			self.idsize, self.timestamp = _HEADER.unpack_from(mview, nul + 1)
+		except struct.error as e:
+			raise UnexpectedEof('truncated header') from e
+		idsize = self.idsize
+		self._id = struct.Struct('>' + _IDFMT.get(idsize, '%ds' % idsize))
+		self._typesizes = {t.value: t.size for t in _PRIMITIVE_TYPES.values()}
+		self._typesizes[_parsing.jtype.object.value] = idsize
+
+		self.tags = Counter()
+		self.tag_bytes = Counter()
+		self._names = {} # name id -> (offset, length)
+		self._class_name_ids = {} # class id -> name id
+		self.heap_ranges = []
+		self._scan_records(nul + 1 + _HEADER.size)
+		self._class_names = None
+
+	def _scan_records(self, pos):
+		mview = self._mview
+		end = len(mview)
+		readid = self._readid
+		idsize = self.idsize
+		tags = self.tags
+		tag_bytes = self.tag_bytes
+		names = self._names
+		lastreport = 0
+		if self._progress:
+			self._progress('scanning', pos, end)
+		while pos < end:
+			if self._progress and pos - lastreport >= 1 << 24:
+				lastreport = pos
+				self._progress('scanning', pos, end)
+			try:
+				tag, _, length = _RECORD.unpack_from(mview, pos)
+			except struct.error as e:
+				raise UnexpectedEof('truncated record header at 0x%x' % pos) from e
+			pos += _RECORD.size
+			if pos + length > end:
+				raise UnexpectedEof('record at 0x%x extends past the end of the file' % pos)
+			tags[tag] += 1
+			tag_bytes[tag] += _RECORD.size + length
+			if tag == 0x01:
+				names[readid(pos)] = (pos + idsize, length - idsize)
+			elif tag == 0x02:
+				clsid = readid(pos + 4)
+				self._class_name_ids[clsid] = readid(pos + 8 + idsize)
+			elif tag in (0x0c, 0x1c):
+				self.heap_ranges.append((pos, pos + length))
+			pos += length
+		if self._progress:
+			self._progress('scanning', end, end)
+
+	def _readid(self, pos):
+		val, = self._id.unpack_from(self._mview, pos)
+		if isinstance(val, bytes):
+			val = int.from_bytes(val, 'big')
+		return val
+
+	def name(self, nameid):
+		''' returns the decoded name with this id. '''
+		offset, length = self._names[nameid]
+		return str(self._mview[offset:offset+length], 'utf8', 'hprof-mutf8')
+
+	@property
+	def class_names(self):
+		''' maps class ids to Java class names, e.g. 'java.util.HashMap.Node[]'. '''
+		if self._class_names is None:
+			self._class_names = {
+				clsid: _class_name(self.name(nameid))
+				for clsid, nameid in self._class_name_ids.items()
+			}
+		return self._class_names
+
+	def unhandled(self):
+		''' returns {tag: count} for top-level records that `open()` skips. '''
+		return {tag: n for tag, n in self.tags.items() if tag not in _parsing.RECORD_PARSERS}
+
+	def heap_records(self, ranges=None):
+		''' yields (tag, start, end) of every heap dump sub-record, where
+		[start, end) is the record body, after the tag byte. `ranges` may be a
+		subset of `heap_ranges` to read; by default, all are read. '''
+		mview = self._mview
+		idsize = self.idsize
+		typesizes = self._typesizes
+		if ranges is None:
+			ranges = self.heap_ranges
+		total = sum(end - start for start, end in ranges)
+		done = 0
+		for start, end in ranges:
+			pos = start
+			lastreport = pos
+			while pos < end:
+				if self._progress and pos - lastreport >= 1 << 24:
+					lastreport = pos
+					self._progress('scanning heap', done + pos - start, total)
+				tag = mview[pos]
+				pos += 1
+				body = pos
+				if tag == 0x21:
+					length, = _U4.unpack_from(mview, pos + 2 * idsize + 4)
+					pos += 2 * idsize + 8 + length
+				elif tag == 0x23:
+					n, = _U4.unpack_from(mview, pos + idsize + 4)
+					t = mview[pos + idsize + 8]
+					try:
+						pos += idsize + 9 + n * typesizes[t]
+					except KeyError as e:
+						raise FormatError('bad primitive array type %d at 0x%x' % (t, pos)) from e
+				elif tag == 0x22:
+					n, = _U4.unpack_from(mview, pos + idsize + 4)
+					pos += 2 * idsize + 8 + n * idsize
+				elif tag == 0x20:
+					pos += 7 * idsize + 8
+					nconst, = _U2.unpack_from(mview, pos)
+					pos += 2
+					for _ in range(nconst):
+						pos += 3 + typesizes[mview[pos + 2]]
+					nstatic, = _U2.unpack_from(mview, pos)
+					pos += 2
+					for _ in range(nstatic):
+						pos += idsize + 1 + typesizes[mview[pos + idsize]]
+					ninst, = _U2.unpack_from(mview, pos)
+					pos += 2 + ninst * (idsize + 1)
+				elif tag in _ROOT_SIZES:
+					nids, extra = _ROOT_SIZES[tag]
+					pos += nids * idsize + extra
+				else:
+					raise FormatError('unrecognized heap record type 0x%x at 0x%x' % (tag, pos - 1))
+				if pos > end:
+					raise UnexpectedEof('heap record at 0x%x extends past its heap dump' % (body - 1))
+				yield tag, body, pos
+			done += end - start
+		if self._progress:
+			self._progress('scanning heap', total, total)
+
+	def readid(self, pos):
+		''' returns the id at offset pos. '''
+		return self._readid(pos)
+
+	def primitive_type(self, typecode):
+		''' returns the jtype for a primitive array type code. '''
+		return _PRIMITIVE_TYPES[typecode]
+
+
+def histogram(path, progress_callback=None):
+	''' Count the instances of each class in an hprof file, without loading
+	its heap.
+
+	Returns {class name: [instance count, data bytes]}. Data bytes are the
+	bytes of field and array element data in the dump, excluding headers.
+	If the dump has a java.lang.Class, classes themselves are counted as its
+	instances, with no data bytes, like `Heap.count()` does. Classes with the
+	same name (from different class loaders) are counted together.
+
+	This is a single streaming pass over the file; memory use depends on the
+	number of classes, not objects.
+
+	>>> hist = histogram('testdata/example-java.hprof.bz2')
+	>>> hist['com.example.cars.Car']
+	[2, 24]
+	'''
+	with mapped(path, progress_callback) as mview:
+		return class_histogram(Scan(mview, progress_callback))
+
+
+def class_histogram(scan, ranges=None):
+	''' returns the `histogram()` of a scanned file. Only the heap dump
+	records in `ranges` are counted, if it is given. '''
+	idsize = scan.idsize
+	mview = scan._mview
+	readid = scan.readid
+	counts = Counter()
+	sizes = Counter()
+	primnames = {code: t.name + '[]' for code, t in _PRIMITIVE_TYPES.items()}
+	nclasses = 0
+	for tag, start, end in scan.heap_records(ranges):
+		if tag == 0x21:
+			clsid = readid(start + idsize + 4)
+			counts[clsid] += 1
+			sizes[clsid] += end - start - 2 * idsize - 8
+		elif tag == 0x22:
+			clsid = readid(start + idsize + 8)
+			counts[clsid] += 1
+			sizes[clsid] += end - start - 2 * idsize - 8
+		elif tag == 0x23:
+			t = mview[start + idsize + 8]
+			counts[primnames[t]] += 1
+			sizes[primnames[t]] += end - start - idsize - 9
+		elif tag == 0x20:
+			nclasses += 1
+	names = scan.class_names
+	if nclasses and 'java.lang.Class' in names.values():
+		counts['java.lang.Class'] += nclasses
+	out = {}
+	for key, count in counts.items():
+		name = key if isinstance(key, str) else names.get(key, 'unknown class 0x%x' % key)
+		entry = out.setdefault(name, [0, 0])
+		entry[0] += count
+		entry[1] += sizes[key]
+	return out
+
+
+def top_arrays(scan, limit):
+	''' returns the `limit` largest arrays (all of them, if limit is 0 or
+	less), as (bytes, length, id, class name) tuples, largest first. '''
+	idsize = scan.idsize
+	mview = scan._mview
+	readid = scan.readid
+	arrays = (
+		(end - start - idsize - 9 if tag == 0x23 else end - start - 2 * idsize - 8, start, tag)
+		for tag, start, end in scan.heap_records()
+		if tag in (0x22, 0x23)
+	)
+	if limit > 0:
+		largest = heapq.nlargest(limit, arrays)
+	else:
+		largest = sorted(arrays, reverse=True)
+	out = []
+	for size, start, tag in largest:
+		objid = readid(start)
+		n, = _U4.unpack_from(mview, start + idsize + 4)
+		if tag == 0x23:
+			name = scan.primitive_type(mview[start + idsize + 8]).name + '[]'
+		else:
+			clsid = readid(start + idsize + 8)
+			name = scan.class_names.get(clsid, 'unknown class 0x%x' % clsid)
+		out.append((size, n, objid, name))
+	return out
+
+
+class Summary(object):
+	''' What an hprof file contains, from its record headers alone.
+
+	Members:
+	version -- the header string, e.g. 'JAVA PROFILE 1.0.2'
+	idsize -- the size of object ids, in bytes
+	timestamp -- milliseconds since the epoch, when the file was written
+	records -- {tag: (count, bytes)} of top-level records; see TAG_NAMES
+	unhandled -- {tag: count} of top-level records that `open()` skips
+	heap_segments -- the number of heap dump (segment) records
+	heap_records -- {tag: (count, bytes)} of heap dump sub-records; see
+	                HEAP_TAG_NAMES. Bytes include the tag byte.
+	instances -- the number of object instances (not arrays)
+	object_arrays -- the number of object arrays
+	primitive_arrays -- {element type name: count} of primitive arrays
+	object_bytes -- field and array element bytes of all objects and arrays
+	'''
+
+	def __init__(self, scan):
+		self.version = scan.version
+		self.idsize = scan.idsize
+		self.timestamp = scan.timestamp
+		self.records = {tag: (n, scan.tag_bytes[tag]) for tag, n in scan.tags.items()}
+		self.unhandled = scan.unhandled()
+		self.heap_segments = len(scan.heap_ranges)
+
+		idsize = scan.idsize
+		mview = scan._mview
+		counts = Counter()
+		sizes = Counter()
+		primitive = Counter()
+		nbytes = 0
+		for tag, start, end in scan.heap_records():
+			counts[tag] += 1
+			sizes[tag] += end - start + 1
+			if tag in (0x21, 0x22):
+				nbytes += end - start - 2 * idsize - 8
+			elif tag == 0x23:
+				nbytes += end - start - idsize - 9
+				primitive[mview[start + idsize + 8]] += 1
+		self.heap_records = {tag: (n, sizes[tag]) for tag, n in counts.items()}
+		self.instances = counts[0x21]
+		self.object_arrays = counts[0x22]
+		self.primitive_arrays = {_PRIMITIVE_TYPES[t].name: n for t, n in primitive.items()}
+		self.object_bytes = nbytes
+
+
+def summarize(path, progress_callback=None):
+	''' Summarize the contents of an hprof file, much faster than `open()`.
+
+	Only record headers are read: top-level records are skipped over by their
+	lengths, and heap dump sub-records by lengths computed from their fixed
+	fields. Returns a `Summary`.
+
+	>>> s = summarize('testdata/example-java.hprof.bz2')
+	>>> s.version, s.idsize, s.heap_segments
+	('JAVA PROFILE 1.0.2', 8, 1)
+	>>> s.instances, s.object_arrays, s.primitive_arrays['byte']
+	(14484, 1500, 7507)
+	'''
+	with mapped(path, progress_callback) as mview:
+		return Summary(Scan(mview, progress_callback))
+
+
+def strings(scan):
+	''' returns a Counter of the texts of all java.lang.String objects, or None
+	if the String class layout is not one we know how to decode. '''
+	mview = scan._mview
+	idsize = scan.idsize
+	readid = scan.readid
+	stringids = {clsid for clsid, name in scan.class_names.items() if name == 'java.lang.String'}
+
+	# first pass: class layouts and String instances
+	layouts = {} # class id -> (super id, [(field name id, type code), ...])
+	statics = {} # static field name -> value, for String
+	instances = [] # start offsets of String instance records
+	for tag, start, end in scan.heap_records():
+		if tag == 0x21:
+			if readid(start + idsize + 4) in stringids:
+				instances.append(start)
+		elif tag == 0x20:
+			clsid = readid(start)
+			layouts[clsid] = _class_layout(scan, start, statics if clsid in stringids else None)
+	if not instances:
+		return Counter()
+
+	# where are the value and coder fields?
+	fieldpos = {}
+	for clsid in stringids:
+		offsets = _field_offsets(scan, layouts, clsid)
+		if offsets is None or 'value' not in offsets:
+			return None
+		fieldpos[clsid] = offsets
+
+	latin1 = statics.get('LATIN1')
+	utf16 = statics.get('UTF16')
+	wanted = {} # array id -> [encoding, ...]
+	for start in instances:
+		clsid = readid(start + idsize + 4)
+		data = start + 2 * idsize + 8
+		offsets = fieldpos[clsid]
+		valueid = readid(data + offsets['value'][0])
+		if not valueid:
+			continue
+		coder = None
+		if 'coder' in offsets:
+			pos, typecode = offsets['coder']
+			coder, = struct.unpack_from('>b' if typecode == _parsing.jtype.byte.value else '>i', mview, data + pos)
+		if coder is None:
+			encoding = 'ascii' # may be Android's compressed strings
+		elif coder == latin1:
+			encoding = 'latin-1'
+		elif coder == utf16:
+			encoding = 'utf-16-le'
+		else:
+			return None
+		wanted.setdefault(valueid, []).append(encoding)
+	del instances
+
+	# second pass: the backing arrays
+	out = Counter()
+	for tag, start, end in scan.heap_records():
+		if tag == 0x23:
+			encodings = wanted.get(readid(start))
+			if encodings is None:
+				continue
+			t = mview[start + idsize + 8]
+			raw = mview[start + idsize + 9:end]
+			for encoding in encodings:
+				if t == _parsing.jtype.char.value:
+					text = str(raw, 'utf-16-be', 'surrogatepass')
+				else:
+					text = str(raw, encoding, 'replace')
+				out[text] += 1
+	return out
+
+
+def _class_layout(scan, start, statics):
+	''' returns (super id, [(field name id, type code), ...]) for a class dump;
+	if statics is a dict, the class' primitive static values are added to it. '''
+	mview = scan._mview
+	idsize = scan.idsize
+	typesizes = scan._typesizes
+	superid = scan.readid(start + idsize + 4)
+	pos = start + 7 * idsize + 8
+	nconst, = _U2.unpack_from(mview, pos)
+	pos += 2
+	for _ in range(nconst):
+		pos += 3 + typesizes[mview[pos + 2]]
+	nstatic, = _U2.unpack_from(mview, pos)
+	pos += 2
+	for _ in range(nstatic):
+		nameid = scan.readid(pos)
+		t = mview[pos + idsize]
+		pos += idsize + 1
+		if statics is not None and t in _PRIMITIVE_TYPES:
+			val, = struct.unpack_from('>' + _PRIMITIVE_TYPES[t].packfmt, mview, pos)
+			statics[scan.name(nameid)] = val
+		pos += typesizes[t]
+	ninst, = _U2.unpack_from(mview, pos)
+	pos += 2
+	fields = []
+	for _ in range(ninst):
+		fields.append((scan.readid(pos), mview[pos + idsize]))
+		pos += idsize + 1
+	return superid, fields
+
+
+def _field_offsets(scan, layouts, clsid):
+	''' returns {field name: (offset, type code)} for the instance data of a
+	class, or None if its class hierarchy is incomplete. Shadowed fields are
+	ignored; the most derived class wins. '''
+	typesizes = scan._typesizes
+	out = {}
+	pos = 0
+	while clsid:
+		if clsid not in layouts:
+			return None
+		clsid, fields = layouts[clsid]
+		for nameid, typecode in fields:
+			name = scan.name(nameid)
+			if name not in out:
+				out[name] = (pos, typecode)
+			pos += typesizes[typecode]
+	return out
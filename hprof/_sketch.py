@@ -0,0 +1,260 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Fixed-size probabilistic summaries ("sketches"), and a single streaming pass
+that uses them to estimate how much of a heap is duplicated data.
+'''
+
+import hashlib
+
+from array import array
+
+from . import _scan
+
+def hash64(data):
+	''' returns a 64-bit hash of a bytes-like object. It is the same in every
+	process, unlike hash(). '''
+	return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+class HyperLogLog(object):
+	''' Estimates the number of distinct 64-bit hashes added to it, using 2**p
+	bytes of memory. The standard error is about 1.04 / sqrt(2**p); 1.6% for
+	the default p=12.
+
+	>>> hll = HyperLogLog()
+	>>> for i in range(10000):
+	...     hll.add(hash64(b'%d' % (i % 1000)))
+	>>> 950 < hll.estimate() < 1050
+	True
+	'''
+	__slots__ = ('p', 'registers')
+
+	def __init__(self, p=12):
+		if not 4 <= p <= 18:
+			raise ValueError('p must be in [4, 18]; got %r' % p)
+		self.p = p
+		self.registers = bytearray(1 << p)
+
+	def add(self, h):
+		''' adds a 64-bit hash. '''
+		p = self.p
+		rest = h & ((1 << (64 - p)) - 1)
+		rank = 64 - p - rest.bit_length() + 1
+		ix = h >> (64 - p)
+		if rank > self.registers[ix]:
+			self.registers[ix] = rank
+
+	def merge(self, other):
+		''' makes this count everything that was added to either. '''
+		if other.p != self.p:
+			raise ValueError('cannot merge sketches of different sizes')
+		regs = self.registers
+		for ix, rank in enumerate(other.registers):
+			if rank > regs[ix]:
+				regs[ix] = rank
+
+	def estimate(self):
+		''' returns the estimated number of distinct hashes added. '''
+		m = len(self.registers)
+		alpha = 0.7213 / (1 + 1.079 / m)
+		raw = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+		zeros = self.registers.count(0)
+		if raw <= 2.5 * m and zeros:
+			import math
+			return m * math.log(m / zeros) # linear counting for small sets
+		return raw
+
+
+class CountMinSketch(object):
+	''' Estimates how many times each 64-bit hash was added, using
+	width * depth counters. Estimates are never too low; they are too high by
+	at most 2 * total / width with probability 1 - 2**-depth.
+
+	>>> cms = CountMinSketch()
+	>>> cms.add(hash64(b'a'), 5)
+	5
+	>>> cms.add(hash64(b'b'))
+	1
+	>>> cms.estimate(hash64(b'a')), cms.estimate(hash64(b'c'))
+	(5, 0)
+	'''
+	__slots__ = ('width', 'depth', 'tables')
+
+	def __init__(self, width=1 << 16, depth=4):
+		self.width = width
+		self.depth = depth
+		self.tables = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+	def _indexes(self, h):
+		h1 = h & 0xffffffff
+		h2 = (h >> 32) | 1
+		width = self.width
+		return [(h1 + i * h2) % width for i in range(self.depth)]
+
+	def add(self, h, count=1):
+		''' adds count occurrences of a 64-bit hash; returns its new estimate. '''
+		out = None
+		for table, ix in zip(self.tables, self._indexes(h)):
+			table[ix] += count
+			if out is None or table[ix] < out:
+				out = table[ix]
+		return out
+
+	def estimate(self, h):
+		''' returns the estimated number of occurrences of a 64-bit hash. '''
+		return min(table[ix] for table, ix in zip(self.tables, self._indexes(h)))
+
+
+class ClassTriage(object):
+	''' Estimated duplication among the instances of one class, or one array
+	type.
+
+	Members:
+	count -- the exact number of instances
+	nbytes -- the exact number of field or element data bytes
+	distinct -- the estimated number of distinct contents
+	top -- the most common contents, as a list of (estimated count, data bytes
+	       per instance, id of an example object), most common first
+	wasted_bytes -- the estimated data bytes in duplicates; exact sizes are
+	       used for the top contents, average sizes for the rest
+	'''
+	__slots__ = ('count', 'nbytes', 'distinct', 'top', 'wasted_bytes')
+
+	def __init__(self, count, nbytes, distinct, top):
+		self.count = count
+		self.nbytes = nbytes
+		self.distinct = distinct
+		self.top = top
+		self.wasted_bytes = self._wasted_bytes()
+
+	@property
+	def duplicates(self):
+		''' the estimated number of instances whose contents are not unique. '''
+		return max(0, self.count - self.distinct)
+
+	def _wasted_bytes(self):
+		top = [(min(n, self.count), size) for n, size, _ in self.top]
+		wasted = sum((n - 1) * size for n, size in top)
+		rest_count = self.count - sum(n for n, _ in top)
+		rest_bytes = self.nbytes - sum(n * size for n, size in top)
+		rest_dups = self.duplicates - sum(n - 1 for n, _ in top)
+		if rest_count > 0 and rest_bytes > 0 and rest_dups > 0:
+			wasted += rest_bytes * min(rest_dups, rest_count) // rest_count
+		return min(wasted, self.nbytes)
+
+	def __repr__(self):
+		return '<ClassTriage count=%d distinct=%d wasted_bytes=%d>' % (
+				self.count, self.distinct, self.wasted_bytes)
+
+
+class _Tracker(object):
+	''' The sketches for one class. '''
+	__slots__ = ('count', 'nbytes', 'hll', 'salt', 'top', 'threshold')
+
+	def __init__(self, key, p):
+		self.count = 0
+		self.nbytes = 0
+		self.hll = HyperLogLog(p)
+		self.salt = hash64(repr(key).encode('utf8'))
+		self.top = {} # content hash -> [estimated count, size, example id]
+		self.threshold = 0 # the lowest estimate in top, once it is full
+
+	def add(self, cms, h, size, objid, k):
+		''' counts one instance with content hash h, keeping the k most
+		common contents in top. '''
+		self.count += 1
+		self.nbytes += size
+		self.hll.add(h)
+		est = cms.add(h ^ self.salt)
+		top = self.top
+		entry = top.get(h)
+		if entry is not None:
+			entry[0] = est
+		elif len(top) < k:
+			top[h] = [est, size, objid]
+			if len(top) == k:
+				self.threshold = min(e[0] for e in top.values())
+		elif est > self.threshold:
+			lowest = min(top, key=lambda key: top[key][0])
+			del top[lowest]
+			top[h] = [est, size, objid]
+			self.threshold = min(e[0] for e in top.values())
+
+	def merge(self, other, k):
+		''' adds the counts of another class to this one. '''
+		self.count += other.count
+		self.nbytes += other.nbytes
+		self.hll.merge(other.hll)
+		entries = list(self.top.items()) + list(other.top.items())
+		entries.sort(key=lambda item: item[1][0], reverse=True)
+		self.top = dict(entries[:k])
+
+	def result(self):
+		''' returns the ClassTriage of everything added. '''
+		distinct = min(self.count, int(round(self.hll.estimate())))
+		top = sorted((tuple(entry) for entry in self.top.values() if entry[0] > 1), reverse=True)
+		return ClassTriage(self.count, self.nbytes, distinct, top)
+
+
+def triage(path, progress_callback=None, top=10, precision=12):
+	''' Estimate how much of the heap in an hprof file is duplicated data, in
+	one streaming pass and bounded memory.
+
+	For each class, the field data of every instance is hashed into a
+	HyperLogLog sketch, which estimates the number of distinct contents, and a
+	count-min sketch shared by all classes, which estimates how often each
+	content occurs; the `top` most frequent are kept. Arrays are treated the
+	same way, by element data. Memory use depends on the number of classes,
+	not objects.
+
+	Strings are covered by their backing arrays: duplicated strings show up as
+	duplicated byte[] or char[] contents.
+
+	Returns {class name: ClassTriage}.
+
+	>>> result = triage('testdata/example-java.hprof.bz2')
+	>>> byte_arrays = result['byte[]']
+	>>> byte_arrays.count, byte_arrays.distinct < byte_arrays.count
+	(7507, True)
+	'''
+	with _scan.mapped(path, progress_callback) as mview:
+		scan = _scan.Scan(mview, progress_callback)
+		trackers = _triage(scan, top, precision)
+		names = scan.class_names
+		del scan
+	merged = {}
+	for key, tracker in trackers.items():
+		name = key if isinstance(key, str) else names.get(key, 'unknown class 0x%x' % key)
+		if name in merged:
+			merged[name].merge(tracker, top) # same name, other class loader
+		else:
+			merged[name] = tracker
+	return {name: tracker.result() for name, tracker in merged.items()}
+
+
+def _triage(scan, k, precision):
+	idsize = scan.idsize
+	mview = scan._mview
+	readid = scan.readid
+	cms = CountMinSketch()
+	trackers = {}
+	primnames = {code: t.name + '[]' for code, t in _scan._PRIMITIVE_TYPES.items()}
+	for tag, start, end in scan.heap_records():
+		if tag == 0x21:
+			key = readid(start + idsize + 4)
+			data = start + 2 * idsize + 8
+		elif tag == 0x22:
+			key = readid(start + idsize + 8)
+			data = start + 2 * idsize + 8
+		elif tag == 0x23:
+			key = primnames[mview[start + idsize + 8]]
+			data = start + idsize + 9
+		else:
+			continue
+		tracker = trackers.get(key)
+		if tracker is None:
+			tracker = trackers[key] = _Tracker(key, precision)
+		tracker.add(cms, hash64(mview[data:end]), end - data, readid(start), k)
+	return trackers
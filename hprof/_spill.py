@@ -0,0 +1,156 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Compact record storage that moves to disk when it grows too large.
+'''
+
+import mmap
+import struct
+import tempfile
+
+
+class SpillArray(object):
+	''' An append-only sequence of fixed-size records, each a tuple of numbers
+	packed with the struct format `fmt`.
+
+	Up to `budget` bytes are kept in memory; beyond that, records are written to
+	a temporary file, which is memory-mapped for reading. The operating system
+	can then page the records in and out as needed, rather than running out of
+	memory. A budget of None keeps everything in memory.
+
+	>>> a = SpillArray('=QI', budget=24)
+	>>> for i in range(5):
+	...     a.append((i, 2*i))
+	>>> len(a), a.spilled
+	(5, 4)
+	>>> a[1], a[-1]
+	((1, 2), (4, 8))
+	>>> list(a)
+	[(0, 0), (1, 2), (2, 4), (3, 6), (4, 8)]
+	>>> a.clear()
+	>>> len(a)
+	0
+	'''
+
+	def __init__(self, fmt, budget):
+		self._struct = struct.Struct(fmt)
+		self._budget = None if budget is None else max(budget, self._struct.size)
+		self._buf = bytearray()
+		self._file = None
+		self._filesize = 0
+		self._map = None
+
+	@property
+	def spilled(self):
+		''' the number of records that have been moved to disk. '''
+		return self._filesize // self._struct.size
+
+	def append(self, record):
+		''' adds a record at the end. '''
+		self._buf += self._struct.pack(*record)
+		if self._budget is not None and len(self._buf) >= self._budget:
+			self._spill()
+
+	def _spill(self):
+		if self._file is None:
+			self._file = tempfile.TemporaryFile(prefix='hprof-spill-')
+		self._file.write(self._buf)
+		self._filesize += len(self._buf)
+		self._buf = bytearray()
+		self._unmap()
+
+	def _mapped(self):
+		if self._map is None:
+			self._file.flush()
+			self._map = mmap.mmap(self._file.fileno(), self._filesize, access=mmap.ACCESS_READ)
+		return self._map
+
+	def _unmap(self):
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+
+	def __len__(self):
+		return (self._filesize + len(self._buf)) // self._struct.size
+
+	def __getitem__(self, ix):
+		n = len(self)
+		if ix < 0:
+			ix += n
+		if not 0 <= ix < n:
+			raise IndexError('record index out of range')
+		pos = ix * self._struct.size
+		if pos < self._filesize:
+			return self._struct.unpack_from(self._mapped(), pos)
+		return self._struct.unpack_from(self._buf, pos - self._filesize)
+
+	def __iter__(self):
+		if self._filesize:
+			yield from self._struct.iter_unpack(self._mapped())
+		with memoryview(self._buf) as buf: # no copy; released before the next append
+			yield from self._struct.iter_unpack(buf)
+
+	def iter_range(self, start, stop):
+		''' iterates over records start to stop-1. Each of several threads may
+		iterate over a range of its own, as long as nothing is appended. '''
+		n = len(self)
+		size = self._struct.size
+		start = max(0, min(start, n)) * size
+		stop = max(start, min(stop, n) * size)
+		# map the file here, rather than in whichever thread gets there first
+		mapped = self._mapped() if start < self._filesize else None
+		buf = memoryview(self._buf)[max(start - self._filesize, 0):max(stop - self._filesize, 0)]
+		return self._iter_range(mapped, start, min(stop, self._filesize), buf)
+
+	def _iter_range(self, mapped, start, stop, buf):
+		if mapped is not None:
+			yield from self._struct.iter_unpack(memoryview(mapped)[start:stop])
+		with buf:
+			yield from self._struct.iter_unpack(buf)
+
+	@property
+	def nbytes(self):
+		''' the size of all records, packed. '''
+		return self._filesize + len(self._buf)
+
+	def write_to(self, f):
+		''' writes all records, packed, to the binary file f. '''
+		if self._filesize:
+			f.write(self._mapped())
+		f.write(self._buf)
+
+	def read_from(self, f, nbytes):
+		''' appends nbytes worth of packed records from the binary file f. '''
+		if nbytes % self._struct.size:
+			raise ValueError('%d bytes is not a whole number of records' % nbytes)
+		while nbytes:
+			chunk = f.read(min(nbytes, 1 << 20))
+			if not chunk:
+				raise EOFError('%d bytes of records missing' % nbytes)
+			nbytes -= len(chunk)
+			self._add(chunk)
+
+	def extend(self, other):
+		''' appends all records of other, a SpillArray of the same format. '''
+		if other._struct.format != self._struct.format:
+			raise ValueError('record formats differ: %r, %r' % (self._struct.format, other._struct.format))
+		if other._filesize:
+			with memoryview(other._mapped()) as mview:
+				for pos in range(0, other._filesize, 1 << 20):
+					self._add(mview[pos:pos + (1 << 20)])
+		self._add(other._buf)
+
+	def _add(self, packed):
+		self._buf += packed
+		if self._budget is not None and len(self._buf) >= self._budget:
+			self._spill()
+
+	def clear(self):
+		''' removes all records, and the temporary file if there is one. '''
+		self._unmap()
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+		self._filesize = 0
+		self._buf = bytearray()
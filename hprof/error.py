@@ -19,3 +19,7 @@ class UnhandledError(HprofError):
 class MissingObject(HprofError):
 	''' Raised when a referenced object could not be found. '''
 
+class Cancelled(HprofError):
+	''' Raised when loading was cancelled before it finished. '''
+class RemoteError(HprofError):
+	''' Raised by `hprof.server.Client` when the server could not handle a request. '''
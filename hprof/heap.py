@@ -6,7 +6,9 @@
 Classes and functions implementing a Java-like object model.
 '''
 
+import itertools as _itertools
 import re as _re
+import threading as _threading
 
 _NAMESPLIT = _re.compile(r'\.|/')
 
@@ -41,6 +43,13 @@ class Heap(dict):
 	>>> heap.classes[heap.classtree.com.example.cars.Bike]
 	[<JavaClass 'com.example.cars.Bike'>]
 
+	Once loaded, a heap may be read from several threads at the same time.
+	Everything that is built or decoded on first use -- array contents,
+	lazily resolved references, names, the class tree and the tables behind
+	`index_of()`, `instance_mask()` and the like -- is built under a lock,
+	and read without one after that. Changing the heap while other threads
+	read it is not safe.
+
 	Members:
 	classes -- a dict mapping java class names to class instance lists.
 	classtree -- a JavaHierarchy object, allowing tab completion of class names
@@ -49,13 +58,37 @@ class Heap(dict):
 	def __init__(self):
 		super().__init__()
 		self.classes = dict() # JavaClassName -> [JavaClass, ...]
-		self.classtree = JavaHierarchy()
+		self._classnames = _ClassNames() # builds classtree on demand
 		self._instances = dict() # JavaClass -> [instance, instance, ...]
+		self._numbering = None # _index.ClassNumbering, created on demand
+		self._index = None # _index.DenseIndex, created on demand
+		self._graph = None # (offsets, targets), kept by fork_safe()
+		self._lock = _threading.Lock() # for building the tables above
+		self._data = None # the file data, when the deferred queues refer into it
+		self._idsize = None
+		self._class_records = None # [(start, end), ...] of class dumps, when checkpointing
+		self._include = None # class name -> match or None, when filtering instances
+		self._include_depth = 0
+		self._included_classes = dict() # class id or jtype -> bool
+		self._keep = None # ids of the queued objects to create, if not all
+		self._lazy = False # leave reference fields as ids until accessed
+		self._threads = 1 # how many threads to parse and create objects with
+		self._segments = [] # (offset, length) of heap dump segments to parse in parallel
 		self._deferred_classes = dict()
 		self._deferred_primarrays = list()
 		self._deferred_objarrays = list()
 		self._deferred_objects = list()
 
+	@property
+	def classtree(self):
+		''' a JavaHierarchy of all class names in the heap; built when it is
+		first used. '''
+		classnames = self._classnames
+		if classnames._tree is None:
+			with self._lock:
+				return classnames.tree()
+		return classnames._tree
+
 	def _classes(self, cls_or_name):
 		if isinstance(cls_or_name, JavaClass):
 			yield cls_or_name
@@ -77,10 +110,8 @@ class Heap(dict):
 		[<com.example.cars.Car 0x...>, <com.example.cars.Car 0x...>]
 		'''
 		for cls in self._classes(cls_or_name):
-			if cls in self.classes.get('java.lang.Class', ()):
-				for lst in self.classes.values():
-					yield from lst
-			yield from self._instances[cls]
+			for lst in self._instance_lists(cls):
+				yield from lst
 
 	def all_instances(self, cls_or_name):
 		''' returns an iterable over all objects of this class or any of its subclasses.
@@ -96,10 +127,202 @@ class Heap(dict):
 		>>> list(heap.all_instances('com.example.cars.Car'))
 		[<com.example.cars.Car 0x...>, <com.example.cars.Car 0x...>, <com.example.cars.Limo 0x...>]
 		'''
+		lists = self._instance_lists
 		for cls in self._classes(cls_or_name):
-			yield from self.exact_instances(cls)
-			for subcls in cls.__subclasses__():
-				yield from self.all_instances(subcls)
+			for subcls in self.subclasses(cls):
+				yield from _itertools.chain.from_iterable(lists(subcls))
+
+	def count(self, cls_or_name, subclasses=False):
+		''' returns the number of objects of this class, without iterating over them.
+
+		>>> heap.count('com.example.cars.Car')
+		2
+		>>> heap.count('com.example.cars.Car', subclasses=True)
+		3
+
+		With `subclasses=True`, the count is the same as the length of
+		`all_instances()`; otherwise it is the length of `exact_instances()`.
+		'''
+		total = 0
+		if subclasses:
+			numbering = self._get_numbering()
+			counts = numbering.counts
+			if counts is None or numbering.counted != len(self):
+				counts = numbering.count_instances(self._instance_lists)
+				numbering.counted = len(self)
+			for cls in self._classes(cls_or_name):
+				first, last = numbering.range_of(cls)
+				total += counts[last+1] - counts[first]
+		else:
+			for cls in self._classes(cls_or_name):
+				total += sum(len(lst) for lst in self._instance_lists(cls))
+		return total
+
+	def _instance_lists(self, cls):
+		''' returns the lists holding the exact instances of cls. '''
+		instances = self._instances[cls]
+		if cls in self.classes.get('java.lang.Class', ()):
+			return tuple(self.classes.values()) + (instances,)
+		return (instances,)
+
+	def subclasses(self, cls):
+		''' returns a list of cls and all its direct and indirect subclasses.
+
+		>>> car_cls, = heap.classes['com.example.cars.Car']
+		>>> heap.subclasses(car_cls)
+		[<JavaClass 'com.example.cars.Car'>, <JavaClass 'com.example.cars.Limo'>]
+		'''
+		numbering = self._get_numbering()
+		first, last = numbering.range_of(cls)
+		return numbering.preorder[first:last+1]
+
+	def instance_mask(self, cls_or_name):
+		''' returns a bytearray with one entry per object in the heap, in the same
+		order as `heap.values()`. The entry is 1 if the object is an instance of
+		the class (or any of its subclasses), otherwise 0.
+
+		>>> mask = heap.instance_mask('com.example.cars.Car')
+		>>> sum(mask)
+		3
+		>>> from itertools import compress
+		>>> sorted(str(car.make) for car in compress(heap.values(), mask))
+		['Lolvo', 'Stretch', 'Toy Yoda']
+		'''
+		numbering = self._get_numbering()
+		# one entry per class, indexed by (local) preorder number + 1; the
+		# first entry is for objects that are not numbered.
+		table = bytearray(len(numbering.preorder) + 1)
+		for cls in self._classes(cls_or_name):
+			first, last = numbering.range_of(cls)
+			table[first+1:last+2] = b'\1' * (last + 1 - first)
+		objix = numbering.objix
+		if objix is None or len(objix) != len(self):
+			objix = numbering.objix = numbering.object_indexes(self.values())
+		return bytearray(map(table.__getitem__, objix))
+
+	def _get_numbering(self):
+		numbering = self._numbering
+		if numbering is None:
+			with self._lock:
+				numbering = self._numbering
+				if numbering is None:
+					from ._index import ClassNumbering
+					numbering = self._numbering = ClassNumbering(self.classes)
+		return numbering
+
+	def index_of(self, obj):
+		''' returns the dense index of an object: its position among all objects
+		in the heap, sorted by id. Indexes go from 0 to len(heap) - 1, so they can
+		be used to index plain arrays. The argument may also be an object id.
+
+		>>> bike = heap[0xce7e8000]
+		>>> ix = heap.index_of(bike)
+		>>> heap.object_at(ix) is bike
+		True
+		>>> heap.index_of(0xce7e8000) == ix
+		True
+
+		Raises KeyError if the object is not in this heap.
+		'''
+		index = self._get_index()
+		if isinstance(obj, int):
+			ix = index.lookup(obj)
+			if ix is not None:
+				return ix
+		else:
+			if type(obj) is Ref: # pylint: disable=unidiomatic-typecheck
+				obj = Ref._target.__get__(obj)
+			objid = index.id_of(obj)
+			if objid is not None:
+				ix = index.lookup(objid)
+				if ix is not None and index.objects[ix] is obj:
+					return ix
+		raise KeyError(obj)
+
+	def object_at(self, ix):
+		''' returns the object with dense index ix; see `index_of()`. '''
+		return self._get_index().objects[ix]
+
+	def reference_graph(self):
+		''' returns the references between the objects in the heap, as two
+		arrays in compressed sparse row form: the objects referenced by the
+		object with dense index i (see `index_of()`) have the dense indexes
+		`targets[offsets[i]:offsets[i+1]]`.
+
+		>>> offsets, targets = heap.reference_graph()
+		>>> len(offsets) == len(heap) + 1
+		True
+		>>> bike = heap[0xce7e8000]
+		>>> ix = heap.index_of(bike)
+		>>> bike.make in [heap.object_at(t) for t in targets[offsets[ix]:offsets[ix+1]]]
+		True
+
+		References are the object fields of instances, the elements of object
+		arrays and the static fields of classes that hold objects. Null
+		references, and references to objects that are not in the heap, are
+		left out. The arrays are built anew on each call, unless `fork_safe()`
+		has built them already; those are shared, and must not be modified.
+		'''
+		graph = self._graph
+		if graph is not None and len(graph[0]) == len(self) + 1:
+			return graph
+		from ._index import reference_graph
+		return reference_graph(self._get_index())
+
+	def fork_safe(self):
+		''' prepares the heap for analysis in forked worker processes.
+
+		Forked children share the parent's memory until either side writes to
+		it, but Python writes to an object whenever its reference count
+		changes or the garbage collector visits it, so a child that walks the
+		heap ends up with its own copy of most of it.
+
+		This builds the flat tables that queries use instead of visiting the
+		objects: the sorted id array behind `index_of()`, the class of each
+		object behind `instance_mask()` and `count()`, and the arrays of
+		`reference_graph()`. Building them once here lets the children share
+		them, instead of each building its own. Then it runs a full collection
+		and calls `gc.freeze()`, so that collections in the children leave all
+		existing objects alone.
+
+		The file data stays in its mapping, which children share as is. Call
+		this right before forking, after the last change to the heap.
+		`gc.unfreeze()` undoes the freeze.
+		'''
+		import gc
+		self._get_index()
+		numbering = self._get_numbering()
+		if numbering.objix is None or len(numbering.objix) != len(self):
+			numbering.objix = numbering.object_indexes(self.values())
+		numbering.count_instances(self._instance_lists)
+		numbering.counted = len(self)
+		self._graph = None
+		self._graph = self.reference_graph()
+		gc.collect()
+		gc.freeze()
+
+	def _resolve(self, addr):
+		''' returns the object with id addr, or None if addr is 0. '''
+		if not addr:
+			return None
+		try:
+			return self[addr]
+		except KeyError as e:
+			if self._include is not None:
+				return Excluded(addr)
+			from .error import MissingObject
+			raise MissingObject(hex(addr)) from e
+
+	def _get_index(self):
+		index = self._index
+		if index is None or len(index.ids) != len(self):
+			with self._lock:
+				index = self._index
+				if index is None or len(index.ids) != len(self):
+					from ._index import DenseIndex
+					index = self._index = DenseIndex(self)
+		return index
+
 
 class JavaHierarchy(object):
 	''' Accessible as Heap.classtree. Allows tab completion of class names.
@@ -109,6 +332,67 @@ class JavaHierarchy(object):
 	'''
 	pass
 
+
+class _ClassNames(object):
+	''' The class name containers of a heap, by full name.
+
+	Creating a class only needs the containers on the path to its name, so
+	they are kept in a dict rather than as attributes of a JavaHierarchy; the
+	hierarchy is built from the dict the first time it is asked for, and kept
+	up to date after that. Each distinct name found in the file is only split
+	up once.
+	'''
+
+	__slots__ = ('containers', 'parsed', '_tree')
+
+	def __init__(self):
+		self.containers = {} # full name -> JavaPackage or JavaClassName
+		self.parsed = {} # name in file -> (simple name, outer container, JavaClassName)
+		self._tree = None
+
+	def lookup(self, name):
+		''' returns the simple name, the enclosing container (None for the
+		root) and the JavaClassName of a class name as found in the file. '''
+		out = self.parsed.get(name)
+		if out is None:
+			packages, names = _split_class_name(name)
+			outer = self._container(None, packages, JavaPackage)
+			outer = self._container(outer, names[:-1], JavaClassName)
+			classname = self._container(outer, names[-1:], JavaClassName)
+			out = self.parsed[name] = (names[-1], outer, classname)
+		return out
+
+	def _container(self, container, parts, ctype):
+		containers = self.containers
+		for p in parts:
+			assert p
+			assert '.' not in p
+			assert ';' not in p
+			assert '/' not in p or p.find('/') >= p.find('$$')
+			assert '$' not in p or p.find('$') >= p.find('$$')
+			fullname = p if container is None else str(container) + '.' + p
+			nxt = containers.get(fullname)
+			if nxt is None:
+				nxt = containers[fullname] = ctype(fullname)
+				if self._tree is not None:
+					setattr(self._tree if container is None else container, p, nxt)
+			assert isinstance(nxt, ctype), nxt
+			container = nxt
+		return container
+
+	def tree(self):
+		''' returns the JavaHierarchy of all names. '''
+		tree = self._tree
+		if tree is None:
+			tree = JavaHierarchy()
+			containers = self.containers
+			for fullname, container in containers.items():
+				outer, _, p = fullname.rpartition('.')
+				# outer names are always added before the names within them
+				setattr(containers[outer] if outer else tree, p, container)
+			self._tree = tree
+		return tree
+
 class Ref(object):
 	''' A reference to an object, where the reference type is different from the
 	object type.
@@ -187,6 +471,25 @@ def cast(obj, desired=None):
 	return Ref(obj, desired)
 
 
+class _DeferredRef(int):
+	''' Used to seperate int values from ref values that should be resolved when
+	the heap is complete. Not expected to be used by outsiders. '''
+	__slots__ = ()
+
+
+class Excluded(int):
+	''' A reference to an object that was not loaded, because of the `include`
+	filter passed to `hprof.open()`. The value is the object id.
+
+	>>> Excluded(0x1234)
+	<excluded object 0x1234>
+	'''
+	__slots__ = ()
+
+	def __repr__(self):
+		return '<excluded object 0x%x>' % self
+
+
 class JavaClassContainer(object):
 	''' Common ancestor of JavaPackage and JavaClassName. '''
 
@@ -231,6 +534,15 @@ class JavaObject(object):
 	def __init__(self, objid):
 		JavaObject._hprof_id.__set__(self, objid)
 
+	def __setattr__(self, name, value):
+		# instance fields live in slots, but are read-only like everything else.
+		if not name.startswith('_hprof'):
+			raise AttributeError('%r object attribute %r is read-only' % (type(self).__name__, name))
+		object.__setattr__(self, name, value)
+
+	def __delattr__(self, name):
+		raise AttributeError('%r object attribute %r is read-only' % (type(self).__name__, name))
+
 	def __str__(self):
 		objid = JavaObject._hprof_id.__get__(self)
 		simple_name = type(self).__name__
@@ -268,9 +580,12 @@ class JavaObject(object):
 			t = reftype
 		while t is not JavaObject:
 			if name in t._hprof_ifieldix:
-				ix = t._hprof_ifieldix[name]
-				vals = t._hprof_ifieldvals.__get__(self)
-				return vals[ix]
+				slot = t._hprof_ifieldslots[t._hprof_ifieldix[name]]
+				val = slot.__get__(self)
+				if type(val) is _DeferredRef: # pylint: disable=unidiomatic-typecheck
+					val = t._hprof_heap._resolve(val)
+					slot.__set__(self, val)
+				return val
 			elif name in t._hprof_sfields:
 				return t._hprof_sfields[name]
 			bases = t.__bases__
@@ -296,22 +611,30 @@ class JavaArray(JavaObject):
 		self._hprof_array_data = array_data
 
 	def __len__(self):
+		data = self._hprof_array_data
 		try:
 			# TODO: may be a good idea to make len() work on deferred array data
-			return len(self._hprof_array_data)
+			return len(data)
 		except TypeError:
-			self._hprof_array_data = self._hprof_array_data.toarray()
-			return len(self._hprof_array_data)
+			return len(self._hprof_materialize())
 
 	def __getitem__(self, ix):
+		data = self._hprof_array_data
 		try:
-			return self._hprof_array_data[ix]
+			return data[ix]
 		except TypeError:
-			try:
-				self._hprof_array_data = self._hprof_array_data.toarray()
-			except AttributeError:
-				pass # the TypeError was the caller's fault, not ours
-			return self._hprof_array_data[ix]
+			if type(data) is not _DeferredArrayData: # pylint: disable=unidiomatic-typecheck
+				raise # the TypeError was the caller's fault, not ours
+		return self._hprof_materialize()[ix]
+
+	def _hprof_materialize(self):
+		''' replaces deferred array data with the real array, once, even if
+		several threads get here at the same time; returns the array. '''
+		with _materialize_lock:
+			data = self._hprof_array_data
+			if type(data) is _DeferredArrayData: # pylint: disable=unidiomatic-typecheck
+				data = self._hprof_array_data = data.toarray()
+		return data
 
 	def __str__(self):
 		typename = super().__str__().rsplit('@',1)[0]
@@ -331,7 +654,7 @@ class JavaClass(type):
 
 	__slots__ = ()
 
-	def __new__(mcs, name, supercls, static_attrs, iattr_names, iattr_types):
+	def __new__(mcs, name, supercls, static_attrs, iattr_names, iattr_types, lazy_refs=False):
 		assert '.' not in name
 		assert '/' not in name or name.find('/') >= name.find('$$')
 		assert '$' not in name or name.find('$') >= name.find('$$')
@@ -343,21 +666,41 @@ class JavaClass(type):
 		if supercls is None:
 			supercls = JavaObject
 		if mcs is JavaArrayClass and not isinstance(supercls, JavaArrayClass):
-			slots = ('_hprof_ifieldvals', '_hprof_array_data')
+			slots = ['_hprof_array_data']
 			superclasses = (JavaArray,supercls)
 		else:
-			slots = ('_hprof_ifieldvals',)
+			slots = []
 			superclasses = (supercls,)
-		cls = super().__new__(mcs, name, superclasses, {
-			'__slots__': slots,
-		})
+		fieldslots = ['_hprof_f%d' % ix for ix in range(len(iattr_names))]
+		ifieldix = {name:ix for ix, name in enumerate(iattr_names)}
+		namespace = {
+			'__slots__': tuple(slots + fieldslots),
+			'_hprof_pre': None,
+			'_hprof_last': None,
+			'_hprof_classlike': False,
+		}
+		from ._fields import FieldValues, InstanceField, LazyRefField, StaticField, instance_field
+		for fname, ix in ifieldix.items():
+			if fname.startswith('__') or fname.startswith('_hprof'):
+				continue # left to JavaObject.__getattr__()
+			if lazy_refs and iattr_types[ix].name == 'object':
+				namespace[fname] = LazyRefField(fieldslots[ix])
+			else:
+				namespace[fname] = InstanceField(fieldslots[ix])
+		# statics hide instance fields of the same name in superclasses
+		for sname in static_attrs:
+			if sname not in namespace and instance_field(supercls, sname):
+				namespace[sname] = StaticField(static_attrs, sname)
+		cls = super().__new__(mcs, name, superclasses, namespace)
 		cls._hprof_sfields = static_attrs
-		cls._hprof_ifieldix = {name:ix for ix, name in enumerate(iattr_names)}
+		cls._hprof_ifieldix = ifieldix
 		cls._hprof_ifieldtypes = iattr_types
+		cls._hprof_ifieldslots = tuple(cls.__dict__[slot] for slot in fieldslots)
+		cls._hprof_ifieldvals = FieldValues(cls._hprof_ifieldslots)
 		return cls
 
-	def __init__(cls, name, supercls, static_attrs, iattr_names, iattr_types):
-		del supercls, static_attrs, iattr_names, iattr_types # unused
+	def __init__(cls, name, supercls, static_attrs, iattr_names, iattr_types, lazy_refs=False):
+		del supercls, static_attrs, iattr_names, iattr_types, lazy_refs # unused
 		super().__init__(name, None, None)
 
 	def __str__(cls):
@@ -369,13 +712,28 @@ class JavaClass(type):
 		return "<JavaClass '%s'>" % str(cls)
 
 	def __instancecheck__(cls, instance):
-		if type(instance) is Ref: # pylint: disable=unidiomatic-typecheck
+		t = type(instance)
+		if t is Ref:
 			instance = Ref._target.__get__(instance)
-		if type(instance) is JavaClass: # pylint: disable=unidiomatic-typecheck
+			t = type(instance)
+		if t is JavaClass and cls._hprof_classlike:
 			# not pretty...
-			if str(cls) in ('java.lang.Object', 'java.lang.Class'):
-				return True
-		return super().__instancecheck__(instance)
+			return True
+		# the C check walks the MRO faster than comparing class numbers here
+		return type.__instancecheck__(cls, instance)
+
+	def __subclasscheck__(cls, subclass):
+		pre = getattr(subclass, '_hprof_pre', None)
+		if pre is not None and cls._hprof_pre is not None and isinstance(subclass, JavaClass):
+			return cls._hprof_pre <= pre <= cls._hprof_last
+		return super().__subclasscheck__(subclass)
+
+	def _hprof_super(cls):
+		''' returns the Java superclass, or None if cls has none. '''
+		supercls = cls.__bases__[-1]
+		if isinstance(supercls, JavaClass):
+			return supercls
+		return None
 
 	def __getattr__(cls, name):
 		t = cls
@@ -386,6 +744,8 @@ class JavaClass(type):
 		raise AttributeError('type %r has no static attribute %r' % (cls, name))
 
 
+_materialize_lock = _threading.Lock()
+
 class _DeferredArrayData(object):
 	__slots__ = ('bytes', 'jtype')
 
@@ -413,6 +773,34 @@ class _DeferredArrayData(object):
 			fmt = '>%d%s' % (count, self.jtype.packfmt)
 			return struct.unpack(fmt, self.bytes)
 
+class _ObjectArrayData(object):
+	''' Object array elements that are still ids in the file data. They are
+	looked up in the heap the first time any of them is read, and kept. '''
+	__slots__ = ('heap', 'offset', 'length', 'elems')
+
+	def __init__(self, heap, offset, length):
+		self.heap = heap
+		self.offset = offset
+		self.length = length
+		self.elems = None
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, ix):
+		elems = self.elems
+		if elems is None:
+			elems = self.elems = tuple(map(self.heap._resolve, self.ids()))
+		return elems[ix]
+
+	def ids(self):
+		''' returns the element ids in an integer array; 0 for null. '''
+		from ._parsing import decode_ids
+		idsize = self.heap._idsize
+		start = self.offset
+		return decode_ids(self.heap._data[start:start + self.length * idsize], idsize)
+
+
 class JavaArrayClass(JavaClass):
 	''' Base class for all Java array classes. '''
 	__slots__ = ()
@@ -461,7 +849,9 @@ _NAME_TO_TYPECHAR = {
 }
 
 
-def _create_class(container, name, supercls, staticattrs, iattr_names, iattr_types):
+def _split_class_name(name):
+	''' splits a class name, as found in hprof files, into a list of package
+	names and a list of (nested) class names. '''
 	# android hprofs may have slightly different class name format...
 	if '.' in name:
 		name = name.replace('.', '/')
@@ -504,7 +894,7 @@ def _create_class(container, name, supercls, staticattrs, iattr_names, iattr_typ
 		extra = ''
 
 	name = name.split('/')
-	container = _get_or_create_container(container, name[:-1], JavaPackage)
+	packages = name[:-1]
 	if name[-1].startswith('$'):
 		name = name[-1:]
 	else:
@@ -512,15 +902,39 @@ def _create_class(container, name, supercls, staticattrs, iattr_names, iattr_typ
 	if extra:
 		name[-1] += extra
 	name[-1] += nests * '[]'
-	container = _get_or_create_container(container, name[:-1], JavaClassName) # pylint: disable=redefined-variable-type
-	classname = _get_or_create_container(container, name[-1:], JavaClassName)
-	name = name[-1]
+	return packages, name
+
+def _class_name(name):
+	''' returns the Java name of a class, as found in hprof files.
+
+	>>> _class_name('[Ljava/util/HashMap$Node;')
+	'java.util.HashMap.Node[]'
+	>>> _class_name('[[I')
+	'int[][]'
+	'''
+	packages, name = _split_class_name(name)
+	return '.'.join(packages + name)
+
+def _create_class(container, name, supercls, staticattrs, iattr_names, iattr_types, lazy_refs=False):
+	''' creates a class. container is a heap's _ClassNames, or the root of a
+	name hierarchy (such as a JavaHierarchy) to add the class name to. '''
+	if isinstance(container, _ClassNames):
+		name, container, classname = container.lookup(name)
+	else:
+		packages, name = _split_class_name(name)
+		container = _get_or_create_container(container, packages, JavaPackage)
+		container = _get_or_create_container(container, name[:-1], JavaClassName) # pylint: disable=redefined-variable-type
+		classname = _get_or_create_container(container, name[-1:], JavaClassName)
+		name = name[-1]
+	nests = name.count('[]')
 	if nests:
-		cls = JavaArrayClass(name, supercls, staticattrs, iattr_names, iattr_types)
+		cls = JavaArrayClass(name, supercls, staticattrs, iattr_names, iattr_types, lazy_refs)
 	else:
-		cls = JavaClass(name, supercls, staticattrs, iattr_names, iattr_types) # pylint: disable=redefined-variable-type
+		cls = JavaClass(name, supercls, staticattrs, iattr_names, iattr_types, lazy_refs) # pylint: disable=redefined-variable-type
 	if isinstance(container, JavaClassContainer):
 		type.__setattr__(cls, '__module__', container)
 	else:
 		type.__setattr__(cls, '__module__', None)
+	if classname in ('java.lang.Object', 'java.lang.Class'):
+		type.__setattr__(cls, '_hprof_classlike', True)
 	return classname, cls
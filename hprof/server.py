@@ -0,0 +1,399 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+A long-running server that keeps parsed hprof files in memory, so that they
+can be queried repeatedly without paying the parsing cost each time.
+
+Start it with `python -m hprof serve`, then query it with a `Client`:
+
+    with hprof.server.Client('/tmp/hprof.sock') as client:
+        for name, count in client.histogram('dump.hprof', limit=10):
+            print(count, name)
+
+Requests and responses are JSON objects, one per line. A request names an
+operation and its arguments, e.g. `{"op": "histogram", "path": "dump.hprof"}`.
+A response is either `{"ok": true, "result": ...}` or
+`{"ok": false, "error": "...", "type": "KeyError"}`.
+
+Loaded files are kept in a least-recently-used cache. When the estimated memory
+cost of all loaded files exceeds the memory budget, the least recently used
+files are closed, until the budget is met or only one file remains.
+'''
+
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from collections import OrderedDict
+
+from . import _parsing
+from . import _scan
+from .error import RemoteError
+from .heap import JavaArray, JavaClass, JavaObject
+
+# A rough average of the memory used per heap object, on top of the file data
+# itself: the Python object, its field tuples and its heap dict entry.
+_OBJECT_COST = 200
+
+
+class HeapCache(object):
+	''' Keeps up to `memory_budget` bytes (estimated) worth of loaded hprof
+	files open. Unlimited if memory_budget is None. '''
+
+	def __init__(self, memory_budget=None, log=None):
+		self.memory_budget = memory_budget
+		self._log = log
+		self._entries = OrderedDict() # realpath -> _CacheEntry, LRU first
+
+	def get(self, path):
+		''' returns the HprofFile for path, loading it if necessary. '''
+		key = os.path.realpath(path)
+		mtime = os.stat(key).st_mtime_ns
+		entry = self._entries.get(key)
+		if entry is not None:
+			if entry.mtime == mtime:
+				self._entries.move_to_end(key)
+				return entry.hf
+			self.evict(key)
+		entry = self._load(key, mtime)
+		self._entries[key] = entry
+		self._shrink()
+		return entry.hf
+
+	def loaded(self, path):
+		''' returns the HprofFile for path if it is loaded and up to date, or
+		None. Does not load anything. '''
+		key = os.path.realpath(path)
+		entry = self._entries.get(key)
+		if entry is None or entry.mtime != os.stat(key).st_mtime_ns:
+			return None
+		self._entries.move_to_end(key)
+		return entry.hf
+
+	def _load(self, key, mtime):
+		datasize = 0
+		def progress(label, _done, total):
+			nonlocal datasize
+			if label == 'parsing' and total:
+				datasize = total
+		if self._log:
+			self._log('loading %s' % key)
+		hf = _parsing.open(key, progress)
+		nobjects = sum(len(heap) for heap in hf.heaps)
+		cost = datasize + nobjects * _OBJECT_COST
+		if self._log:
+			self._log('loaded %s; %d objects, estimated cost %d bytes' % (key, nobjects, cost))
+		return _CacheEntry(hf, mtime, cost)
+
+	def _shrink(self):
+		if self.memory_budget is None:
+			return
+		while len(self._entries) > 1 and self.cost() > self.memory_budget:
+			key = next(iter(self._entries))
+			self.evict(key)
+
+	def evict(self, path):
+		''' closes path, if it is loaded. Returns True if it was. '''
+		key = os.path.realpath(path)
+		entry = self._entries.pop(key, None)
+		if entry is None:
+			return False
+		if self._log:
+			self._log('evicting %s' % key)
+		entry.hf.close()
+		return True
+
+	def cost(self):
+		''' returns the estimated memory cost of all loaded files. '''
+		return sum(entry.cost for entry in self._entries.values())
+
+	def status(self):
+		''' returns a list of (path, estimated cost), least recently used first. '''
+		return [(key, entry.cost) for key, entry in self._entries.items()]
+
+	def close(self):
+		''' closes all loaded files. '''
+		while self._entries:
+			self.evict(next(iter(self._entries)))
+
+
+class _CacheEntry(object):
+	__slots__ = ('hf', 'mtime', 'cost')
+
+	def __init__(self, hf, mtime, cost):
+		self.hf = hf
+		self.mtime = mtime
+		self.cost = cost
+
+
+def describe(value):
+	''' returns a JSON-friendly description of a heap value. '''
+	if isinstance(value, JavaClass):
+		return {'type': 'java.lang.Class', 'str': str(value)}
+	if isinstance(value, JavaObject):
+		out = {
+			'id': JavaObject._hprof_id.__get__(value),
+			'type': str(type(value)),
+			'str': str(value),
+		}
+		if isinstance(value, JavaArray):
+			out['length'] = len(value)
+		return out
+	return value
+
+
+class Server(object):
+	''' Answers queries about hprof files on a local socket.
+
+	`address` is either a path, for a unix domain socket, or a (host, port)
+	tuple for a TCP socket; the host should be a loopback address, since there
+	is no authentication.
+
+	Requests are handled one at a time, but several clients may be connected.
+	'''
+
+	def __init__(self, address, memory_budget=None, log=None):
+		self.cache = HeapCache(memory_budget, log)
+		self._lock = threading.Lock()
+		self._log = log
+		if isinstance(address, str):
+			_remove_stale_socket(address)
+			base = socketserver.ThreadingUnixStreamServer
+		else:
+			base = socketserver.ThreadingTCPServer
+		class _SocketServer(base):
+			daemon_threads = True
+			allow_reuse_address = True
+		self._server = _SocketServer(address, _make_handler(self))
+		self.address = self._server.server_address
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, tb):
+		self.close()
+
+	def serve_forever(self):
+		''' handles requests until `shutdown()` is called. '''
+		self._server.serve_forever()
+
+	def shutdown(self):
+		''' makes `serve_forever()` return. Must be called from another thread. '''
+		self._server.shutdown()
+
+	def close(self):
+		''' closes the socket and all loaded files. '''
+		self._server.server_close()
+		if isinstance(self.address, str):
+			try:
+				os.unlink(self.address)
+			except FileNotFoundError:
+				pass
+		with self._lock:
+			self.cache.close()
+
+	def handle(self, request):
+		''' handles one decoded request, returning the decoded response. '''
+		try:
+			args = dict(request)
+			op = args.pop('op')
+			fn = getattr(self, 'op_' + op, None)
+			if fn is None:
+				raise ValueError('unknown op %r' % op)
+			with self._lock:
+				result = fn(**args)
+			return {'ok': True, 'result': result}
+		except Exception as e: # pylint: disable=broad-except
+			return {'ok': False, 'error': str(e), 'type': type(e).__name__}
+
+	def _heaps(self, path):
+		return self.cache.get(path).heaps
+
+	def op_status(self):
+		''' the loaded files and their estimated costs. '''
+		return {
+			'memory_budget': self.cache.memory_budget,
+			'files': self.cache.status(),
+		}
+
+	def op_load(self, path):
+		''' loads path, if it isn't already; returns the number of objects. '''
+		return sum(len(heap) for heap in self._heaps(path))
+
+	def op_evict(self, path):
+		''' closes path; returns whether it was loaded. '''
+		return self.cache.evict(path)
+
+	def op_histogram(self, path, limit=None):
+		''' [class name, instance count] pairs, the most common classes first.
+		A file that is not already loaded is scanned, not loaded. '''
+		hf = self.cache.loaded(path)
+		if hf is None:
+			counts = {name: count for name, (count, _) in _scan.histogram(path).items()}
+		else:
+			counts = {}
+			for heap in hf.heaps:
+				for name, classes in heap.classes.items():
+					name = str(name)
+					count = sum(heap.count(cls) for cls in classes)
+					if count:
+						counts[name] = counts.get(name, 0) + count
+		out = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+		return out[:limit]
+
+	def op_instances(self, path, cls, subclasses=True, limit=100):
+		''' the total count and (up to limit) ids of instances of a class. '''
+		count = 0
+		ids = []
+		for heap in self._heaps(path):
+			if cls not in heap.classes:
+				continue
+			count += heap.count(cls, subclasses)
+			if subclasses:
+				instances = heap.all_instances(cls)
+			else:
+				instances = heap.exact_instances(cls)
+			for obj in instances:
+				if limit is not None and len(ids) >= limit:
+					break
+				if not isinstance(obj, JavaClass):
+					ids.append(JavaObject._hprof_id.__get__(obj))
+		return {'count': count, 'ids': ids}
+
+	def op_strings(self, path, contains=None, limit=100):
+		''' [id, text] pairs of java.lang.String objects. '''
+		out = []
+		for heap in self._heaps(path):
+			if 'java.lang.String' not in heap.classes:
+				continue
+			for s in heap.exact_instances('java.lang.String'):
+				if limit is not None and len(out) >= limit:
+					return out
+				text = str(s)
+				if contains is None or contains in text:
+					out.append((JavaObject._hprof_id.__get__(s), text))
+		return out
+
+	def op_follow(self, path, id, attrs=()): # pylint: disable=redefined-builtin
+		''' follows attribute names and array indexes from the object with the
+		given id, and describes the value at the end. '''
+		for heap in self._heaps(path):
+			if id in heap:
+				value = heap[id]
+				break
+		else:
+			raise KeyError('no object with id 0x%x' % id)
+		for attr in attrs:
+			if isinstance(attr, int):
+				value = value[attr]
+			else:
+				value = getattr(value, attr)
+		return describe(value)
+
+
+def _remove_stale_socket(path):
+	''' removes a socket file left behind by a server that is no longer running. '''
+	if not os.path.exists(path):
+		return
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(path)
+	except ConnectionRefusedError:
+		os.unlink(path)
+	finally:
+		sock.close()
+
+
+def _make_handler(server):
+	class _Handler(socketserver.StreamRequestHandler):
+		def handle(self):
+			for line in self.rfile:
+				try:
+					request = json.loads(line)
+				except ValueError as e:
+					response = {'ok': False, 'error': str(e), 'type': type(e).__name__}
+				else:
+					response = server.handle(request)
+				self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+				self.wfile.flush()
+	return _Handler
+
+
+class Client(object):
+	''' Talks to a running `Server`. `address` is the same as for the server.
+
+	Failed requests raise `hprof.error.RemoteError`.
+	'''
+
+	def __init__(self, address):
+		if isinstance(address, str):
+			self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		else:
+			self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		try:
+			self._sock.connect(address)
+		except:
+			self._sock.close()
+			raise
+		self._rfile = self._sock.makefile('rb')
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, tb):
+		self.close()
+
+	def close(self):
+		''' closes the connection. '''
+		self._rfile.close()
+		self._sock.close()
+
+	def request(self, op, **args):
+		''' sends one request and returns its result. '''
+		args['op'] = op
+		self._sock.sendall(json.dumps(args).encode('utf-8') + b'\n')
+		line = self._rfile.readline()
+		if not line:
+			raise RemoteError('connection closed by server')
+		response = json.loads(line)
+		if not response['ok']:
+			raise RemoteError('%s: %s' % (response['type'], response['error']))
+		return response['result']
+
+	def status(self):
+		''' returns a dict with the server's memory budget and loaded files. '''
+		return self.request('status')
+
+	def load(self, path):
+		''' makes the server load path; returns its number of objects. '''
+		return self.request('load', path=_abspath(path))
+
+	def evict(self, path):
+		''' makes the server close path; returns whether it was loaded. '''
+		return self.request('evict', path=_abspath(path))
+
+	def histogram(self, path, limit=None):
+		''' returns [class name, instance count] pairs, most common first. '''
+		return self.request('histogram', path=_abspath(path), limit=limit)
+
+	def instances(self, path, cls, subclasses=True, limit=100):
+		''' returns a dict with the instance 'count' and (up to limit) 'ids'. '''
+		return self.request('instances', path=_abspath(path), cls=str(cls),
+				subclasses=subclasses, limit=limit)
+
+	def strings(self, path, contains=None, limit=100):
+		''' returns [id, text] pairs of strings, optionally containing a substring. '''
+		return self.request('strings', path=_abspath(path), contains=contains, limit=limit)
+
+	def follow(self, path, objid, *attrs):
+		''' describes the value reached by following attrs from an object;
+		each attr is a field name or an array index. '''
+		return self.request('follow', path=_abspath(path), id=objid, attrs=attrs)
+
+
+def _abspath(path):
+	# the server may have a different working directory.
+	return os.path.abspath(path)
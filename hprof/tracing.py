@@ -0,0 +1,127 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Records the stages of loading an hprof file as a timeline, which can be written
+in the Chrome trace event format and inspected in chrome://tracing, Perfetto, or
+any other viewer that understands it.
+
+A `ChromeTrace` is used as the progress callback:
+
+>>> import hprof
+>>> trace = hprof.tracing.ChromeTrace()
+>>> with hprof.open('testdata/example-java.hprof.bz2', trace):
+...     trace.finish()
+>>> for label, start, end in trace.spans():
+...     print(label)
+opening
+extracting
+parsing
+instantiating heap 1/1
+resolving stacktraces
+resolving heap 1/1
+setting up special cases
+
+The trace can then be written to a file with `trace.write('load.json')`.
+'''
+
+import json
+import os
+import threading
+import time
+
+
+class ChromeTrace(object):
+	''' A progress callback that turns progress reports into timestamped spans.
+
+	Each distinct progress label becomes one span, starting when the label is
+	first reported and ending when the next label is. The last span ends when
+	`finish()` is called; `write()` will do that for you if you haven't.
+
+	If `progress_callback` is supplied, all progress reports are forwarded to
+	it, so tracing can be combined with e.g. a progress bar.
+	'''
+
+	def __init__(self, progress_callback=None, clock=time.perf_counter):
+		self._forward = progress_callback
+		self._clock = clock
+		self._origin = clock()
+		self._pid = os.getpid()
+		self._tid = threading.get_ident()
+		self._spans = [] # (label, start, end)
+		self._counters = [] # (label, time, done, total)
+		self._current = None
+		self._current_start = None
+
+	def __call__(self, label, done, total):
+		now = self._clock() - self._origin
+		if label != self._current:
+			self._end(now)
+			self._current = label
+			self._current_start = now
+		if done is not None and total is not None:
+			self._counters.append((label, now, done, total))
+		if self._forward is not None:
+			self._forward(label, done, total)
+
+	def _end(self, now):
+		if self._current is not None:
+			self._spans.append((self._current, self._current_start, now))
+			self._current = None
+			self._current_start = None
+
+	def finish(self):
+		''' End the currently running span, if any. '''
+		self._end(self._clock() - self._origin)
+
+	def spans(self):
+		''' returns a list of all finished spans, as (label, start, end) tuples.
+		Times are in seconds, relative to when the trace was created. '''
+		return list(self._spans)
+
+	def events(self):
+		''' returns a list of all recorded events, as Chrome trace event dicts. '''
+		out = [{
+			'name': 'process_name',
+			'ph': 'M',
+			'pid': self._pid,
+			'tid': self._tid,
+			'args': {'name': 'hprof'},
+		}]
+		for label, start, end in self._spans:
+			out.append({
+				'name': label,
+				'cat': 'hprof',
+				'ph': 'X',
+				'ts': _micros(start),
+				'dur': _micros(end - start),
+				'pid': self._pid,
+				'tid': self._tid,
+			})
+		for label, when, done, total in self._counters:
+			out.append({
+				'name': label,
+				'cat': 'hprof',
+				'ph': 'C',
+				'ts': _micros(when),
+				'pid': self._pid,
+				'tid': self._tid,
+				'args': {'done': done, 'remaining': total - done},
+			})
+		return out
+
+	def write(self, out):
+		''' Write the trace as JSON. `out` may be a path or a text file. '''
+		self.finish()
+		doc = {
+			'traceEvents': self.events(),
+			'displayTimeUnit': 'ms',
+		}
+		if isinstance(out, (str, bytes, os.PathLike)):
+			with open(out, 'w', encoding='utf-8') as f:
+				json.dump(doc, f)
+		else:
+			json.dump(doc, out)
+
+def _micros(seconds):
+	return int(round(seconds * 1000000))
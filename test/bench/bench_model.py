@@ -0,0 +1,140 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+'''
+Microbenchmarks for the hot paths of the object model.
+
+Each benchmark is a function that takes a loaded `HprofFile`, and returns a
+tuple of (run, nops): `run` is a zero-argument callable that performs `nops`
+operations each time it is called. Use `_run_benchmarks.py` to run them.
+'''
+
+import hprof
+
+from hprof._parsing import jtype
+
+from ..unit.util import DumpBuilder
+
+FIXTURES = {}
+BENCHMARKS = []
+
+def fixture(fn):
+	''' registers a function returning the bytes or path of an hprof file. '''
+	FIXTURES[fn.__name__] = fn
+	return fn
+
+def benchmark(*fixtures):
+	''' registers a benchmark to be run on each of the named fixtures. '''
+	def register(fn):
+		for name in fixtures:
+			BENCHMARKS.append((fn.__name__, name, fn))
+		return fn
+	return register
+
+
+@fixture
+def example_java():
+	return 'testdata/example-java.hprof.bz2'
+
+@fixture
+def synthetic():
+	''' a flat-ish heap with a deep class hierarchy, arrays and strings. '''
+	d = DumpBuilder(8)
+	objcls = d.basics()
+	base = d.cls('com.example.Base', objcls, (('root', jtype.int), ('rootref', jtype.object)))
+	mid = base
+	for depth in range(8):
+		mid = d.cls('com.example.Mid%d' % depth, mid, (('m%d' % depth, jtype.int),))
+	leaf = d.cls('com.example.Leaf', mid, (('leaf', jtype.long), ('next', jtype.object)))
+	leafarr = d.cls('com.example.Leaf[]', objcls)
+	prev = None
+	leaves = []
+	for i in range(5000):
+		prev = d.obj(leaf, i, prev, *range(8), i, None)
+		leaves.append(prev)
+	for i in range(200):
+		d.objarray(leafarr, leaves[i:i+100])
+		d.primarray(jtype.int, list(range(i, i+100)))
+	for i in range(2000):
+		d.string('string number %d' % i)
+	return d.build(segments=4)
+
+
+def _objects(hf, clsname):
+	heap, = hf.heaps
+	return list(heap.all_instances(clsname))
+
+@benchmark('synthetic')
+def getattr_leaf_field(hf):
+	objs = _objects(hf, 'com.example.Leaf')
+	def run():
+		for o in objs:
+			o.leaf # pylint: disable=pointless-statement
+	return run, len(objs)
+
+@benchmark('synthetic')
+def getattr_root_field(hf):
+	objs = _objects(hf, 'com.example.Leaf')
+	def run():
+		for o in objs:
+			o.root # pylint: disable=pointless-statement
+	return run, len(objs)
+
+@benchmark('example_java')
+def getattr_vehicle_make(hf):
+	objs = _objects(hf, 'com.example.cars.Vehicle')
+	def run():
+		for o in objs:
+			o.make # pylint: disable=pointless-statement
+	return run, len(objs)
+
+@benchmark('synthetic', 'example_java')
+def all_instances_object(hf):
+	heap, = hf.heaps
+	n = len(heap)
+	def run():
+		for _ in heap.all_instances('java.lang.Object'):
+			pass
+	return run, n
+
+@benchmark('synthetic', 'example_java')
+def count_object_subclasses(hf):
+	heap, = hf.heaps
+	def run():
+		heap.count('java.lang.Object', subclasses=True)
+	return run, 1
+
+@benchmark('synthetic')
+def all_instances_leaf(hf):
+	heap, = hf.heaps
+	def run():
+		for _ in heap.all_instances('com.example.Leaf'):
+			pass
+	return run, 1
+
+@benchmark('synthetic', 'example_java')
+def primarray_getitem(hf):
+	arrays = _objects(hf, 'int[]')
+	pairs = [(a, ix) for a in arrays for ix in range(len(a))]
+	def run():
+		for a, ix in pairs:
+			a[ix] # pylint: disable=pointless-statement
+	return run, len(pairs)
+
+@benchmark('synthetic', 'example_java')
+def objarray_getitem(hf):
+	arrays = _objects(hf, 'java.lang.Object')
+	arrays = [a for a in arrays if isinstance(a, hprof.heap.JavaArray) and len(a) and not isinstance(a[0], (int, float, str))]
+	pairs = [(a, ix) for a in arrays for ix in range(len(a))]
+	def run():
+		for a, ix in pairs:
+			a[ix] # pylint: disable=pointless-statement
+	return run, len(pairs)
+
+@benchmark('synthetic', 'example_java')
+def string_to_str(hf):
+	strings = _objects(hf, 'java.lang.String')
+	def run():
+		for s in strings:
+			str(s)
+	return run, len(strings)
@@ -0,0 +1,201 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+import hprof
+
+from concurrent.futures import Executor, Future
+from unittest.mock import MagicMock, patch
+
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+EXAMPLE = 'testdata/example-java.hprof.bz2'
+
+def open_fds():
+	return len(os.listdir('/proc/self/fd'))
+
+def cancel_at(stage):
+	def progress(label, done, total):
+		if label.startswith(stage):
+			raise hprof.error.Cancelled()
+	return progress
+
+class DeferredExecutor(Executor):
+	''' runs submitted work only when run() is called. '''
+
+	def __init__(self):
+		self.work = None
+
+	def submit(self, fn, *args, **kwargs): # pylint: disable=arguments-differ
+		self.work = Future(), fn, args
+		return self.work[0]
+
+	def run(self):
+		future, fn, args = self.work
+		try:
+			future.set_result(fn(*args))
+		except Exception as e: # pylint: disable=broad-except
+			future.set_exception(e)
+
+class TestCancelledParse(unittest.TestCase):
+	''' A Cancelled error from the progress callback must let go of the data. '''
+
+	def dump(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		cls = d.cls('com.example.Thing', objcls, (('ref', jtype.object),))
+		arr = d.primarray(jtype.int, [1, 2, 3])
+		d.obj(cls, arr)
+		return d.build()
+
+	def test_parse_bytes(self):
+		data = self.dump()
+		for stage in ('parsing', 'instantiating', 'resolving heap', 'setting up'):
+			with self.subTest(stage):
+				with self.assertRaises(hprof.error.Cancelled):
+					hprof.parse(data, cancel_at(stage))
+
+	@unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc/self/fd')
+	def test_open_compressed(self):
+		before = open_fds()
+		for stage in ('extracting', 'parsing', 'instantiating', 'resolving heap'):
+			with self.subTest(stage):
+				with self.assertRaises(hprof.error.Cancelled):
+					hprof.open(EXAMPLE, cancel_at(stage))
+				self.assertEqual(open_fds(), before)
+
+
+class TestOpenAsync(unittest.IsolatedAsyncioTestCase):
+
+	async def test_await(self):
+		hf = await hprof.open_async(EXAMPLE)
+		with hf:
+			self.assertEqual(len(hf.heaps[0].classes['com.example.cars.Car']), 1)
+
+	async def test_events(self):
+		loader = hprof.open_async(EXAMPLE)
+		events = [event async for event in loader]
+		with await loader as hf:
+			self.assertEqual(len(hf.heaps), 1)
+		self.assertEqual(events[0], ('opening', None, None))
+		labels = [label for label, done, total in events]
+		self.assertIn('parsing', labels)
+		self.assertEqual(labels[-1], 'setting up special cases')
+		# iterating again after the end is fine
+		self.assertEqual([event async for event in loader], [])
+
+	async def test_event_loop_not_blocked(self):
+		ticks = 0
+		async def tick():
+			nonlocal ticks
+			while True:
+				ticks += 1
+				await asyncio.sleep(0)
+		ticker = asyncio.ensure_future(tick())
+		try:
+			hf = await hprof.open_async(EXAMPLE)
+			hf.close()
+		finally:
+			ticker.cancel()
+		self.assertGreater(ticks, 1)
+
+	@unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc/self/fd')
+	async def test_cancel_task(self):
+		before = open_fds()
+		loader = hprof.open_async(EXAMPLE)
+		async for label, done, total in loader:
+			if label == 'parsing':
+				break
+		task = asyncio.ensure_future(self._await(loader))
+		await asyncio.sleep(0)
+		task.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			await task
+		self.assertEqual(open_fds(), before)
+
+	@unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc/self/fd')
+	async def test_cancel_method(self):
+		before = open_fds()
+		loader = hprof.open_async(EXAMPLE)
+		async for label, done, total in loader:
+			if label == 'extracting':
+				loader.cancel()
+		with self.assertRaises(asyncio.CancelledError):
+			await loader
+		self.assertEqual(open_fds(), before)
+
+	async def _await(self, loader):
+		return await loader
+
+	async def test_parse_error(self):
+		with tempfile.NamedTemporaryFile(suffix='.hprof') as f:
+			f.write(b'JAVA PROFILE 9.9\0garbage')
+			f.flush()
+			loader = hprof.open_async(f.name)
+			with self.assertRaisesRegex(hprof.error.FormatError, 'unknown header'):
+				await loader
+			# the events still end
+			events = [event async for event in loader]
+			self.assertEqual(events[0], ('opening', None, None))
+
+	async def test_cancel_mid_parse(self):
+		parsing = threading.Event()
+		resume = threading.Event()
+		def fake_open(path, progress):
+			progress('parsing', 0, 2)
+			parsing.set()
+			resume.wait()
+			progress('parsing', 1, 2)
+			self.fail('should have been cancelled')
+		with patch('hprof._async._parsing.open', fake_open):
+			loader = hprof.open_async(EXAMPLE)
+			task = asyncio.ensure_future(self._await(loader))
+			self.assertEqual(await loader.__anext__(), ('parsing', 0, 2))
+			self.assertTrue(parsing.is_set())
+			task.cancel()
+			await asyncio.sleep(0)
+			resume.set()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+			self.assertEqual([event async for event in loader], [])
+
+	async def test_cancel_before_start(self):
+		loader = hprof.open_async(EXAMPLE)
+		loader.cancel()
+		with self.assertRaises(hprof.error.Cancelled):
+			await loader
+
+	async def test_cancel_while_finishing(self):
+		hf = MagicMock()
+		executor = DeferredExecutor()
+		with patch('hprof._async._parsing.open', return_value=hf):
+			loader = hprof.open_async(EXAMPLE, executor)
+			task = asyncio.ensure_future(self._await(loader))
+			while executor.work is None:
+				await asyncio.sleep(0)
+			task.cancel()
+			await asyncio.sleep(0)
+			executor.run() # opens the file, then notices the cancellation
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+		hf.close.assert_called_once_with()
+
+	async def test_cancel_after_finishing(self):
+		hf = MagicMock()
+		executor = DeferredExecutor()
+		with patch('hprof._async._parsing.open', return_value=hf):
+			loader = hprof.open_async(EXAMPLE, executor)
+			task = asyncio.ensure_future(self._await(loader))
+			while executor.work is None:
+				await asyncio.sleep(0)
+			executor.run() # done before the cancellation arrives
+			task.cancel()
+			with self.assertRaises(asyncio.CancelledError):
+				await task
+		hf.close.assert_called_once_with()
@@ -0,0 +1,136 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import os
+import shutil
+import tempfile
+import unittest
+import hprof
+
+from unittest import mock
+
+from hprof import _checkpoint
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+class Killed(Exception):
+	pass
+
+def dump():
+	d = DumpBuilder()
+	objcls = d.basics()
+	node = d.cls('com.example.Node', objcls, (('next', jtype.object), ('n', jtype.int)))
+	nodearr = d.cls('[Lcom/example/Node;', objcls)
+	prev = None
+	nodes = []
+	for i in range(20):
+		prev = d.obj(node, prev, i)
+		nodes.append(prev)
+	d.objarray(nodearr, nodes)
+	d.primarray(jtype.int, list(range(10)))
+	# a class dumped after its subclass, in a later segment
+	base = d.cls('com.example.Base', objcls, (('b', jtype.int),))
+	d.obj(base, 7)
+	return d.build(segments=8)
+
+def describe(hf):
+	heap, = hf.heaps
+	out = {}
+	for obj in heap.values():
+		if isinstance(obj, hprof.heap.JavaClass):
+			out[str(obj)] = 'class'
+		else:
+			out[hprof.heap.JavaObject._hprof_id.__get__(obj)] = str(obj)
+	return out, sorted(heap.count(cls) for cls in heap._instances)
+
+class TestCheckpoint(unittest.TestCase):
+
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'dump.hprof')
+		with open(self.path, 'wb') as f:
+			f.write(dump())
+		self.state = self.path + '.checkpoint'
+		with hprof.open(self.path) as hf:
+			self.expected = describe(hf)
+		patcher = mock.patch('hprof._parsing._CHECKPOINT_SPACING', 0)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def kill_after_saves(self, n):
+		real_save = _checkpoint.save
+		calls = 0
+		def save(*args):
+			nonlocal calls
+			real_save(*args)
+			calls += 1
+			if calls == n:
+				raise Killed()
+		with mock.patch('hprof._checkpoint.save', side_effect=save):
+			with self.assertRaises(hprof.error.UnhandledError) as caught:
+				hprof.open(self.path, checkpoint=True)
+		self.assertIsInstance(caught.exception.__cause__, Killed)
+		self.assertTrue(os.path.exists(self.state))
+
+	def resume(self):
+		progress = []
+		with hprof.open(self.path, lambda *args: progress.append(args), resume=True) as hf:
+			self.assertEqual(describe(hf), self.expected)
+		self.assertFalse(os.path.exists(self.state))
+		return [args for args in progress if args[0] == 'resuming']
+
+	def test_resume_mid_parse(self):
+		for n in range(1, 8):
+			with self.subTest(saves=n):
+				self.kill_after_saves(n)
+				resumed, = self.resume()
+				self.assertLess(resumed[1], resumed[2])
+
+	def test_resume_before_instantiating(self):
+		def progress(label, done, total):
+			if label.startswith('instantiating'):
+				raise Killed()
+		with self.assertRaises(hprof.error.UnhandledError):
+			hprof.open(self.path, progress, checkpoint=True)
+		(label, done, total), = self.resume()
+		self.assertEqual(done, total)
+
+	def test_resume_without_progress(self):
+		self.kill_after_saves(2)
+		with hprof.open(self.path, resume=True) as hf:
+			self.assertEqual(describe(hf), self.expected)
+		self.assertFalse(os.path.exists(self.state))
+
+	def test_no_state(self):
+		self.assertEqual(self.resume(), [])
+
+	def test_other_file(self):
+		self.kill_after_saves(3)
+		with open(self.path, 'ab') as f:
+			f.write(b'\x0d\0\0\0\0\0\0\0\0') # an empty CPU SAMPLES record
+		with hprof.open(self.path, resume=True) as hf:
+			self.assertEqual(len(hf.heaps), 1)
+			self.assertEqual(hf.unhandled, {0x0d: 1})
+		self.assertFalse(os.path.exists(self.state))
+
+	def test_garbage_state(self):
+		with open(self.state, 'wb') as f:
+			f.write(b'not a checkpoint')
+		self.assertEqual(self.resume(), [])
+
+	def test_no_records(self):
+		with open(self.path, 'wb') as f:
+			f.write(DumpBuilder().build()[:31]) # just the header
+		with hprof.open(self.path, checkpoint=True) as hf:
+			self.assertEqual(hf.heaps, [])
+		self.assertFalse(os.path.exists(self.state))
+
+	def test_named_state_file(self):
+		state = os.path.join(self.dir, 'state')
+		with hprof.open(self.path, checkpoint=state) as hf:
+			self.assertEqual(describe(hf), self.expected)
+		self.assertFalse(os.path.exists(state))
@@ -4,6 +4,9 @@
 
 import unittest
 import hprof
+import hprof._heap_parsing
+
+from .util import Builder
 
 class TestClassInstanceLookups(unittest.TestCase):
 
@@ -32,6 +35,7 @@ class TestClassInstanceLookups(unittest.TestCase):
 		def mk(cls, *args):
 			obj = cls(*args)
 			self.heap._instances[cls].append(obj)
+			self.heap[args[0]] = obj
 			return obj
 
 		self.o1 = mk(self.objectCls1, 10)
@@ -149,3 +153,165 @@ class TestClassInstanceLookups(unittest.TestCase):
 				with self.subTest('all'):
 					self.assertCountEqual(self.heap.all_instances(key),
 							(self.la,))
+
+	def test_subclasses(self):
+		self.assertEqual(self.heap.subclasses(self.objectCls1), [
+				self.objectCls1, self.classCls, self.listCls, self.alistCls,
+				self.llistCls, self.parrayCls, self.oarrayCls, self.larrayCls])
+		self.assertEqual(self.heap.subclasses(self.objectCls2), [self.objectCls2])
+		self.assertEqual(self.heap.subclasses(self.listCls),
+				[self.listCls, self.alistCls, self.llistCls])
+		self.assertEqual(self.heap.subclasses(self.llistCls), [self.llistCls])
+		self.assertEqual(self.heap.subclasses(self.oarrayCls),
+				[self.oarrayCls, self.larrayCls])
+
+	def test_subclasses_foreign_class(self):
+		other = hprof.heap.Heap()
+		name, cls = hprof.heap._create_class(other.classtree, 'Foreign', None, {}, (), ())
+		with self.assertRaisesRegex(ValueError, 'not a class in this heap'):
+			self.heap.subclasses(cls)
+		with self.assertRaisesRegex(ValueError, 'not a class in this heap'):
+			self.heap.instance_mask(cls)
+
+	def test_numbered_foreign_class(self):
+		other = hprof.heap.Heap()
+		name, cls = hprof.heap._create_class(other.classtree, 'java.util.List', None, {}, (), ())
+		other.classes[name] = [cls]
+		other._instances[cls] = []
+		self.assertEqual(other.subclasses(cls), [cls])
+		self.heap.subclasses(self.objectCls1)
+		self.assertIsNotNone(cls._hprof_pre)
+		with self.assertRaisesRegex(ValueError, 'not a class in this heap'):
+			self.heap.subclasses(cls)
+		with self.assertRaisesRegex(ValueError, 'not a class in this heap'):
+			self.heap.instance_mask(cls)
+		with self.assertRaisesRegex(ValueError, 'not a class in this heap'):
+			self.heap.count(cls, subclasses=True)
+
+	def test_numbering(self):
+		self.heap.subclasses(self.objectCls1)
+		for sub in self.heap.subclasses(self.objectCls1):
+			self.assertLessEqual(self.objectCls1._hprof_pre, sub._hprof_pre)
+			self.assertLessEqual(sub._hprof_last, self.objectCls1._hprof_last)
+		self.assertGreater(self.objectCls2._hprof_pre, self.objectCls1._hprof_last)
+		self.assertEqual(self.llistCls._hprof_pre, self.llistCls._hprof_last)
+
+	def test_numbering_invalidated(self):
+		from hprof._parsing import ClassLoad, PrimitiveReader, HprofFile
+		self.heap.subclasses(self.objectCls1)
+		hf = HprofFile()
+		hf.classloads_by_id[0x55] = ClassLoad(0x55, 'java.util.Vector', 0)
+		self.heap[0x44] = self.listCls
+		data = (Builder(4)
+				.id(0x55)        # class object id
+				.u4(0)           # stacktrace serial
+				.id(0x44)        # superclass id
+				.id(0).id(0).id(0).id(0).id(0)
+				.u4(0)           # instance size
+				.u2(0).u2(0).u2(0)
+		)
+		hprof._heap_parsing.parse_class(hf, self.heap, PrimitiveReader(data, 4))
+		vector = self.heap[0x55]
+		self.assertEqual(self.heap.subclasses(self.listCls),
+				[self.listCls, self.alistCls, self.llistCls, vector])
+		self.assertTrue(issubclass(vector, self.listCls))
+
+	def test_isinstance(self):
+		self.heap.subclasses(self.objectCls1)
+		self.assertIsInstance(self.a1, self.listCls)
+		self.assertIsInstance(self.a1, self.objectCls1)
+		self.assertNotIsInstance(self.a1, self.objectCls2)
+		self.assertNotIsInstance(self.a1, self.llistCls)
+		self.assertNotIsInstance(self.l1, self.alistCls)
+		self.assertIsInstance(self.la, self.oarrayCls)
+		self.assertIsInstance(self.la, hprof.heap.JavaArray)
+		self.assertNotIsInstance(self.oa, self.larrayCls)
+		self.assertIsInstance(hprof.cast(self.a1, self.listCls), self.alistCls)
+		self.assertIsInstance(self.listCls, self.objectCls1)
+		self.assertIsInstance(self.listCls, self.classCls)
+		self.assertNotIsInstance(self.listCls, self.listCls)
+		self.assertNotIsInstance(3, self.objectCls1)
+
+	def test_issubclass(self):
+		self.heap.subclasses(self.objectCls1)
+		self.assertTrue(issubclass(self.alistCls, self.listCls))
+		self.assertTrue(issubclass(self.alistCls, self.alistCls))
+		self.assertFalse(issubclass(self.listCls, self.alistCls))
+		self.assertFalse(issubclass(self.alistCls, self.llistCls))
+		self.assertFalse(issubclass(self.alistCls, self.objectCls2))
+		self.assertTrue(issubclass(self.larrayCls, self.objectCls1))
+		self.assertFalse(issubclass(int, self.objectCls1))
+		self.assertFalse(issubclass(hprof.heap.JavaObject, self.objectCls1))
+
+	def test_separate_heaps(self):
+		other = hprof.heap.Heap()
+		_, foreign = hprof.heap._create_class(other.classtree, 'java.lang.Object', None, {}, (), ())
+		other.classes['java.lang.Object'] = [foreign]
+		other.subclasses(foreign)
+		self.heap.subclasses(self.objectCls1)
+		self.assertFalse(issubclass(foreign, self.objectCls1))
+		self.assertFalse(issubclass(self.alistCls, foreign))
+		self.assertNotIsInstance(self.a1, foreign)
+
+	def test_instance_mask(self):
+		objs = list(self.heap.values())
+		def masked(key):
+			mask = self.heap.instance_mask(key)
+			self.assertEqual(len(mask), len(objs))
+			return [obj for obj, bit in zip(objs, mask) if bit]
+		self.assertCountEqual(masked(self.listCls), (self.l1, self.l2, self.a1, self.a2))
+		self.assertCountEqual(masked('java.util.ArrayList'), (self.a1, self.a2))
+		self.assertCountEqual(masked(self.llistCls), ())
+		self.assertCountEqual(masked(self.oarrayCls), (self.oa, self.la))
+		self.assertCountEqual(masked('java.lang.Object'), objs)
+		self.assertCountEqual(masked(self.objectCls2), (self.p1, self.p2))
+
+	def test_instance_mask_foreign_objects(self):
+		from hprof.heap import _create_class
+		other = hprof.heap.Heap()
+		_, numbered = _create_class(other.classtree, 'java.lang.Object', None, {}, (), ())
+		other.classes['java.lang.Object'] = [numbered]
+		other.subclasses(numbered)
+		_, unnumbered = _create_class(hprof.heap.JavaHierarchy(), 'Foreign', None, {}, (), ())
+		self.heap[1] = numbered(1)
+		self.heap[2] = unnumbered(2)
+		objs = list(self.heap.values())
+		mask = self.heap.instance_mask(self.objectCls1)
+		self.assertEqual(len(mask), len(objs))
+		self.assertEqual(sum(mask), len(objs) - 4) # all but the p and foreign objects
+		self.assertFalse(mask[objs.index(self.heap[1])])
+		self.assertFalse(mask[objs.index(self.heap[2])])
+
+	def test_instance_mask_classes(self):
+		for cls in (self.objectCls1, self.classCls, self.listCls):
+			self.heap[id(cls)] = cls
+		objs = list(self.heap.values())
+		mask = self.heap.instance_mask(self.classCls)
+		self.assertCountEqual([o for o, bit in zip(objs, mask) if bit],
+				(self.objectCls1, self.classCls, self.listCls))
+		mask = self.heap.instance_mask(self.objectCls1)
+		self.assertEqual(sum(mask), len(objs) - 2) # all but the p objects
+
+	def test_count(self):
+		keys = [cls for lst in self.heap.classes.values() for cls in lst]
+		keys += list(self.heap.classes.keys())
+		for key in keys:
+			with self.subTest(key=key):
+				self.assertEqual(self.heap.count(key),
+						len(list(self.heap.exact_instances(key))))
+				self.assertEqual(self.heap.count(key, subclasses=True),
+						len(list(self.heap.all_instances(key))))
+
+	def test_count_invalidated(self):
+		self.assertEqual(self.heap.count(self.listCls, subclasses=True), 4)
+		obj = self.llistCls(60)
+		self.heap._instances[self.llistCls].append(obj)
+		self.heap[60] = obj
+		self.assertEqual(self.heap.count(self.listCls, subclasses=True), 5)
+		self.assertEqual(self.heap.count(self.llistCls), 1)
+
+	def test_count_foreign_class(self):
+		from hprof.heap import _create_class
+		_, cls = _create_class(hprof.heap.JavaHierarchy(), 'Foreign', None, {}, (), ())
+		with self.assertRaises(ValueError):
+			self.heap.count(cls, subclasses=True)
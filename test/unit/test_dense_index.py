@@ -0,0 +1,120 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+def build():
+	d = DumpBuilder(8)
+	objcls = d.basics()
+	_, (leaf, mid) = d.nodes(objcls, 2, text=False)
+	holder = d.cls('com.example.Holder', objcls, (('node', jtype.object),))
+	holder = d.obj(holder, mid)
+	arrcls = d.cls('[Lcom/example/Node;', objcls)
+	arr = d.objarray(arrcls, [leaf, None, mid, leaf])
+	d.root(holder)
+	return d.build(), dict(leaf=leaf, mid=mid, holder=holder, arr=arr)
+
+
+class TestDenseIndex(unittest.TestCase):
+
+	def test_modes(self):
+		data, ids = build()
+		for budget in (None, 1 << 20):
+			with self.subTest(memory_budget=budget):
+				hf = hprof.parse(data, memory_budget=budget)
+				try:
+					heap, = hf.heaps
+					self.check(heap, ids)
+					del heap
+				finally:
+					hf.close()
+
+	def check(self, heap, ids):
+		self.assertEqual(sorted(heap.index_of(objid) for objid in heap), list(range(len(heap))))
+		for objid, obj in heap.items():
+			ix = heap.index_of(obj)
+			self.assertIs(heap.object_at(ix), obj)
+			self.assertEqual(heap.index_of(objid), ix)
+		order = [heap.object_at(ix) for ix in range(len(heap))]
+		self.assertEqual(order, [heap[objid] for objid in sorted(heap)])
+
+		offsets, targets = heap.reference_graph()
+		self.assertEqual(len(offsets), len(heap) + 1)
+		self.assertEqual(offsets[-1], len(targets))
+		def refs(objid):
+			ix = heap.index_of(objid)
+			return [heap.object_at(t) for t in targets[offsets[ix]:offsets[ix+1]]]
+		leaf, mid = heap[ids['leaf']], heap[ids['mid']]
+		self.assertEqual(refs(ids['leaf']), [])
+		self.assertEqual(refs(ids['mid']), [leaf])
+		self.assertEqual(refs(ids['holder']), [mid])
+		self.assertEqual(refs(ids['arr']), [leaf, mid, leaf])
+		del leaf, mid
+
+	def test_not_in_heap(self):
+		data, ids = build()
+		hf = hprof.parse(data)
+		other = hprof.parse(data)
+		try:
+			heap, = hf.heaps
+			stranger, = other.heaps
+			with self.assertRaises(KeyError):
+				heap.index_of(0x1234)
+			with self.assertRaises(KeyError):
+				heap.index_of(stranger[ids['leaf']])
+			with self.assertRaises(KeyError):
+				heap.index_of(type(stranger[ids['leaf']]))
+			with self.assertRaises(IndexError):
+				heap.object_at(len(heap))
+			del heap, stranger
+		finally:
+			hf.close()
+			other.close()
+
+	def test_refs_outside_heap(self):
+		d = DumpBuilder(8)
+		objcls = d.basics()
+		holder = d.cls('com.example.Holder', objcls, (('node', jtype.object),))
+		holder = d.obj(holder, 0xbad0)
+		with hprof.parse(d.build(), lazy_references=True) as hf:
+			heap, = hf.heaps
+			_, stranger = hprof.heap._create_class(hprof.heap.JavaHierarchy(), 'Stranger', None, {}, (), ())
+			statics = type(heap[holder])._hprof_sfields
+			statics['STRANGER'] = stranger
+			statics['INSTANCE'] = heap[holder]
+			offsets, targets = heap.reference_graph()
+			# neither the missing object nor the stranger
+			self.assertEqual(list(targets), [heap.index_of(holder)])
+			with self.assertRaises(KeyError):
+				heap.index_of('not an object')
+			del heap
+
+	def test_refs(self):
+		data, ids = build()
+		hf = hprof.parse(data)
+		try:
+			heap, = hf.heaps
+			mid = heap[ids['mid']]
+			ref = hprof.cast(mid, type(mid)._hprof_super())
+			self.assertEqual(heap.index_of(ref), heap.index_of(mid))
+			del heap, mid, ref
+		finally:
+			hf.close()
+
+	def test_grows(self):
+		data, ids = build()
+		hf = hprof.parse(data)
+		try:
+			heap, = hf.heaps
+			first = heap.index_of(ids['holder'])
+			heap[1] = heap[ids['leaf']] # an alias at the lowest id
+			self.assertEqual(heap.index_of(ids['holder']), first + 1)
+			self.assertEqual(heap.index_of(1), 0)
+			del heap
+		finally:
+			hf.close()
@@ -0,0 +1,104 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import io
+import math
+import os
+import tempfile
+import unittest
+import hprof
+
+from contextlib import redirect_stdout
+
+from hprof._cli import main
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+class TestEstimate(unittest.TestCase):
+
+	def setUp(self):
+		d = DumpBuilder(8)
+		objcls = d.basics()
+		thing = d.cls('com.example.Thing', objcls, (('n', jtype.int),))
+		for i in range(400):
+			d.obj(thing, i)
+			if i % 4 == 0:
+				d.primarray(jtype.long, [i, i])
+		fd, self.path = tempfile.mkstemp(suffix='.hprof')
+		with os.fdopen(fd, 'wb') as f:
+			f.write(d.build(segments=50))
+
+	def tearDown(self):
+		os.unlink(self.path)
+
+	def test_full_sample_is_exact(self):
+		result = hprof.estimate(self.path, 1.0)
+		thing = result['com.example.Thing']
+		self.assertEqual(thing, (400, (400, 400), 1600, (1600, 1600)))
+		self.assertEqual(result['long[]'].count, 100)
+
+	def test_sample(self):
+		progress = []
+		result = hprof.estimate(self.path, 0.2, lambda *args: progress.append(args), seed=1)
+		thing = result['com.example.Thing']
+		low, high = thing.count_range
+		self.assertLessEqual(low, thing.count)
+		self.assertLessEqual(thing.count, high)
+		self.assertLess(high, math.inf)
+		self.assertLess(abs(thing.count - 400), 100)
+		self.assertAlmostEqual(thing.nbytes, 4 * thing.count, delta=4)
+		self.assertIn(('sampling', 0, 10), progress)
+		self.assertEqual(progress[-1], ('sampling', 10, 10))
+
+	def test_repeatable(self):
+		self.assertEqual(
+			hprof.estimate(self.path, 0.05, seed=7),
+			hprof.estimate(self.path, 0.05, seed=7))
+
+	def test_two_segments_at_least(self):
+		result = hprof.estimate(self.path, 0.0001, seed=3)
+		thing = result['com.example.Thing']
+		self.assertLess(thing.count_range[1], math.inf)
+
+	def test_dominant_segment(self):
+		d = DumpBuilder(8)
+		objcls = d.basics()
+		thing = d.cls('com.example.Thing', objcls, (('n', jtype.int),))
+		for i in range(100):
+			d.obj(thing, i)
+		d.primarray(jtype.long, [0] * 10000) # most of the heap dump, in one segment
+		with open(self.path, 'wb') as f:
+			f.write(d.build(segments=10))
+		for seed in range(10):
+			with self.subTest(seed=seed):
+				low, high = hprof.estimate(self.path, 0.2, seed=seed)['long[]'].count_range
+				self.assertLess(high, math.inf)
+
+	def test_one_segment(self):
+		d = DumpBuilder(8)
+		objcls = d.basics()
+		thing = d.cls('com.example.Thing', objcls, (('n', jtype.int),))
+		d.obj(thing, 1)
+		with open(self.path, 'wb') as f:
+			f.write(d.build())
+		self.assertEqual(hprof.estimate(self.path, 0.0001)['com.example.Thing'], (1, (1, 1), 4, (4, 4)))
+
+	def test_one_cluster_sampled(self):
+		# no spread can be estimated from one of several clusters
+		estimate = hprof._estimate._ratio_estimate([(10, 5)], [10, 10], 1.96)
+		self.assertEqual(estimate, (10, (5, math.inf)))
+
+	def test_bad_args(self):
+		with self.assertRaises(ValueError):
+			hprof.estimate(self.path, 0)
+		with self.assertRaises(ValueError):
+			hprof.estimate(self.path, 0.5, confidence=1)
+
+	def test_cli(self):
+		out = io.StringIO()
+		with redirect_stdout(out):
+			self.assertEqual(main(['histogram', self.path, '--sample', '1', '--limit', '1']), 0)
+		lines = out.getvalue().splitlines()
+		self.assertEqual(len(lines), 2)
+		self.assertEqual(lines[1].split(), ['400', '(400-400)', '1600', '(1600-1600)', 'com.example.Thing'])
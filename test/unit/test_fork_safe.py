@@ -0,0 +1,58 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import gc
+import os
+import unittest
+import hprof
+
+from .test_dense_index import build
+
+class TestForkSafe(unittest.TestCase):
+
+	def tearDown(self):
+		gc.unfreeze()
+
+	def test_prepares(self):
+		data, ids = build()
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			expected = tuple(map(list, heap.reference_graph()))
+			mask = heap.instance_mask('com.example.Node')
+			heap.fork_safe()
+			self.assertGreater(gc.get_freeze_count(), 0)
+			graph = heap.reference_graph()
+			self.assertIs(heap.reference_graph(), graph)
+			self.assertEqual(tuple(map(list, graph)), expected)
+			self.assertEqual(heap.instance_mask('com.example.Node'), mask)
+			self.assertEqual(heap.count('com.example.Node'), 2)
+			del heap, graph
+
+	def test_rebuilt_after_change(self):
+		data, ids = build()
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			heap.fork_safe()
+			graph = heap.reference_graph()
+			heap[1] = heap[ids['leaf']]
+			self.assertEqual(len(heap.reference_graph()[0]), len(graph[0]) + 1)
+			del heap, graph
+
+	@unittest.skipUnless(hasattr(os, 'fork'), 'needs fork()')
+	def test_fork(self):
+		data, ids = build()
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			heap.fork_safe()
+			pid = os.fork()
+			if pid == 0: # pragma: no cover
+				ok = False
+				try:
+					offsets, targets = heap.reference_graph()
+					ix = heap.index_of(ids['mid'])
+					ok = heap.object_at(targets[offsets[ix]]) is heap[ids['leaf']]
+				finally:
+					os._exit(0 if ok else 1)
+			_, status = os.waitpid(pid, 0)
+			self.assertEqual(status, 0)
+			del heap
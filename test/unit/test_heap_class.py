@@ -63,7 +63,7 @@ class TestHeapClass(HeapRecordTest):
 			)
 		self.assertEqual(mock.call_count, 1)
 		self.assertEqual(mock.call_args, (
-			(self.heap.classtree, 'java/lang/String', obj, {}, (), ()),
+			(self.heap._classnames, 'java/lang/String', obj, {}, (), (), False),
 			{},
 		))
 		cid = self.id(0x7e577e57)
@@ -105,13 +105,14 @@ class TestHeapClass(HeapRecordTest):
 						.u1(10)     # field type (int)
 			)
 		self.assertEqual(mock.call_count, 1)
-		self.assertEqual(len(mock.call_args[0]), 6)
-		self.assertIs(   mock.call_args[0][0], self.heap.classtree)
+		self.assertEqual(len(mock.call_args[0]), 7)
+		self.assertIs(   mock.call_args[0][0], self.heap._classnames)
 		self.assertEqual(mock.call_args[0][1], 'java/lang/String')
 		self.assertIs(   mock.call_args[0][2], obj)
 		self.assertEqual(mock.call_args[0][3], {'foo': 70000})
 		self.assertEqual(mock.call_args[0][4], ('bar',))
 		self.assertEqual(mock.call_args[0][5], (jtype.int,))
+		self.assertIs(   mock.call_args[0][6], False)
 		self.assertEqual(mock.call_args[1], {})
 		cid = self.id(0x7e577e57)
 		self.assertIn(cid, self.heap)
@@ -216,7 +217,7 @@ class TestHeapClass(HeapRecordTest):
 			'java/util/ChainedList': ('java.util.ChainedList', ChainedList),
 		}
 
-		with patch('hprof.heap._create_class', side_effect=lambda ct, n, s, sa, ian, iat: retvals[n]) as mock:
+		with patch('hprof.heap._create_class', side_effect=lambda ct, n, s, sa, ian, iat, lazy: retvals[n]) as mock:
 			data = (self.build()
 					.id(0x7e577e55) # class object id
 					.u4(0x124)      # stacktrace serial
@@ -268,8 +269,8 @@ class TestHeapClass(HeapRecordTest):
 			self.doit(0x20, data)
 			self.assertEqual(mock.call_count, 3)
 
-			self.assertEqual(len(mock.call_args_list[0][0]), 6)
-			self.assertIs(   mock.call_args_list[0][0][0], self.heap.classtree)
+			self.assertEqual(len(mock.call_args_list[0][0]), 7)
+			self.assertIs(   mock.call_args_list[0][0][0], self.heap._classnames)
 			self.assertEqual(mock.call_args_list[0][0][1], 'java/util/List')
 			self.assertIs(   mock.call_args_list[0][0][2], None)
 			self.assertEqual(mock.call_args_list[0][0][3], {})
@@ -279,8 +280,8 @@ class TestHeapClass(HeapRecordTest):
 			self.assertEqual(self.heap.classes.get('java.util.List'), [List])
 			self.assertEqual(self.heap.get(self.id(0x7e577e57)), List)
 
-			self.assertEqual(len(mock.call_args_list[1][0]), 6)
-			self.assertIs(   mock.call_args_list[1][0][0], self.heap.classtree)
+			self.assertEqual(len(mock.call_args_list[1][0]), 7)
+			self.assertIs(   mock.call_args_list[1][0][0], self.heap._classnames)
 			self.assertEqual(mock.call_args_list[1][0][1], 'java/util/LinkedList')
 			self.assertIs(   mock.call_args_list[1][0][2], List)
 			self.assertEqual(mock.call_args_list[1][0][3], {})
@@ -290,8 +291,8 @@ class TestHeapClass(HeapRecordTest):
 			self.assertEqual(self.heap.classes.get('java.util.LinkedList'), [LinkedList])
 			self.assertEqual(self.heap.get(self.id(0x7e577e56)), LinkedList)
 
-			self.assertEqual(len(mock.call_args_list[2][0]), 6)
-			self.assertIs(   mock.call_args_list[2][0][0], self.heap.classtree)
+			self.assertEqual(len(mock.call_args_list[2][0]), 7)
+			self.assertIs(   mock.call_args_list[2][0][0], self.heap._classnames)
 			self.assertEqual(mock.call_args_list[2][0][1], 'java/util/ChainedList')
 			self.assertIs(   mock.call_args_list[2][0][2], LinkedList)
 			self.assertEqual(mock.call_args_list[2][0][3], {})
@@ -369,3 +370,45 @@ class TestHeapClass(HeapRecordTest):
 
 			with self.assertRaisesRegex(hprof.error.FormatError, 'super class'):
 				hprof._parsing._instantiate(self.hf, self.idsize, None)
+
+
+class TestClassNames(unittest.TestCase):
+
+	def create(self, container, name):
+		return hprof.heap._create_class(container, name, None, {}, (), ())
+
+	def test_same_as_hierarchy(self):
+		names = ('java/lang/Object', 'java/util/HashMap$Node', '[Ljava/util/HashMap$Node;',
+				'[[I', 'Toplevel', 'com/example/Foo$$Lambda$1/0x1234', 'java.util.HashMap')
+		heap = hprof.heap.Heap()
+		tree = hprof.heap.JavaHierarchy()
+		for name in names:
+			with self.subTest(name=name):
+				lazyname, lazycls = self.create(heap._classnames, name)
+				eagername, eagercls = self.create(tree, name)
+				self.assertEqual(lazyname, eagername)
+				self.assertEqual(str(lazycls), str(eagercls))
+				self.assertEqual(str(lazycls.__module__), str(eagercls.__module__))
+		self.assertIsNone(heap._classnames._tree)
+		self.assertEqual(heap.classtree.java.util.HashMap.Node, 'java.util.HashMap.Node')
+		self.assertEqual(sorted(dir(heap.classtree)), sorted(dir(tree)))
+		self.assertIs(heap.classtree.java.util.HashMap, self.create(heap._classnames, 'java/util/HashMap')[0])
+
+	def test_added_after_tree(self):
+		heap = hprof.heap.Heap()
+		self.create(heap._classnames, 'java/lang/Object')
+		tree = heap.classtree
+		self.create(heap._classnames, 'java/lang/String')
+		self.create(heap._classnames, 'com/example/Thing$Inner')
+		self.assertIs(heap.classtree, tree)
+		self.assertEqual(tree.java.lang.String, 'java.lang.String')
+		self.assertEqual(tree.com.example.Thing.Inner, 'com.example.Thing.Inner')
+
+	def test_parsed_once(self):
+		heap = hprof.heap.Heap()
+		with patch('hprof.heap._split_class_name', wraps=hprof.heap._split_class_name) as split:
+			a = self.create(heap._classnames, 'java/lang/Object')
+			b = self.create(heap._classnames, 'java/lang/Object')
+		self.assertEqual(split.call_count, 1)
+		self.assertIs(a[0], b[0])
+		self.assertIsNot(a[1], b[1])
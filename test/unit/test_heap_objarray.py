@@ -19,8 +19,8 @@ class TestObjectArray(HeapRecordTest):
 				.u4(0x0)      # length
 				.id(0x1010)   # class id
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), ())]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		expected = [(self.id(0x0b1ec7), self.id(0x1010), 2 * self.idsize + 8, 0)]
+		self.assertEqual(list(self.heap._deferred_objarrays), expected)
 
 	def test_small(self):
 		self.doit(0x22, self.build()
@@ -30,12 +30,13 @@ class TestObjectArray(HeapRecordTest):
 				.id(0x1010)   # class id
 				.id(0xf00baa) # element 0
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), (self.id(0xf00baa),))]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		expected = [(self.id(0x0b1ec7), self.id(0x1010), 2 * self.idsize + 8, 1)]
+		self.assertEqual(list(self.heap._deferred_objarrays), expected)
+		self.assertEqual(self.elements(expected[0]), [self.id(0xf00baa)])
 
 	def test_multi(self):
-		self.heap._deferred_objarrays.append('hello')
-		self.heap._deferred_objarrays.append('world')
+		self.heap._deferred_objarrays.append((1, 2, 3, 4))
+		self.heap._deferred_objarrays.append((5, 6, 7, 8))
 		self.doit(0x22, self.build()
 				.id(0x0b1ec7) # array id
 				.u4(0x57acc)  # stack trace serial
@@ -47,24 +48,37 @@ class TestObjectArray(HeapRecordTest):
 				.id(0xbaaf00) # element 3
 		)
 		expected = [
-				'hello',
-				'world',
-				(self.id(0x0b1ec7), 0x57acc, self.id(0x1010), (self.id(0xbaabaa),self.id(0xf00f00),self.id(0xf00baa),self.id(0xbaaf00)))
+				(1, 2, 3, 4),
+				(5, 6, 7, 8),
+				(self.id(0x0b1ec7), self.id(0x1010), 2 * self.idsize + 8, 4)
 		]
-		self.assertEqual(self.heap._deferred_objarrays, expected)
+		self.assertEqual(list(self.heap._deferred_objarrays), expected)
+		self.assertEqual(self.elements(expected[2]), [self.id(0xbaabaa),self.id(0xf00f00),self.id(0xf00baa),self.id(0xbaaf00)])
+
+	def packed(self, *ids):
+		out = self.build()
+		for objid in ids:
+			out.id(objid)
+		return out
+
+	def elements(self, record):
+		objid, clsid, offset, length = record
+		return list(hprof.heap._ObjectArrayData(self.heap, offset, length).ids())
 
 	def test_create_objarrays(self):
 		fakes = (
-			(99, 55, 10, (11,12,13)),
-			(79, 45, 11, (22,21,20)),
-			(78, 55, 10, (12,13,14,15)),
+			(99, 10, (11,12,13)),
+			(79, 11, (22,21,20)),
+			(78, 10, (12,13,14,15)),
 		)
+		spans = self.queue_data(*(self.packed(*ids) for _, _, ids in fakes))
 		out1 = MagicMock()
 		out2 = MagicMock()
 		out3 = MagicMock()
 		self.heap[10] = cls1 = MagicMock(side_effect=(out1,out2))
 		self.heap[11] = cls2 = MagicMock(side_effect=(out3,))
-		self.heap._deferred_objarrays.extend(fakes)
+		for (objid, clsid, ids), (offset, _) in zip(fakes, spans):
+			self.heap._deferred_objarrays.append((objid, clsid, offset, len(ids)))
 		self.heap._instances[cls1] = []
 		self.heap._instances[cls2] = []
 		progress = MagicMock()
@@ -75,17 +89,26 @@ class TestObjectArray(HeapRecordTest):
 		self.assertEqual(cls2.call_count, 1)
 		self.assertEqual(len(self.heap._deferred_objarrays), 0)
 
-		self.assertEqual(cls1.call_args_list[0][0], (99, fakes[0][3]))
+		objid, elems = cls1.call_args_list[0][0]
+		self.assertEqual(objid, 99)
+		self.assertIsInstance(elems, hprof.heap._ObjectArrayData)
+		self.assertEqual(tuple(elems.ids()), fakes[0][2])
 		self.assertEqual(cls1.call_args_list[0][1], {})
 		self.assertIn(99, self.heap)
 		self.assertIs(self.heap[99], out1)
 
-		self.assertEqual(cls1.call_args_list[1][0], (78, fakes[2][3]))
+		objid, elems = cls1.call_args_list[1][0]
+		self.assertEqual(objid, 78)
+		self.assertIsInstance(elems, hprof.heap._ObjectArrayData)
+		self.assertEqual(tuple(elems.ids()), fakes[2][2])
 		self.assertEqual(cls1.call_args_list[1][1], {})
 		self.assertIn(78, self.heap)
 		self.assertIs(self.heap[78], out2)
 
-		self.assertEqual(cls2.call_args_list[0][0], (79, fakes[1][3]))
+		objid, elems = cls2.call_args_list[0][0]
+		self.assertEqual(objid, 79)
+		self.assertIsInstance(elems, hprof.heap._ObjectArrayData)
+		self.assertEqual(tuple(elems.ids()), fakes[1][2])
 		self.assertEqual(cls2.call_args_list[0][1], {})
 		self.assertIn(79, self.heap)
 		self.assertIs(self.heap[79], out3)
@@ -94,3 +117,29 @@ class TestObjectArray(HeapRecordTest):
 		self.assertCountEqual(self.heap._instances[cls2], (out3,))
 
 		progress.assert_called_once_with(0)
+
+	def test_create_lazy_elements(self):
+		self.heap[10] = cls = MagicMock()
+		self.heap._instances[cls] = []
+		self.heap[20] = target = MagicMock()
+		(offset1, _), (offset2, _) = self.queue_data(self.packed(20, 0, 20), self.packed(21))
+		self.heap._deferred_objarrays.append((99, 10, offset1, 3))
+
+		hprof._heap_parsing.create_objarrays(self.heap, MagicMock())
+
+		objid, elems = cls.call_args[0]
+		self.assertEqual(objid, 99)
+		self.assertIsInstance(elems, hprof.heap._ObjectArrayData)
+		self.assertEqual(list(elems.ids()), [20, 0, 20])
+		self.assertEqual(len(elems), 3)
+		self.assertIs(elems[0], target)
+		self.assertIsNone(elems[1])
+		self.assertIs(elems[-1], target)
+		self.assertEqual(elems[:2], (target, None))
+		self.assertEqual(elems.elems, (target, None, target)) # looked up once, and kept
+		with self.assertRaises(IndexError):
+			elems[3]
+		self.heap._deferred_objarrays.append((98, 10, offset2, 1))
+		hprof._heap_parsing.create_objarrays(self.heap, MagicMock())
+		with self.assertRaises(hprof.error.MissingObject):
+			cls.call_args[0][1][0]
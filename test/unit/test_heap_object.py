@@ -20,8 +20,8 @@ class TestHeapObject(HeapRecordTest):
 				.id(0x2020)   # class id
 				.u4(0x0)      # bytes remaining
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x2020), b'')]
-		self.assertEqual(self.heap._deferred_objects, expected)
+		expected = [(self.id(0x0b1ec7), self.id(0x2020), 2 * self.idsize + 8, 0)]
+		self.assertEqual(list(self.heap._deferred_objects), expected)
 
 	def test_small(self):
 		self.doit(0x21, self.build()
@@ -31,12 +31,14 @@ class TestHeapObject(HeapRecordTest):
 				.u4(0x4)        # bytes remaining
 				.u4(0x12345678) # first instance variable
 		)
-		expected = [(self.id(0x0b1ec7), 0x57acc, self.id(0x2021), b'\x12\x34\x56\x78')]
-		self.assertEqual(self.heap._deferred_objects, expected)
+		expected = [(self.id(0x0b1ec7), self.id(0x2021), 2 * self.idsize + 8, 4)]
+		self.assertEqual(list(self.heap._deferred_objects), expected)
+		objid, clsid, offset, length = expected[0]
+		self.assertEqual(self.heap._data[offset:offset+length], b'\x12\x34\x56\x78')
 
 	def test_multi(self):
-		self.heap._deferred_objects.append('hello')
-		self.heap._deferred_objects.append('world')
+		self.heap._deferred_objects.append((1, 2, 3, 4))
+		self.heap._deferred_objects.append((5, 6, 7, 8))
 		self.doit(0x21, self.build()
 				.id(0x0b1ec6)   # object id
 				.u4(0x57acca)   # stacktrace serial
@@ -47,20 +49,23 @@ class TestHeapObject(HeapRecordTest):
 				.u4(0x98979695) # first instance variable, super class
 		)
 		expected = [
-			'hello',
-			'world',
-			(self.id(0x0b1ec6), 0x57acca, self.id(0x2021), b'\x17\x27\x37\x47\x13\x14\x98\x97\x96\x95')
+			(1, 2, 3, 4),
+			(5, 6, 7, 8),
+			(self.id(0x0b1ec6), self.id(0x2021), 2 * self.idsize + 8, 10)
 		]
-		self.assertEqual(self.heap._deferred_objects, expected)
+		self.assertEqual(list(self.heap._deferred_objects), expected)
+		objid, clsid, offset, length = expected[2]
+		self.assertEqual(self.heap._data[offset:offset+length], b'\x17\x27\x37\x47\x13\x14\x98\x97\x96\x95')
 
 	def test_create_objects(self):
 		cls0attr = MagicMock(
-				_hprof_ifieldvals=PropertyMock(),
+				_hprof_ifieldtypes = (),
+				_hprof_ifieldslots = (),
 				__bases__ = (hprof.heap.JavaObject,))
 		cls1attr = MagicMock(
 				_hprof_ifieldix = {'blah': 0},
 				_hprof_ifieldtypes = (jtype.object,),
-				_hprof_ifieldvals=PropertyMock(),
+				_hprof_ifieldslots = (PropertyMock(),),
 				__bases__ = (hprof.heap.JavaObject,))
 		cls3attr = MagicMock(
 				_hprof_ifieldix = {'some': 0, 'thing': 1},
@@ -68,7 +73,7 @@ class TestHeapObject(HeapRecordTest):
 					jtype.int,
 					jtype.short,
 				),
-				_hprof_ifieldvals=PropertyMock(),
+				_hprof_ifieldslots = (PropertyMock(), PropertyMock()),
 				__bases__ = (cls1attr,)) # inherits from cls1attr
 		self.heap[0x2020] = cls0attr
 		self.heap[0x2021] = cls1attr
@@ -77,12 +82,13 @@ class TestHeapObject(HeapRecordTest):
 		self.heap._instances[cls1attr] = []
 		self.heap._instances[cls3attr] = []
 
-		fakes = (
-			(0x0b1ec7, 0x57acc,  0x2020, b''),
-			(0x0b1ec6, 0x57acc,  0x2021, self.build().id(0x12345678)),
-			(0x0b1ec5, 0x57acca, 0x2022, self.build().i4(0x98979695).u2(0x1314).id(0xabcd0123f)),
+		spans = self.queue_data(
+			b'',
+			self.build().id(0x12345678),
+			self.build().i4(0x98979695).u2(0x1314).id(0xabcd0123f),
 		)
-		self.heap._deferred_objects.extend(fakes)
+		for objid, clsid, (offset, length) in zip((0x0b1ec7, 0x0b1ec6, 0x0b1ec5), (0x2020, 0x2021, 0x2022), spans):
+			self.heap._deferred_objects.append((objid, clsid, offset, length))
 		progress = MagicMock()
 
 		hprof._heap_parsing.create_instances(self.heap, self.idsize, progress)
@@ -93,7 +99,6 @@ class TestHeapObject(HeapRecordTest):
 			self.assertEqual(cls0attr.call_args[1], {})
 			obj = self.heap[0x0b1ec7]
 			self.assertIs(obj, cls0attr.return_value)
-			cls0attr._hprof_ifieldvals.assert_called_once_with(())
 			self.assertCountEqual(self.heap._instances[cls0attr], (obj,))
 
 		with self.subTest('1 attr'):
@@ -102,8 +107,9 @@ class TestHeapObject(HeapRecordTest):
 			self.assertEqual(cls1attr.call_args_list[0][1], {})
 			obj = self.heap[0x0b1ec6]
 			self.assertIs(obj, cls1attr.return_value)
-			self.assertGreaterEqual(cls1attr._hprof_ifieldvals.call_count, 1)
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_args_list[0][0], ((self.id(0x12345678),),))
+			blah, = cls1attr._hprof_ifieldslots
+			self.assertGreaterEqual(blah.call_count, 1)
+			self.assertEqual(blah.call_args_list[0][0], (self.id(0x12345678),))
 			self.assertCountEqual(self.heap._instances[cls1attr], (obj,))
 
 		with self.subTest('3 attrs'):
@@ -112,9 +118,11 @@ class TestHeapObject(HeapRecordTest):
 			self.assertEqual(cls3attr.call_args_list[0][1], {})
 			obj = self.heap[0x0b1ec5]
 			self.assertIs(obj, cls3attr.return_value)
-			cls3attr._hprof_ifieldvals.assert_called_once_with((0x98979695-0x100000000,0x1314))
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_count, 2)
-			self.assertEqual(cls1attr._hprof_ifieldvals.call_args_list[1][0], ((self.id(0xabcd0123f),),))
+			some, thing = cls3attr._hprof_ifieldslots
+			some.assert_called_once_with(0x98979695-0x100000000)
+			thing.assert_called_once_with(0x1314)
+			self.assertEqual(blah.call_count, 2)
+			self.assertEqual(blah.call_args_list[1][0], (self.id(0xabcd0123f),))
 			self.assertCountEqual(self.heap._instances[cls3attr], (obj,))
 
 		self.assertEqual(len(self.heap._deferred_objects), 0)
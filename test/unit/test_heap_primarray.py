@@ -15,26 +15,21 @@ from .util import varyingid, HeapRecordTest
 class TestPrimitiveArray(HeapRecordTest):
 
 	def test_zero(self):
-		self.heap._deferred_primarrays.append('dummy')
+		self.heap._deferred_primarrays.append((1, 2, 3, 4))
 		self.doit(0x23, self.build()
 				.id(0x0b1ec7) # array id
 				.u4(0x57acc)  # stacktrace serial
 				.u4(0x0)      # length
 				.u1(4)        # element type (boolean)
 		)
-		self.assertEqual(len(self.heap._deferred_primarrays), 2)
-		self.assertEqual(self.heap._deferred_primarrays[0], 'dummy')
-		self.assertEqual(len(self.heap._deferred_primarrays[1]), 3)
-		objid, strace, adata = self.heap._deferred_primarrays[1]
-		self.assertEqual(objid, self.id(0x0b1ec7))
-		self.assertEqual(strace, 0x57acc)
-		self.assertIs(type(adata), hprof.heap._DeferredArrayData)
-		self.assertIs(adata.jtype, jtype.boolean)
-		self.assertEqual(adata.bytes, b'')
+		self.assertEqual(list(self.heap._deferred_primarrays), [
+			(1, 2, 3, 4),
+			(self.id(0x0b1ec7), jtype.boolean.value, self.idsize + 9, 0),
+		])
 
 	def test_one(self):
-		self.heap._deferred_primarrays.append('hello')
-		self.heap._deferred_primarrays.append('world')
+		self.heap._deferred_primarrays.append((1, 2, 3, 4))
+		self.heap._deferred_primarrays.append((5, 6, 7, 8))
 		self.doit(0x23, self.build()
 				.id(0x0b1ec72)# array id
 				.u4(0x57acc)  # stacktrace serial
@@ -42,16 +37,12 @@ class TestPrimitiveArray(HeapRecordTest):
 				.u1(9)        # element type (short)
 				.u2(0xbea7)   # element 0
 		)
-		self.assertEqual(len(self.heap._deferred_primarrays), 3)
-		self.assertEqual(self.heap._deferred_primarrays[0], 'hello')
-		self.assertEqual(self.heap._deferred_primarrays[1], 'world')
-		self.assertEqual(len(self.heap._deferred_primarrays[2]), 3)
-		objid, strace, adata = self.heap._deferred_primarrays[2]
-		self.assertEqual(objid, self.id(0x0b1ec72))
-		self.assertEqual(strace, 0x57acc)
-		self.assertIs(type(adata), hprof.heap._DeferredArrayData)
-		self.assertIs(adata.jtype, jtype.short)
-		self.assertEqual(adata.bytes, b'\xbe\xa7')
+		self.assertEqual(list(self.heap._deferred_primarrays), [
+			(1, 2, 3, 4),
+			(5, 6, 7, 8),
+			(self.id(0x0b1ec72), jtype.short.value, self.idsize + 9, 1),
+		])
+		self.assertEqual(self.heap._data[self.idsize + 9:self.idsize + 11], b'\xbe\xa7')
 
 	def test_three(self):
 		self.doit(0x23, self.build()
@@ -63,19 +54,17 @@ class TestPrimitiveArray(HeapRecordTest):
 				.u2(0xbea7)   # element 1
 				.u2(0x6677)   # element 2
 		)
-		self.assertEqual(len(self.heap._deferred_primarrays), 1)
-		self.assertEqual(len(self.heap._deferred_primarrays[0]), 3)
-		objid, strace, adata = self.heap._deferred_primarrays[0]
-		self.assertEqual(objid, self.id(0x0b1ec72))
-		self.assertIs(type(adata), hprof.heap._DeferredArrayData)
-		self.assertIs(adata.jtype, jtype.short)
-		self.assertEqual(adata.bytes, b'\x50\x40\xbe\xa7\x66\x77')
+		self.assertEqual(list(self.heap._deferred_primarrays), [
+			(self.id(0x0b1ec72), jtype.short.value, self.idsize + 9, 3),
+		])
+		self.assertEqual(self.heap._data[self.idsize + 9:self.idsize + 15], b'\x50\x40\xbe\xa7\x66\x77')
 
 	def test_create_primarrays(self):
+		spans = self.queue_data(b'\x50\x40\xbe\xa7\x66\x77', b'\x01', b'')
 		fakes = (
-			(1, 20, hprof.heap._DeferredArrayData(jtype.short, b'\x50\x40\xbe\xa7\x66\x77')),
-			(5, 20, hprof.heap._DeferredArrayData(jtype.boolean, b'\x01')),
-			(3, 10, hprof.heap._DeferredArrayData(jtype.short, b'')),
+			(1, jtype.short.value,   spans[0][0], 3),
+			(5, jtype.boolean.value, spans[1][0], 1),
+			(3, jtype.short.value,   spans[2][0], 0),
 		)
 		out1 = MagicMock()
 		out2 = MagicMock()
@@ -84,7 +73,8 @@ class TestPrimitiveArray(HeapRecordTest):
 		self.heap.classes['boolean[]'] =  boolmock, = (MagicMock(side_effect=(out3,)),)
 		self.heap._instances[shortmock] = []
 		self.heap._instances[ boolmock] = []
-		self.heap._deferred_primarrays.extend(fakes)
+		for record in fakes:
+			self.heap._deferred_primarrays.append(record)
 		progress = MagicMock()
 
 		hprof._heap_parsing.create_primarrays(self.heap, progress)
@@ -93,17 +83,17 @@ class TestPrimitiveArray(HeapRecordTest):
 		self.assertEqual( boolmock.call_count, 1)
 		self.assertEqual(len(self.heap._deferred_primarrays), 0)
 
-		self.assertEqual(boolmock.call_args_list[0][0], (5, fakes[1][2]))
+		self.assertArray(boolmock.call_args_list[0][0], 5, jtype.boolean, b'\x01')
 		self.assertEqual(boolmock.call_args_list[0][1], {})
 		self.assertIn(5, self.heap)
 		self.assertIs(self.heap[5], out3)
 
-		self.assertEqual(shortmock.call_args_list[0][0], (1, fakes[0][2]))
+		self.assertArray(shortmock.call_args_list[0][0], 1, jtype.short, b'\x50\x40\xbe\xa7\x66\x77')
 		self.assertEqual(shortmock.call_args_list[0][1], {})
 		self.assertIn(1, self.heap)
 		self.assertIs(self.heap[1], out1)
 
-		self.assertEqual(shortmock.call_args_list[1][0], (3, fakes[2][2]))
+		self.assertArray(shortmock.call_args_list[1][0], 3, jtype.short, b'')
 		self.assertEqual(shortmock.call_args_list[1][1], {})
 		self.assertIn(3, self.heap)
 		self.assertIs(self.heap[3], out2)
@@ -112,3 +102,10 @@ class TestPrimitiveArray(HeapRecordTest):
 		self.assertCountEqual(self.heap._instances[ boolmock], (self.heap[5],))
 
 		progress.assert_called_once_with(0)
+
+	def assertArray(self, args, objid, t, data):
+		self.assertEqual(args[0], objid)
+		adata = args[1]
+		self.assertIs(type(adata), hprof.heap._DeferredArrayData)
+		self.assertIs(adata.jtype, t)
+		self.assertEqual(adata.bytes, data)
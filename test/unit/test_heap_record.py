@@ -25,7 +25,7 @@ class TestParseHeapRecord(unittest.TestCase):
 			self.assertEqual(rhr.call_count, 0)
 		hf = hprof._parsing.HprofFile()
 		progress = MagicMock()
-		reader = 'I am a reader'
+		reader = hprof._parsing.PrimitiveReader(b'', 4)
 		with patch('hprof._heap_parsing.parse_heap', side_effect=check_first) as ph, patch('hprof._heap_parsing.resolve_heap_references') as rhr:
 			hprof._parsing.RECORD_PARSERS[0x0c](hf, reader, progress)
 		self.assertEqual(len(hf.heaps), 1)
@@ -97,7 +97,7 @@ class TestParseHeapRecord(unittest.TestCase):
 					self.assertEqual(progress.call_args_list[2][1], {})
 
 	def test_segmented_heap(self):
-		hf = MagicMock()
+		hf = MagicMock(_threads=1)
 		hf.heaps = []
 		reader1 = MagicMock()
 		reader2 = MagicMock()
@@ -126,7 +126,7 @@ class TestParseHeapRecord(unittest.TestCase):
 			hprof._parsing.RECORD_PARSERS[0x2c](hf, MagicMock(), None)
 
 	def test_nested_heap(self):
-		hf = MagicMock()
+		hf = MagicMock(_threads=1)
 		with patch('hprof._heap_parsing.parse_heap') as ph:
 			hprof._parsing.RECORD_PARSERS[0x1c](hf, MagicMock(), None)
 			with self.assertRaisesRegex(hprof.error.FormatError, 'unfinished segmented heap'):
@@ -16,6 +16,8 @@ class TestHeapRefResolution(unittest.TestCase):
 
 	def setUp(self):
 		self.heap = hprof.heap.Heap()
+		self.heap._data = b''
+		self.heap._idsize = 4
 		_, self.ObjectCls = hprof.heap._create_class(
 				self.heap.classtree, 'java/lang/Object', None,
 				{
@@ -68,10 +70,16 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.ObjectCls._hprof_ifieldvals.__set__(self.dead, (11, 0x0000, 20, 0xfade))
 		self.StringCls._hprof_ifieldvals.__set__(self.dead, (0xbeef,))
 
-		self.beef = self.heap[0xbeef] = self.ObjectArrayCls(0xbeef, (0xf00d, 0xdead, 0xfade, 0xf00d, 0xfade))
+		self.beef = self.heap[0xbeef] = self.ObjectArrayCls(0xbeef, self.objarray_data(0xf00d, 0xdead, 0xfade, 0xf00d, 0xfade))
 
 		self.ints = self.heap[0x1111] = self.IntArrayCls(0x1111, hprof.heap._DeferredArrayData(jtype.int, b'abcdefgh'))
 
+	def objarray_data(self, *ids):
+		''' object array elements with these ids, added to the heap's data. '''
+		offset = len(self.heap._data)
+		self.heap._data += b''.join(objid.to_bytes(4, 'big') for objid in ids)
+		return hprof.heap._ObjectArrayData(self.heap, offset, len(ids))
+
 	def test_objarray_resolution(self):
 		resolve(self.heap, None)
 		self.assertEqual(len(self.beef), 5)
@@ -147,9 +155,10 @@ class TestHeapRefResolution(unittest.TestCase):
 			resolve(self.heap, None)
 
 	def test_dangling_ref_array(self):
-		self.beef._hprof_array_data = (0xf00d, 0xdead, 0xca7f00d, 0xf00d, 0xfade)
+		self.beef._hprof_array_data = self.objarray_data(0xf00d, 0xdead, 0xca7f00d, 0xf00d, 0xfade)
+		resolve(self.heap, None) # array elements are looked up when first read
 		with self.assertRaisesRegex(hprof.error.MissingObject, '0xca7f00d'):
-			resolve(self.heap, None)
+			self.beef[1]
 
 	def test_progress_callback(self):
 		cb = MagicMock()
@@ -167,7 +176,7 @@ class TestHeapRefResolution(unittest.TestCase):
 		self.assertEqual(cb.call_args_list[1][0], (0,))
 
 	def test_progress_callback_many_objs(self):
-		heap = MagicMock()
+		heap = MagicMock(_threads=1)
 		heap._deferred_classes = []
 		heap.values.return_value = (self.ObjectCls for i in range(10009))
 		heap.__len__.return_value = 10009
@@ -0,0 +1,92 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from hprof.heap import Excluded
+
+EXAMPLE = 'testdata/example-java.hprof.bz2'
+
+class TestInclude(unittest.TestCase):
+
+	@classmethod
+	def setUpClass(cls):
+		with hprof.open(EXAMPLE) as hf:
+			heap, = hf.heaps
+			cls.nclasses = len(heap.classes)
+			cls.nobjects = len(heap)
+			del heap
+
+	def check_cars(self, hf, depth):
+		heap, = hf.heaps
+		self.assertEqual(len(heap.classes), self.nclasses)
+		self.assertEqual(heap.count('com.example.cars.Vehicle', True), 5)
+		self.assertLess(len(heap), self.nobjects)
+		carex, = heap.exact_instances('com.example.Cars')
+		vehicles = carex.vehicles
+		makes = [v.make for v in vehicles]
+		if depth == 0:
+			self.assertEqual(heap.count('java.lang.String'), 0)
+			self.assertTrue(all(isinstance(m, Excluded) for m in makes), makes)
+			self.assertEqual(repr(makes[0]), '<excluded object 0x%x>' % makes[0])
+		else:
+			self.assertTrue(all(isinstance(m, hprof.heap.JavaObject) for m in makes), makes)
+		if depth >= 2:
+			self.assertEqual(sorted(str(m) for m in makes), ['Axes', 'Fånark', 'Lolvo', 'Stretch', 'Toy Yoda'])
+		del heap, carex, vehicles, makes
+
+	def test_depths(self):
+		for depth in (0, 1, 2):
+			with self.subTest(depth=depth):
+				with hprof.open(EXAMPLE, include=['com.example.*'], include_depth=depth) as hf:
+					self.check_cars(hf, depth)
+
+	def test_compact(self):
+		for depth in (0, 2):
+			with self.subTest(depth=depth):
+				with hprof.open(EXAMPLE, memory_budget=1 << 20,
+						include='com.example.*', include_depth=depth) as hf:
+					self.check_cars(hf, depth)
+
+	def test_keep_cleared(self):
+		with hprof.open(EXAMPLE, include=['com.example.*'], include_depth=1) as hf:
+			heap, = hf.heaps
+			self.assertIsNone(heap._keep)
+			del heap
+
+	def test_deep(self):
+		# the reachable objects run out long before the depth does
+		counts = []
+		for depth in (30, 1000):
+			with hprof.open(EXAMPLE, include=['com.example.*'], include_depth=depth) as hf:
+				counts.append(len(hf.heaps[0]))
+		self.assertEqual(counts[0], counts[1])
+		self.assertLess(counts[0], self.nobjects)
+
+	def test_array_depth(self):
+		with hprof.open(EXAMPLE, include=['int[]', 'java.lang.String[]'], include_depth=1) as hf:
+			heap, = hf.heaps
+			self.assertGreater(heap.count('int[]'), 0)
+			self.assertGreater(heap.count('java.lang.String'), 0)
+			for arr in heap.exact_instances('java.lang.String[]'):
+				for s in arr:
+					self.assertNotIsInstance(s, Excluded)
+			del heap, arr, s
+
+	def test_arrays(self):
+		with hprof.open(EXAMPLE, include=['int[]', 'java.lang.String[]']) as hf:
+			heap, = hf.heaps
+			self.assertGreater(heap.count('int[]'), 0)
+			self.assertEqual(len(heap), len(heap.classes) + heap.count('int[]') + heap.count('java.lang.String[]'))
+			del heap
+
+	def test_nothing(self):
+		with hprof.open(EXAMPLE, include=[]) as hf:
+			heap, = hf.heaps
+			self.assertEqual(sum(len(classes) for classes in heap.classes.values()), len(heap))
+			del heap
+
+	def test_bad_depth(self):
+		with self.assertRaises(ValueError):
+			hprof.open(EXAMPLE, include=['x'], include_depth=-1)
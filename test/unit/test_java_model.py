@@ -5,7 +5,7 @@
 import unittest
 
 import hprof
-from hprof import heap
+from hprof import heap, _fields
 from hprof._parsing import jtype
 
 class CommonClassTests(object):
@@ -239,6 +239,8 @@ class CommonClassTests(object):
 		self.assertEqual(oarr._hprof_id, 73)
 		self.assertEqual(oarr.shadow, 0xbeef)
 		self.assertEqual(oarr.extrastuff, 49)
+		with self.assertRaisesRegex(AttributeError, 'has no attribute'):
+			oarr.missing
 		self.assertEqual(str(oarr), 'Object[3] {<java.lang.Object[3] 0x49>, <JavaClass \'java.lang.Object[]\'>, 33}')
 		self.assertEqual(repr(oarr), '<java.lang.Object[3] 0x49>')
 
@@ -564,6 +566,75 @@ class CommonClassTests(object):
 		with self.assertRaises(AttributeError):
 			self.l.sMissing
 
+	def test_field_slots(self):
+		self.obj._hprof_sfields['sGlobalLock'] = 10
+		_, fancy = heap._create_class(self, self.names['ext'], self.cls,
+				{'count': 5, 'bird': 'tweet'},
+				('count', 'x', 'x', '_hprof_id', 'sGlobalLock', 'class', 'y'),
+				(jtype.int,) * 7)
+		_, sub = heap._create_class(self, self.names['lam'], self.lst, {'next': 'static'}, (), ())
+		self.assertCountEqual(fancy.__slots__,
+				('_hprof_f0', '_hprof_f1', '_hprof_f2', '_hprof_f3', '_hprof_f4', '_hprof_f5', '_hprof_f6'))
+		f = fancy(0x10)
+		fancy._hprof_ifieldvals.__set__(f, (1, 2, 3, 4, 5, 6, 7))
+		self.cls._hprof_ifieldvals.__set__(f, (8,))
+		self.assertEqual(fancy._hprof_ifieldvals.__get__(f), (1, 2, 3, 4, 5, 6, 7))
+		self.assertEqual(f.x, 3) # the last one wins, as before
+		self.assertEqual(f.y, 7)
+		self.assertEqual(f.secret, 8)
+		self.assertEqual(f.count, 1) # the instance field wins, as before
+		self.assertEqual(fancy.count, 5)
+		self.assertEqual(f.bird, 'tweet')
+		self.assertEqual(f.sGlobalLock, 5) # the subclass field wins
+		self.assertEqual(fancy.sGlobalLock, 10)
+		self.assertEqual(getattr(f, 'class'), 6)
+		self.assertEqual(f._hprof_id, 0x10)
+		with self.assertRaises(AttributeError):
+			f.y = 3
+		with self.assertRaises(AttributeError):
+			del f.y
+
+		s = sub(0x20)
+		self.lst._hprof_ifieldvals.__set__(s, ('instance',))
+		self.assertEqual(s.next, 'static')
+		self.assertEqual(sub.next, 'static')
+		self.assertEqual(hprof.cast(s, self.lst).next, 'instance')
+
+	def test_instance_fields_not_on_class(self):
+		_, point = heap._create_class(self, self.names['ext'], self.obj, {'ORIGIN': 0},
+				('x', 'y'), (jtype.int, jtype.int))
+		_, sub = heap._create_class(self, self.names['lam'], point, {}, ('z',), (jtype.int,))
+		self.assertEqual(point.ORIGIN, 0)
+		self.assertEqual(sub.ORIGIN, 0)
+		for cls, name in ((point, 'x'), (sub, 'y'), (sub, 'z')):
+			with self.subTest(cls=cls, name=name):
+				with self.assertRaisesRegex(AttributeError, 'no static attribute %r' % name):
+					getattr(cls, name)
+				self.assertFalse(hasattr(cls, name))
+		p = sub(0x10)
+		point._hprof_ifieldvals.__set__(p, (1, 2))
+		sub._hprof_ifieldvals.__set__(p, (3,))
+		self.assertEqual((p.x, p.y, p.z), (1, 2, 3))
+
+	def test_lazy_field_slots(self):
+		_, node = heap._create_class(self, self.names['ext'], self.obj, {},
+				('next', 'n'), (jtype.object, jtype.int), True)
+		self.assertEqual(node.__slots__, ('_hprof_f0', '_hprof_f1'))
+		self.assertIs(type(node.__dict__['next']), _fields.LazyRefField)
+		self.assertIs(type(node.__dict__['n']), _fields.InstanceField)
+
+	def test_static_between_fields(self):
+		_, a = heap._create_class(self, self.names['ext'], self.obj, {}, ('val',), (jtype.int,))
+		_, b = heap._create_class(self, self.names['lam'], a, {'val': 99}, (), ())
+		_, c = heap._create_class(self, self.names['shd'], b, {}, ('val',), (jtype.int,))
+		o = c(0x10)
+		a._hprof_ifieldvals.__set__(o, (1,))
+		c._hprof_ifieldvals.__set__(o, (3,))
+		self.assertEqual(o.val, 3) # the most-derived declaration wins
+		self.assertEqual(c.val, 99)
+		self.assertEqual(hprof.cast(o, b).val, 99)
+		self.assertEqual(hprof.cast(o, a).val, 1)
+
 	def test_refs(self):
 		_, extraclass = heap._create_class(self, self.names['ext'], self.shd, {}, ('shadow',), (jtype.int,))
 		e = extraclass(0xbadf00d)
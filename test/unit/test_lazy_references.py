@@ -0,0 +1,76 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import unittest
+import hprof
+
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+EXAMPLE = 'testdata/example-java.hprof.bz2'
+
+def values(obj, cls):
+	return cls._hprof_ifieldvals.__get__(obj)
+
+class TestLazyReferences(unittest.TestCase):
+
+	def test_same_as_eager(self):
+		with hprof.open(EXAMPLE) as eager, hprof.open(EXAMPLE, lazy_references=True) as lazy:
+			eheap, = eager.heaps
+			lheap, = lazy.heaps
+			ecars = sorted(eheap.all_instances('com.example.cars.Car'), key=lambda c: str(c.make))
+			lcars = sorted(lheap.all_instances('com.example.cars.Car'), key=lambda c: str(c.make))
+			self.assertEqual([str(c.make) for c in ecars], [str(c.make) for c in lcars])
+			self.assertEqual(list(lheap.reference_graph()[1]), list(eheap.reference_graph()[1]))
+			del eheap, lheap, ecars, lcars
+
+	def test_resolved_on_access(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		node = d.cls('com.example.Node', objcls, (('next', jtype.object), ('n', jtype.int)))
+		leaf = d.obj(node, None, 1)
+		mid = d.obj(node, leaf, 2)
+		d.obj(node, 0xbad0, 3)
+		sub = d.cls('com.example.SubNode', node)
+		sub = d.obj(sub, mid, 4)
+		with hprof.parse(d.build(), lazy_references=True) as hf:
+			heap, = hf.heaps
+			cls, = heap.classes['com.example.Node']
+			obj = heap[mid]
+			self.assertEqual(values(obj, cls), (leaf, 2))
+			self.assertIsInstance(values(obj, cls)[0], hprof._heap_parsing.DeferredRef)
+			self.assertIsNone(heap[leaf].next)
+			self.assertEqual(obj.n, 2)
+			self.assertIs(obj.next, heap[leaf])
+			self.assertIs(values(obj, cls)[0], heap[leaf])
+			with self.assertRaisesRegex(AttributeError, 'no static attribute'):
+				cls.next
+			self.assertIs(hprof.cast(heap[sub], cls).next, obj) # resolved through the cast
+
+			broken, = [o for o in heap.exact_instances(cls) if o.n == 3]
+			with self.assertRaisesRegex(hprof.error.MissingObject, '0xbad0'):
+				broken.next
+			del heap, cls, obj, broken
+
+	def test_shadowed_by_reference(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		base = d.cls('com.example.Base', objcls, (('val', jtype.int),))
+		sub = d.cls('com.example.Sub', base, (('val', jtype.object),))
+		target = d.obj(objcls)
+		obj = d.obj(sub, target, 7)
+		with hprof.parse(d.build(), lazy_references=True) as hf:
+			heap, = hf.heaps
+			base, = heap.classes['com.example.Base']
+			self.assertIs(heap[obj].val, heap[target]) # the most-derived declaration wins
+			self.assertEqual(hprof.cast(heap[obj], base).val, 7)
+			del heap, base
+
+	def test_eager_reports_missing(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		node = d.cls('com.example.Node', objcls, (('next', jtype.object),))
+		d.obj(node, 0xbad0)
+		with self.assertRaisesRegex(hprof.error.MissingObject, '0xbad0'):
+			hprof.parse(d.build())
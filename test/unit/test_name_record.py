@@ -2,9 +2,12 @@
 # Copyright (C) 2020 Sony Mobile Communications Inc.
 # Licensed under the LICENSE.
 
+import threading
 import unittest
 import hprof
 
+from concurrent.futures import ThreadPoolExecutor
+
 from .util import varyingid
 
 @varyingid
@@ -56,3 +59,111 @@ class TestParseNameRecord(unittest.TestCase):
 		self.assertEqual(self.hf.names[yamashita], '山下さん')
 		self.assertEqual(self.hf.names[hälge], 'Hälge ÅÄÖsson')
 
+
+
+class TestNameTable(unittest.TestCase):
+
+	def setUp(self):
+		self.data = 'xHälge;sil🜛ver;'.encode('utf8') + b'\xc0\x80;\xff'
+		self.names = hprof._names.NameTable()
+		self.names.add(1, self.data, 1, 6)
+		self.names.add(2, self.data, 8, 10)
+		self.names.add(3, self.data, 19, 2)
+		self.names.add(4, self.data, 22, 1)
+
+	def test_decoded_on_access(self):
+		self.assertEqual(len(self.names), 5)
+		self.assertEqual(self.names._decoded, {0: None})
+		self.assertEqual(self.names[1], 'Hälge')
+		self.assertEqual(self.names[2], 'sil🜛ver')
+		self.assertEqual(self.names[3], '\0')
+		self.assertEqual(self.names._decoded, {0: None, 1: 'Hälge', 2: 'sil🜛ver', 3: '\0'})
+		self.assertIs(self.names[1], self.names[1])
+		self.assertEqual(sorted(self.names), [0, 1, 2, 3, 4])
+		with self.assertRaises(KeyError):
+			self.names[5]
+
+	def test_bad_name(self):
+		with self.assertRaises(hprof.error.FormatError):
+			self.names[4]
+		self.assertIn(4, self.names)
+
+	def test_set_and_delete(self):
+		self.names[1] = 'other'
+		self.assertEqual(self.names[1], 'other')
+		del self.names[2]
+		self.assertNotIn(2, self.names)
+		self.assertEqual(len(self.names), 4)
+
+	def test_delete_decoded(self):
+		self.assertEqual(self.names[1], 'Hälge')
+		del self.names[1]
+		self.assertNotIn(1, self.names)
+		with self.assertRaises(KeyError):
+			del self.names[1]
+		self.assertEqual(repr(self.names), '<NameTable of 4 names, 1 decoded>')
+
+	def test_decoded_while_waiting(self):
+		# another thread decodes the name while this one waits for the lock
+		class Lock(object):
+			def __init__(self):
+				self.lock = threading.Lock()
+				self.waiting = threading.Event()
+			def __enter__(self):
+				self.waiting.set()
+				self.lock.acquire()
+			def __exit__(self, *exc):
+				self.lock.release()
+		lock = self.names._lock = Lock()
+		results = []
+		with lock.lock:
+			reader = threading.Thread(target=lambda: results.append(self.names[1]))
+			reader.start()
+			lock.waiting.wait()
+			self.names._decoded[1] = 'from elsewhere'
+		reader.join()
+		self.assertEqual(results, ['from elsewhere'])
+
+	def test_concurrent_first_access(self):
+		nthreads = 8
+		nameids = range(100, 300)
+		data = b''.join(b'name number %d;' % nameid for nameid in nameids)
+		offsets = [ix for ix, b in enumerate(data) if b == ord(';')]
+		start = 0
+		for nameid, end in zip(nameids, offsets):
+			self.names.add(nameid, data, start, end - start)
+			start = end + 1
+		barrier = threading.Barrier(nthreads)
+		def lookup():
+			barrier.wait()
+			return [self.names[nameid] for nameid in nameids]
+		with ThreadPoolExecutor(nthreads) as pool:
+			results = [f.result() for f in [pool.submit(lookup) for _ in range(nthreads)]]
+		self.assertEqual(results[0], ['name number %d' % nameid for nameid in nameids])
+		for result in results[1:]:
+			for a, b in zip(result, results[0]):
+				self.assertIs(a, b) # each was decoded once
+		self.assertFalse(set(nameids) & set(self.names._pending))
+
+	def test_pickle(self):
+		import pickle
+		self.assertEqual(self.names[1], 'Hälge')
+		copy = pickle.loads(pickle.dumps(self.names))
+		copy.attach(self.data)
+		self.assertEqual(copy[1], 'Hälge')
+		self.assertEqual(copy[2], 'sil🜛ver')
+
+	def test_detach(self):
+		self.assertEqual(self.names[1], 'Hälge')
+		self.names.detach()
+		self.assertEqual(dict(self.names), {0: None, 1: 'Hälge'})
+
+	def test_whole_file(self):
+		from .util import DumpBuilder
+		d = DumpBuilder()
+		d.basics()
+		d.name('never.Used')
+		with hprof.parse(d.build()) as hf:
+			self.assertIn('java.lang.String', hf.names._decoded.values())
+			self.assertNotIn('never.Used', hf.names._decoded.values())
+			self.assertIn('never.Used', [hf.names[n] for n in hf.names])
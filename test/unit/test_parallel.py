@@ -0,0 +1,187 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import sys
+import threading
+import time
+import unittest
+import hprof
+
+from unittest.mock import patch
+
+from hprof._parsing import jtype
+from hprof import _parallel, _parsing
+
+from .util import DumpBuilder
+
+def build():
+	d = DumpBuilder()
+	objcls = d.basics()
+	node, ids = d.nodes(objcls, 300)
+	prev = ids[-1]
+	arrcls = d.cls('[Lcom/example/Node;', objcls)
+	d.objarray(arrcls, [prev, None, prev])
+	# a subclass whose class dump comes after some of its instances' segments
+	sub = d.cls('com.example.SubNode', node, (('extra', jtype.long),), constants=((1, jtype.int, 5),))
+	d.obj(sub, 1 << 40, prev, None, -1)
+	return d.build(segments=5)
+
+def dump(heap):
+	''' everything about the heap that parsing decides, in heap order. '''
+	def ident(val):
+		if isinstance(val, (hprof.heap.JavaObject, hprof.heap.JavaClass)):
+			return ('ref', heap.index_of(val))
+		return val
+	out = []
+	for objid, obj in heap.items():
+		t = type(obj)
+		row = [objid, str(t) if not isinstance(obj, hprof.heap.JavaClass) else 'class ' + str(obj)]
+		if isinstance(obj, hprof.heap.JavaArray):
+			row.append([ident(e) for e in obj])
+		elif not isinstance(obj, hprof.heap.JavaClass):
+			while t is not hprof.heap.JavaObject:
+				row.append([ident(v) for v in t._hprof_ifieldvals.__get__(obj)])
+				t, = t.__bases__
+		out.append(row)
+	for cls, instances in heap._instances.items():
+		out.append((str(cls), [heap.index_of(o) for o in instances]))
+	return out
+
+
+class TestParallelParsing(unittest.TestCase):
+
+	def parse(self, data, threads, **kwargs):
+		with patch('hprof._parallel.thread_count', return_value=threads):
+			return hprof.parse(data, **kwargs)
+
+	def check(self, data, **kwargs):
+		with self.parse(data, 1, **kwargs) as serial:
+			heap, = serial.heaps
+			self.assertEqual(heap._threads, 1)
+			expected = dump(heap)
+			del heap
+		with self.parse(data, 4, **kwargs) as parallel:
+			heap, = parallel.heaps
+			self.assertEqual(heap._threads, 4)
+			self.assertEqual(dump(heap), expected)
+			del heap
+
+	def test_same_as_serial(self):
+		self.check(build())
+
+	def test_spilled(self):
+		self.check(build(), memory_budget=1)
+
+	def test_lazy_references(self):
+		self.check(build(), lazy_references=True)
+
+	def test_include(self):
+		self.check(build(), include='com.example.SubNode', include_depth=2)
+
+	def test_example(self):
+		with open('testdata/example-java.hprof.bz2', 'rb') as f:
+			import bz2
+			data = bz2.decompress(f.read())
+		self.check(data)
+
+	def test_progress(self):
+		events = []
+		with self.parse(build(), 4, progress_callback=lambda *args: events.append(args)) as hf:
+			nobjects = len(hf.heaps[0])
+		resolving = [done for label, done, total in events if label == 'resolving heap 1/1']
+		self.assertEqual(resolving, sorted(resolving))
+		self.assertGreater(len(set(resolving)), 4)
+		self.assertEqual(resolving[-1], nobjects)
+
+	def test_class_records(self):
+		# kept for checkpoints, in file order, however the segments were parsed
+		def new_heap(hf, idsize):
+			heap = real_new_heap(hf, idsize)
+			heap._class_records = []
+			return heap
+		real_new_heap = _parsing._new_heap
+		data = build()
+		records = []
+		for threads in (1, 4):
+			with patch('hprof._parsing._new_heap', new_heap), self.parse(data, threads) as hf:
+				heap, = hf.heaps
+				self.assertEqual(heap._threads, threads)
+				records.append(heap._class_records)
+				del heap
+		self.assertEqual(len(records[0]), 13)
+		self.assertEqual(records[1], records[0])
+
+	def test_checkpoint_parses_in_order(self):
+		import os, tempfile
+		with tempfile.TemporaryDirectory() as tmp:
+			path = os.path.join(tmp, 'dump.hprof')
+			with open(path, 'wb') as f:
+				f.write(build())
+			with patch('hprof._parallel.thread_count', return_value=4):
+				hf = hprof.open(path, checkpoint=path + '.state')
+			with hf:
+				heap, = hf.heaps
+				self.assertEqual(heap._threads, 1)
+				del heap
+
+
+class TestMapOrdered(unittest.TestCase):
+
+	def test_order(self):
+		def slow(n):
+			time.sleep(0.001 * (n % 3))
+			return n * n
+		self.assertEqual(list(_parallel.map_ordered(3, slow, range(20))), [n * n for n in range(20)])
+		self.assertEqual(list(_parallel.map_ordered(3, slow, [])), [])
+
+	def test_bounded(self):
+		threads = 2
+		lock = threading.Lock()
+		started = 0
+		def work(n):
+			nonlocal started
+			with lock:
+				started += 1
+			return n
+		for consumed, n in enumerate(_parallel.map_ordered(threads, work, range(50))):
+			self.assertEqual(n, consumed)
+			with lock:
+				self.assertLessEqual(started, consumed + 2 * threads)
+
+	def test_error(self):
+		def work(n):
+			if n == 3:
+				raise ValueError(n)
+			return n
+		results = []
+		with self.assertRaises(ValueError):
+			for n in _parallel.map_ordered(2, work, range(50)):
+				results.append(n)
+		self.assertEqual(results, [0, 1, 2])
+
+	def test_abandoned(self):
+		calls = []
+		def work(n):
+			calls.append(n)
+			time.sleep(0.001)
+			return n
+		results = _parallel.map_ordered(2, work, range(100))
+		self.assertEqual(next(results), 0)
+		results.close()
+		self.assertLess(len(calls), 10)
+
+
+class TestThreadCount(unittest.TestCase):
+
+	def test_gil(self):
+		with patch.object(sys, '_is_gil_enabled', create=True, return_value=True):
+			self.assertEqual(_parallel.thread_count(), 1)
+
+	def test_no_gil(self):
+		with patch.object(sys, '_is_gil_enabled', create=True, return_value=False), \
+				patch('os.cpu_count', return_value=6):
+			self.assertEqual(_parallel.thread_count(), 6)
+
+	def test_old_python(self):
+		with patch('hprof._parallel.sys', object()):
+			self.assertEqual(_parallel.thread_count(), 1)
@@ -159,6 +159,9 @@ class TestPrivateParse(unittest.TestCase):
 
 class TestParseHprof(unittest.TestCase):
 
+	def setUp(self):
+		sentinel.hf._checkpoint = None
+
 	def test_empty_input(self):
 		progress = MagicMock()
 		hf = sentinel.hf
@@ -202,13 +205,15 @@ class TestParseHprof(unittest.TestCase):
 				hf = hprof._parsing.HprofFile()
 				hprof._parsing._parse_hprof(hf, indata, progress)
 				self.assertCountEqual(hf.unhandled, ())
-				self.assertEqual(progress.call_count, 3)
+				self.assertEqual(progress.call_count, 4)
 				self.assertEqual(progress.call_args_list[0][0], ('parsing', 0, 31))
 				self.assertEqual(progress.call_args_list[0][1], {})
 				self.assertEqual(progress.call_args_list[1][0], ('parsing', 31, 31))
 				self.assertEqual(progress.call_args_list[1][1], {})
 				self.assertEqual(progress.call_args_list[2][0], ('resolving stacktraces', None, None))
 				self.assertEqual(progress.call_args_list[2][1], {})
+				self.assertEqual(progress.call_args_list[3][0], ('setting up special cases', None, None))
+				self.assertEqual(progress.call_args_list[3][1], {})
 
 	def test_one_record(self):
 		for v in (1,2,3):
@@ -222,13 +227,15 @@ class TestParseHprof(unittest.TestCase):
 				self.assertEqual(resolve.call_count, 1)
 				self.assertEqual(resolve.call_args[0], (hf,progress))
 				self.assertFalse(resolve.call_args[1])
-				self.assertEqual(progress.call_count, 3)
+				self.assertEqual(progress.call_count, 4)
 				self.assertEqual(progress.call_args_list[0][0], ('parsing', 0, 42))
 				self.assertEqual(progress.call_args_list[0][1], {})
 				self.assertEqual(progress.call_args_list[1][0], ('parsing', 32, 42))
 				self.assertEqual(progress.call_args_list[1][1], {})
 				self.assertEqual(progress.call_args_list[2][0], ('parsing', 42, 42))
 				self.assertEqual(progress.call_args_list[2][1], {})
+				self.assertEqual(progress.call_args_list[3][0], ('setting up special cases', None, None))
+				self.assertEqual(progress.call_args_list[3][1], {})
 				set_funcs.assert_called_once_with(hf)
 
 	def test_one_record_no_progress(self):
@@ -273,7 +280,7 @@ class TestParseHprof(unittest.TestCase):
 		self.assertFalse(resolve.call_args[1])
 		set_funcs.assert_called_once_with(hf)
 
-		self.assertEqual(progress.call_count, 6)
+		self.assertEqual(progress.call_count, 7)
 		self.assertEqual(progress.call_args_list[0][0], ('parsing', 0, 79))
 		self.assertEqual(progress.call_args_list[0][1], {})
 		self.assertEqual(progress.call_args_list[1][0], ('parsing', 32, 79))
@@ -286,6 +293,8 @@ class TestParseHprof(unittest.TestCase):
 		self.assertEqual(progress.call_args_list[4][1], {})
 		self.assertEqual(progress.call_args_list[5][0], ('parsing', 79, 79))
 		self.assertEqual(progress.call_args_list[5][1], {})
+		self.assertEqual(progress.call_args_list[6][0], ('setting up special cases', None, None))
+		self.assertEqual(progress.call_args_list[6][1], {})
 
 		for mock in mock_parsers.values():
 			for args, kwargs in mock.call_args_list:
@@ -438,7 +447,7 @@ class TestInstantiate(unittest.TestCase):
 
 class TestResolveReferences(unittest.TestCase):
 	def test_resolves_one_heap(self):
-		hf = MagicMock(_pending_heap=None)
+		hf = MagicMock(_pending_heap=None, _lazy_references=False)
 		heap1 = MagicMock()
 		hf.heaps = [heap1]
 		with patch('hprof._heap_parsing.resolve_heap_references') as rhr:
@@ -457,7 +466,7 @@ class TestResolveReferences(unittest.TestCase):
 		heap2.__len__.return_value = 10
 		heap3 = MagicMock()
 		heap3.__len__.return_value = 30
-		hf = MagicMock(_pending_heap=None)
+		hf = MagicMock(_pending_heap=None, _lazy_references=False)
 		hf.heaps = [heap1, heap2, heap3]
 		rhr = MagicMock(side_effect=lambda h,cb: cb(h))
 		with patch('hprof._heap_parsing.resolve_heap_references', rhr):
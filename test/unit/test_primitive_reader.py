@@ -1,9 +1,12 @@
 # Copyright (C) 2019 Snild Dolkow
 # Licensed under the LICENSE.
 
+import sys
 import unittest
 import hprof
 
+from unittest.mock import patch
+
 from hprof._parsing import jtype
 
 class TestPrimitiveReader(unittest.TestCase):
@@ -56,6 +59,14 @@ class TestPrimitiveReader(unittest.TestCase):
 		with self.assertRaises(hprof.error.UnexpectedEof):
 			self.r.bytes(1)
 
+	def test_skip(self):
+		self.r.skip(9)
+		self.assertEqual(self.r.bytes(1), b'z')
+		with self.assertRaisesRegex(hprof.error.UnexpectedEof, 'only 1 left'):
+			self.r.skip(2)
+		self.r.skip(1)
+		self.assertEqual(self.r.remaining, 0)
+
 	def test_ascii(self):
 		self.assertEqual(self.r.ascii(), 'hi you')
 		self.assertEqual(self.r.bytes(4), b'\xc3\x9czx')
@@ -199,6 +210,24 @@ class TestPrimitiveReader(unittest.TestCase):
 		with self.assertRaises(hprof.error.UnexpectedEof):
 			self.r.id()
 
+	def test_ids(self):
+		for idsize, expected in (
+				(3, [0x686920, 0x796f75, 0x00c39c]),
+				(4, [0x68692079, 0x6f7500c3]),
+				(8, [0x686920796f7500c3])):
+			with self.subTest(idsize=idsize):
+				r = hprof._parsing.PrimitiveReader(b'hi you\0\xc3\x9czx', idsize)
+				self.assertEqual(list(r.ids(len(expected))), expected)
+				self.assertEqual(list(r.ids(0)), [])
+				with self.assertRaises(hprof.error.UnexpectedEof):
+					r.ids(1)
+
+	def test_ids_big_endian(self):
+		raw = b'\1\2\3\4\5\6\7\10'
+		with patch.object(sys, 'byteorder', 'big'): # no need to swap bytes
+			out = hprof._parsing.decode_ids(raw, 4)
+		self.assertEqual(out.tobytes(), raw)
+
 	def test_jobject(self):
 		with self.assertRaises(AttributeError):
 			jtype.object.size # object/id is special. :(
@@ -0,0 +1,332 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import io
+import os
+import struct
+import tempfile
+import unittest
+import hprof
+
+from collections import Counter
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+
+from hprof import _cli, _scan
+from hprof._cli import main
+from hprof._parsing import jtype
+
+from .util import Builder, DumpBuilder
+
+def build(idsize):
+	d = DumpBuilder(idsize)
+	objcls = d.basics()
+	thing = d.cls('com.example.Thing$Inner', objcls, (('ref', jtype.object), ('n', jtype.int)))
+	thingarr = d.cls('[Lcom/example/Thing$Inner;', objcls)
+	things = [d.obj(thing, None, i) for i in range(3)]
+	d.objarray(thingarr, things)
+	d.primarray(jtype.int, list(range(100)))
+	d.primarray(jtype.long, list(range(30)))
+	d.primarray(jtype.char, list('chars'))
+	for text in ('hello', 'world', 'hello', 'Fånark'):
+		d.string(text)
+	d.root(things[0])
+	return d.build(segments=2)
+
+def with_record(data, tag, payload):
+	return data + struct.pack('>BII', tag, 0, len(payload)) + payload
+
+
+class TestScan(unittest.TestCase):
+
+	def test_idsizes(self):
+		for idsize in (4, 5, 8):
+			with self.subTest(idsize=idsize):
+				self.check(build(idsize), idsize)
+
+	def check(self, data, idsize):
+		scan = _scan.Scan(memoryview(data))
+		self.assertEqual(scan.version, 'JAVA PROFILE 1.0.2')
+		self.assertEqual(scan.idsize, idsize)
+		self.assertEqual(scan.tags[0x1c], 2)
+		self.assertEqual(scan.unhandled(), {})
+
+		hist = _scan.class_histogram(scan)
+		self.assertEqual(hist['com.example.Thing.Inner'], [3, 3 * (idsize + 4)])
+		self.assertEqual(hist['com.example.Thing.Inner[]'], [1, 3 * idsize])
+		self.assertEqual(hist['int[]'], [1, 400])
+		self.assertEqual(hist['char[]'], [1, 10])
+		self.assertEqual(hist['java.lang.String'], [4, 4 * (idsize + 5)])
+		self.assertEqual(hist['byte[]'], [4, 21])
+		self.assertNotIn('java.lang.Class', hist) # not in this dump
+
+		largest = _scan.top_arrays(scan, 2)
+		self.assertEqual([(size, n, name) for size, n, objid, name in largest],
+				[(400, 100, 'int[]'), (240, 30, 'long[]')])
+		for limit in (0, -1, 100):
+			everything = _scan.top_arrays(scan, limit)
+			self.assertEqual(everything[:2], largest)
+			self.assertEqual(len(everything), 8)
+			self.assertIn((3 * idsize, 3, 'com.example.Thing.Inner[]'),
+					[(size, n, name) for size, n, objid, name in everything])
+
+		summary = _scan.Summary(scan)
+		self.assertEqual(summary.idsize, idsize)
+		self.assertEqual(summary.heap_segments, 2)
+		self.assertEqual(summary.records[0x1c], (2, sum(end - start + 9 for start, end in scan.heap_ranges)))
+		self.assertEqual(summary.heap_records[0x21][0], 7)
+		self.assertEqual(summary.heap_records[0x22], (1, 1 + 2 * idsize + 8 + 3 * idsize))
+		self.assertEqual(summary.heap_records[0x23][0], 7)
+		self.assertEqual(summary.heap_records[0xff], (1, 1 + idsize))
+		self.assertEqual((summary.instances, summary.object_arrays), (7, 1))
+		self.assertEqual(summary.primitive_arrays, {'byte': 4, 'int': 1, 'long': 1, 'char': 1})
+		self.assertEqual(sum(n for n, _ in summary.records.values()), sum(scan.tags.values()))
+
+		self.assertEqual(_scan.strings(scan),
+				Counter({'hello': 2, 'world': 1, 'Fånark': 1}))
+
+	def test_same_as_heap(self):
+		data = build(4)
+		scan = _scan.Scan(memoryview(data))
+		hist = _scan.class_histogram(scan)
+		texts = _scan.strings(scan)
+		hf = hprof.parse(data)
+		try:
+			heap, = hf.heaps
+			for name, (count, nbytes) in hist.items():
+				self.assertEqual(heap.count(name), count, name)
+			self.assertEqual(texts, Counter(str(s) for s in heap.exact_instances('java.lang.String')))
+			del heap
+		finally:
+			hf.close()
+
+	def test_unhandled(self):
+		data = with_record(build(4), 0x0d, b'\0' * 12)
+		data = with_record(data, 0x0d, b'')
+		data = with_record(data, 0x42, b'abc')
+		scan = _scan.Scan(memoryview(data))
+		self.assertEqual(scan.unhandled(), {0x0d: 2, 0x42: 1})
+
+	def test_truncated(self):
+		data = build(4)
+		with self.assertRaises(hprof.error.UnexpectedEof):
+			_scan.Scan(memoryview(data[:-3]))
+
+	def test_bad_header(self):
+		data = build(4)
+		with self.assertRaisesRegex(hprof.error.FormatError, 'unknown header'):
+			_scan.Scan(memoryview(b'JAVA PROFILE 6.0' + data[16:]))
+		with self.assertRaisesRegex(hprof.error.UnexpectedEof, 'truncated header'):
+			_scan.Scan(memoryview(data[:25]))
+
+	def test_record_past_end(self):
+		data = build(4) + struct.pack('>BII', 0x0d, 0, 10) + b'abc'
+		with self.assertRaisesRegex(hprof.error.UnexpectedEof, 'past the end of the file'):
+			_scan.Scan(memoryview(data))
+
+	def test_progress(self):
+		d = DumpBuilder()
+		big = 1 << 24
+		d._subrecords.append(bytes(Builder(4).u1(0x23).id(0x10).u4(1).u4(big).u1(jtype.byte.value)) + bytes(big))
+		d.root(0x10)
+		data = with_record(d.build(), 0x0d, bytes(big))
+		events = []
+		def progress(label, done, total):
+			events.append((label, done, total))
+		scan = _scan.Scan(memoryview(data), progress)
+		self.assertEqual(events[0], ('scanning', 31, len(data)))
+		self.assertEqual(events[-1], ('scanning', len(data), len(data)))
+		self.assertEqual(len(events), 3)
+		self.assertTrue(events[0][1] < events[1][1] < len(data))
+		del events[:]
+		self.assertEqual([size for size, n, objid, name in _scan.top_arrays(scan, 1)], [big])
+		start, end = scan.heap_ranges[0]
+		self.assertEqual(events, [
+			('scanning heap', end - start - 5, end - start),
+			('scanning heap', end - start, end - start),
+		])
+
+	def test_constant_pool(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		d.cls('com.example.Constants', objcls, (), (('N', jtype.int, 5),),
+				((1, jtype.long, 7), (2, jtype.object, objcls), (3, jtype.char, 'c')))
+		d.string('after')
+		scan = _scan.Scan(memoryview(d.build()))
+		self.assertEqual(scan.tags[0x1c], 1)
+		self.assertEqual(_scan.class_histogram(scan)['java.lang.String'][0], 1)
+		self.assertEqual(_scan.strings(scan), Counter({'after': 1}))
+
+	def test_bad_primitive_type(self):
+		d = DumpBuilder()
+		d._subrecords.append(bytes(Builder(4).u1(0x23).id(0x10).u4(1).u4(1).u1(99)) + b'\0')
+		scan = _scan.Scan(memoryview(d.build()))
+		with self.assertRaisesRegex(hprof.error.FormatError, 'bad primitive array type 99'):
+			list(scan.heap_records())
+
+	def test_heap_record_past_end(self):
+		d = DumpBuilder()
+		d._subrecords.append(bytes(Builder(4).u1(0x21).id(0x10).u4(1).id(0x20).u4(100)))
+		scan = _scan.Scan(memoryview(d.build()))
+		with self.assertRaisesRegex(hprof.error.UnexpectedEof, 'extends past its heap dump'):
+			list(scan.heap_records())
+
+	def test_bad_heap_record(self):
+		d = DumpBuilder()
+		d._subrecords.append(b'\x77')
+		scan = _scan.Scan(memoryview(d.build()))
+		with self.assertRaisesRegex(hprof.error.FormatError, '0x77'):
+			list(scan.heap_records())
+
+	def test_unknown_string_layout(self):
+		d = DumpBuilder()
+		objcls = d.cls('java.lang.Object', None)
+		strcls = d.cls('java.lang.String', objcls, (('chars', jtype.object),))
+		d.obj(strcls, None)
+		scan = _scan.Scan(memoryview(d.build()))
+		self.assertIsNone(_scan.strings(scan))
+
+
+class TestStrings(unittest.TestCase):
+
+	def strings(self, d):
+		return _scan.strings(_scan.Scan(memoryview(d.build())))
+
+	def test_no_instances(self):
+		d = DumpBuilder()
+		d.basics()
+		self.assertEqual(self.strings(d), Counter())
+
+	def test_without_coder(self):
+		d = DumpBuilder()
+		objcls = d.cls('java.lang.Object', None)
+		# a superclass field with the same name must not get in the way
+		base = d.cls('java.lang.Base', objcls, (('value', jtype.int),))
+		strcls = d.cls('java.lang.String', base,
+				(('value', jtype.object), ('count', jtype.int)),
+				(('CASE_INSENSITIVE_ORDER', jtype.object, 0), ('serialVersionUID', jtype.long, 1)))
+		d.cls('char[]', objcls)
+		d.cls('byte[]', objcls)
+		d.obj(strcls, d.primarray(jtype.char, list('wide')), 4, 0)
+		d.obj(strcls, d.primarray(jtype.byte, list(b'narrow')), 6, 0)
+		d.obj(strcls, None, 0, 0)
+		self.assertEqual(self.strings(d), Counter({'wide': 1, 'narrow': 1}))
+
+	def test_coders(self):
+		d = DumpBuilder()
+		d.basics()
+		utf16 = [(b ^ 0x80) - 0x80 for b in 'ĉu'.encode('utf-16-le')]
+		d.obj(d._strings, d.primarray(jtype.byte, utf16), 1, 0)
+		d.string('plain')
+		self.assertEqual(self.strings(d), Counter({'ĉu': 1, 'plain': 1}))
+		d.obj(d._strings, d.primarray(jtype.byte, [0]), 7, 0)
+		self.assertIsNone(self.strings(d))
+
+	def test_incomplete_hierarchy(self):
+		d = DumpBuilder()
+		strcls = d.cls('java.lang.String', 0x77, (('value', jtype.object),))
+		d._subrecords.append(bytes(Builder(4).u1(0x21).id(0x10).u4(1).id(strcls).u4(4).id(0)))
+		self.assertIsNone(self.strings(d))
+
+
+class TestCommands(unittest.TestCase):
+	def setUp(self):
+		fd, self.path = tempfile.mkstemp(suffix='.hprof')
+		with os.fdopen(fd, 'wb') as f:
+			f.write(with_record(build(8), 0x0d, b''))
+
+	def tearDown(self):
+		os.unlink(self.path)
+
+	def run_main(self, *args):
+		out = io.StringIO()
+		with redirect_stdout(out):
+			self.assertEqual(main(list(args)), 0)
+		return out.getvalue().splitlines()
+
+	def test_summary(self):
+		lines = self.run_main('summary', self.path)
+		self.assertEqual(lines[0], self.path)
+		self.assertIn('    format:  JAVA PROFILE 1.0.2, 8-byte ids', lines)
+		rows = [line.split() for line in lines]
+		self.assertIn('HEAP DUMP SEGMENT', [' '.join(row[2:]) for row in rows if row[0] == '2'])
+		self.assertIn('INSTANCE DUMP', [' '.join(row[2:]) for row in rows if row[0] == '7'])
+		self.assertIn(['4', 'byte[]'], rows)
+
+	def test_histogram(self):
+		lines = self.run_main('histogram', self.path, '--limit', '2')
+		self.assertEqual(lines[1].split(), ['4', '21', 'byte[]'])
+		self.assertEqual(len(lines), 3)
+		lines = self.run_main('histogram', self.path, '--sort', 'bytes', '--limit', '0')
+		self.assertEqual(lines[1].split(), ['1', '400', 'int[]'])
+
+	def test_strings(self):
+		lines = self.run_main('strings', self.path)
+		self.assertEqual(lines[0].split(), ['2', "'hello'"])
+		lines = self.run_main('strings', self.path, '--contains', 'å')
+		self.assertEqual(lines, ["         1  'Fånark'"])
+
+	def test_top_arrays(self):
+		lines = self.run_main('top-arrays', self.path, '--limit', '1')
+		self.assertEqual(len(lines), 2)
+		self.assertEqual(lines[1].split()[:2], ['400', '100'])
+		self.assertEqual(lines[1].split()[-1], 'int[]')
+
+	def test_unhandled(self):
+		lines = self.run_main('unhandled', self.path)
+		self.assertEqual(lines, [self.path, '    0x0d CPU SAMPLES          1'])
+
+	def test_top_arrays_unlimited(self):
+		lines = self.run_main('top-arrays', self.path, '--limit', '0')
+		self.assertEqual(len(lines), 9)
+		self.assertEqual(lines[-1].split()[-1], 'byte[]')
+
+	def test_histogram_sample(self):
+		lines = self.run_main('histogram', self.path, '--sample', '1', '--limit', '1')
+		self.assertEqual(len(lines), 2)
+		self.assertEqual(lines[1].split(), ['4', '(4-4)', '21', '(21-21)', 'byte[]'])
+
+	def test_strings_fallback(self):
+		d = DumpBuilder()
+		objcls = d.cls('java.lang.Object', None)
+		strcls = d.cls('java.lang.String', objcls, (('chars', jtype.object),))
+		strid = d.obj(strcls, None)
+		with open(self.path, 'wb') as f:
+			f.write(d.build())
+		# the object model does not know the layout either, but gets to decide
+		lines = self.run_main('strings', self.path)
+		self.assertEqual(lines, ['%10d  %r' % (1, 'String@%x' % strid)])
+
+	def test_strings_from_heap(self):
+		expected = self.run_main('strings', self.path)
+		real_open = _cli.open
+		def open_with_empty_heap(path, progress):
+			hf = real_open(path, progress)
+			hf.heaps.append(hprof.heap.Heap())
+			return hf
+		with patch('hprof._scan.strings', return_value=None), \
+				patch('hprof._cli.open', open_with_empty_heap):
+			lines = self.run_main('strings', self.path)
+		self.assertEqual(sorted(lines), sorted(expected))
+
+	def test_nothing_unhandled(self):
+		with open(self.path, 'wb') as f:
+			f.write(build(4))
+		lines = self.run_main('unhandled', self.path)
+		self.assertEqual(lines, [self.path, '    <no unhandled records>'])
+
+	def test_progress(self):
+		err = io.StringIO()
+		err.isatty = lambda: True
+		with redirect_stderr(err):
+			self.run_main('histogram', self.path)
+		self.assertIn('%s: opening...' % self.path, err.getvalue())
+		self.assertIn('scanning heap 100%', err.getvalue())
+		self.assertTrue(err.getvalue().endswith(79 * ' ' + '\r'))
+
+	def test_summarize(self):
+		events = []
+		summary = _scan.summarize(self.path, lambda *args: events.append(args))
+		self.assertEqual(summary.unhandled, {0x0d: 1})
+		self.assertEqual(summary.object_arrays, 1)
+		self.assertEqual(events[0], ('opening', None, None))
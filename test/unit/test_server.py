@@ -0,0 +1,323 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import argparse
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import hprof
+
+from contextlib import redirect_stderr
+from unittest.mock import patch
+
+from hprof._cli import main, make_parser, parse_size
+
+from .util import DumpBuilder
+
+EXAMPLE = 'testdata/example-java.hprof.bz2'
+
+class TestHeapCache(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.paths = []
+		for name in ('a', 'b', 'c'):
+			path = os.path.join(self.tmpdir, name + '.hprof.bz2')
+			shutil.copy(EXAMPLE, path)
+			self.paths.append(path)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def test_reuse(self):
+		cache = hprof.server.HeapCache()
+		try:
+			hf = cache.get(self.paths[0])
+			self.assertIs(cache.get(self.paths[0]), hf)
+			self.assertIs(cache.get(os.path.join(self.tmpdir, '.', 'a.hprof.bz2')), hf)
+			self.assertEqual(len(cache.status()), 1)
+		finally:
+			cache.close()
+		self.assertEqual(cache.status(), [])
+
+	def test_lru_eviction(self):
+		cache = hprof.server.HeapCache()
+		try:
+			cache.get(self.paths[0])
+			cost = cache.cost()
+			self.assertGreater(cost, 0)
+			cache.memory_budget = 2 * cost
+			cache.get(self.paths[1])
+			cache.get(self.paths[0]) # now b is the least recently used
+			cache.get(self.paths[2])
+			self.assertEqual([path for path, cost in cache.status()],
+					[os.path.realpath(p) for p in (self.paths[0], self.paths[2])])
+		finally:
+			cache.close()
+
+	def test_keeps_one_over_budget(self):
+		cache = hprof.server.HeapCache(memory_budget=1)
+		try:
+			cache.get(self.paths[0])
+			cache.get(self.paths[1])
+			self.assertEqual([path for path, cost in cache.status()],
+					[os.path.realpath(self.paths[1])])
+		finally:
+			cache.close()
+
+	def test_log(self):
+		messages = []
+		cache = hprof.server.HeapCache(log=messages.append)
+		try:
+			self.assertIsNone(cache.loaded(self.paths[0]))
+			hf = cache.get(self.paths[0])
+			self.assertIs(cache.loaded(self.paths[0]), hf)
+			self.assertTrue(cache.evict(self.paths[0]))
+			self.assertFalse(cache.evict(self.paths[0]))
+		finally:
+			cache.close()
+		key = os.path.realpath(self.paths[0])
+		self.assertEqual(messages[0], 'loading %s' % key)
+		self.assertTrue(messages[1].startswith('loaded %s; ' % key))
+		self.assertEqual(messages[2:], ['evicting %s' % key])
+
+	def test_loaded_modified(self):
+		cache = hprof.server.HeapCache()
+		try:
+			cache.get(self.paths[0])
+			st = os.stat(self.paths[0])
+			os.utime(self.paths[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+			self.assertIsNone(cache.loaded(self.paths[0]))
+		finally:
+			cache.close()
+
+	def test_reload_modified(self):
+		cache = hprof.server.HeapCache()
+		try:
+			hf = cache.get(self.paths[0])
+			st = os.stat(self.paths[0])
+			os.utime(self.paths[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+			self.assertIsNot(cache.get(self.paths[0]), hf)
+			self.assertEqual(len(cache.status()), 1)
+		finally:
+			cache.close()
+
+
+class TestServer(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		cls.tmpdir = tempfile.mkdtemp()
+		cls.address = os.path.join(cls.tmpdir, 'hprof.sock')
+		cls.server = hprof.server.Server(cls.address)
+		cls.thread = threading.Thread(target=cls.server.serve_forever)
+		cls.thread.start()
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.shutdown()
+		cls.thread.join()
+		cls.server.close()
+		shutil.rmtree(cls.tmpdir)
+
+	def setUp(self):
+		self.client = hprof.server.Client(self.address)
+
+	def tearDown(self):
+		self.client.close()
+
+	def test_histogram(self):
+		hist = self.client.histogram(EXAMPLE)
+		counts = dict(hist)
+		self.assertEqual(counts['com.example.cars.Car'], 2)
+		self.assertEqual(counts['com.example.cars.Limo'], 1)
+		self.assertEqual([count for name, count in hist],
+				sorted((count for name, count in hist), reverse=True))
+		self.assertEqual(len(self.client.histogram(EXAMPLE, limit=3)), 3)
+
+	def test_histogram_scans_unloaded(self):
+		self.client.evict(EXAMPLE)
+		scanned = self.client.histogram(EXAMPLE)
+		self.assertEqual(self.client.status()['files'], [])
+		self.client.load(EXAMPLE)
+		self.assertEqual(dict(self.client.histogram(EXAMPLE)), dict(scanned))
+
+	def test_instances(self):
+		result = self.client.instances(EXAMPLE, 'com.example.cars.Car')
+		self.assertEqual(result['count'], 3)
+		self.assertEqual(len(result['ids']), 3)
+		result = self.client.instances(EXAMPLE, 'com.example.cars.Car', subclasses=False, limit=1)
+		self.assertEqual(result['count'], 2)
+		self.assertEqual(len(result['ids']), 1)
+
+	def test_strings(self):
+		strings = self.client.strings(EXAMPLE, contains='Stretch', limit=None)
+		self.assertEqual([text for objid, text in strings], ['Stretch'])
+
+	def test_follow(self):
+		carex, = self.client.instances(EXAMPLE, 'com.example.Cars')['ids']
+		arr = self.client.follow(EXAMPLE, carex, 'vehicles')
+		self.assertEqual(arr['type'], 'com.example.cars.Vehicle[]')
+		self.assertEqual(arr['length'], 5)
+		make = self.client.follow(EXAMPLE, carex, 'vehicles', 0, 'make')
+		self.assertEqual(make['type'], 'java.lang.String')
+		self.assertEqual(make['str'], 'Lolvo')
+		self.assertEqual(self.client.follow(EXAMPLE, carex, 'vehicles', 0, 'numWheels'), 4)
+
+	def test_errors(self):
+		with self.assertRaisesRegex(hprof.error.RemoteError, 'KeyError'):
+			self.client.follow(EXAMPLE, 1)
+		with self.assertRaisesRegex(hprof.error.RemoteError, 'TypeError'):
+			self.client.request('status', bogus=1)
+		with self.assertRaisesRegex(hprof.error.RemoteError, 'unknown op'):
+			self.client.request('nonsense')
+		with self.assertRaisesRegex(hprof.error.RemoteError, 'FileNotFoundError'):
+			self.client.histogram('does/not/exist.hprof')
+		# the connection is still usable
+		self.assertGreater(self.client.load(EXAMPLE), 0)
+
+	def test_instances_of_classes(self):
+		result = self.client.instances(EXAMPLE, 'java.lang.Class', limit=None)
+		self.assertGreater(result['count'], 0)
+		self.assertLessEqual(len(result['ids']), result['count'])
+
+	def test_missing_classes(self):
+		d = DumpBuilder()
+		d.cls('java.lang.Object', None)
+		with tempfile.NamedTemporaryFile(suffix='.hprof') as f:
+			f.write(d.build())
+			f.flush()
+			self.assertEqual(self.client.instances(f.name, 'com.example.Nope'), {'count': 0, 'ids': []})
+			self.assertEqual(self.client.strings(f.name), [])
+			self.assertTrue(self.client.evict(f.name))
+
+	def test_strings_limit(self):
+		self.assertEqual(len(self.client.strings(EXAMPLE, limit=2)), 2)
+
+	def test_evict(self):
+		self.client.load(EXAMPLE)
+		self.assertTrue(self.client.evict(EXAMPLE))
+		self.assertFalse(self.client.evict(EXAMPLE))
+		self.assertEqual(self.client.status()['files'], [])
+
+	def test_bad_json(self):
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(self.address)
+			with sock.makefile('rwb') as f:
+				f.write(b'{nonsense\n')
+				f.flush()
+				response = json.loads(f.readline())
+		self.assertFalse(response['ok'])
+		self.assertEqual(response['type'], 'JSONDecodeError')
+
+	def test_status(self):
+		self.client.load(EXAMPLE)
+		status = self.client.status()
+		self.assertIsNone(status['memory_budget'])
+		self.assertIn(os.path.realpath(EXAMPLE), [path for path, cost in status['files']])
+
+
+class TestServerSetup(unittest.TestCase):
+	def setUp(self):
+		self.tmpdir = tempfile.mkdtemp()
+		self.address = os.path.join(self.tmpdir, 'hprof.sock')
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpdir)
+
+	def serve(self, server):
+		thread = threading.Thread(target=server.serve_forever)
+		thread.start()
+		self.addCleanup(thread.join)
+		self.addCleanup(server.shutdown)
+
+	def test_tcp(self):
+		with hprof.server.Server(('127.0.0.1', 0)) as server:
+			self.serve(server)
+			with hprof.server.Client(server.address) as client:
+				self.assertEqual(client.status(), {'memory_budget': None, 'files': []})
+
+	def test_stale_socket(self):
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.bind(self.address) # left behind when closed
+		self.assertTrue(os.path.exists(self.address))
+		with hprof.server.Server(self.address) as server:
+			self.serve(server)
+			with hprof.server.Client(self.address) as client:
+				self.assertEqual(client.status()['files'], [])
+			os.unlink(self.address) # already gone when closing is fine
+		self.assertFalse(os.path.exists(self.address))
+
+	def test_no_server(self):
+		with self.assertRaises(FileNotFoundError):
+			hprof.server.Client(self.address)
+
+	def test_connection_closed(self):
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+			listener.bind(self.address)
+			listener.listen(1)
+			with hprof.server.Client(self.address) as client:
+				conn, _ = listener.accept()
+				def hang_up():
+					with conn:
+						conn.recv(1024)
+				thread = threading.Thread(target=hang_up)
+				thread.start()
+				with self.assertRaisesRegex(hprof.error.RemoteError, 'connection closed'):
+					client.status()
+				thread.join()
+
+
+class TestDescribe(unittest.TestCase):
+	def test_values(self):
+		with hprof.open(EXAMPLE) as hf:
+			heap, = hf.heaps
+			car, = heap.classes['com.example.cars.Car']
+			self.assertEqual(hprof.server.describe(car), {'type': 'java.lang.Class', 'str': str(car)})
+			self.assertEqual(hprof.server.describe(7), 7)
+			self.assertIsNone(hprof.server.describe(None))
+			del heap, car
+
+
+class TestCommandLine(unittest.TestCase):
+	def test_parse_size(self):
+		self.assertEqual(parse_size('100'), 100)
+		self.assertEqual(parse_size('2k'), 2048)
+		self.assertEqual(parse_size('1.5M'), 1536 * 1024)
+		self.assertEqual(parse_size('4GiB'), 4 << 30)
+		self.assertEqual(parse_size('1T'), 1 << 40)
+
+	def test_bad_size(self):
+		with self.assertRaisesRegex(argparse.ArgumentTypeError, 'not a size'):
+			parse_size('lots')
+		with self.assertRaisesRegex(argparse.ArgumentTypeError, 'not a size'):
+			parse_size('12X')
+
+	def test_serve(self):
+		tmpdir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, tmpdir)
+		sock = os.path.join(tmpdir, 'hprof.sock')
+		for argv, address in ((['--socket', sock], sock), (['--port', '0'], ('127.0.0.1', 0))):
+			with self.subTest(argv=argv):
+				err = io.StringIO()
+				with patch('hprof.server.Server.serve_forever', side_effect=KeyboardInterrupt) as serve, \
+						redirect_stderr(err):
+					self.assertEqual(main(['serve'] + argv), 0)
+				serve.assert_called_once_with()
+				self.assertIn('listening on ', err.getvalue())
+				if isinstance(address, str):
+					self.assertIn(address, err.getvalue())
+					self.assertFalse(os.path.exists(address))
+				else:
+					self.assertIn("('127.0.0.1', ", err.getvalue())
+
+	def test_serve_args(self):
+		args = make_parser().parse_args(['serve', '--port', '1234', '--memory-budget', '1G'])
+		self.assertEqual(args.port, 1234)
+		self.assertEqual(args.memory_budget, 1 << 30)
+		args = make_parser().parse_args(['serve', '--socket', '/tmp/x.sock'])
+		self.assertEqual(args.socket, '/tmp/x.sock')
+		self.assertIsNone(args.memory_budget)
@@ -0,0 +1,166 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import io
+import os
+import tempfile
+import unittest
+import hprof
+
+from contextlib import redirect_stdout
+
+from hprof._cli import main
+from hprof._parsing import jtype
+from hprof._sketch import CountMinSketch, HyperLogLog, hash64
+
+from .util import DumpBuilder
+
+class TestHyperLogLog(unittest.TestCase):
+
+	def test_accuracy(self):
+		for n in (0, 1, 100, 20000):
+			with self.subTest(n=n):
+				hll = HyperLogLog()
+				for i in range(n):
+					hll.add(hash64(b'%d' % i))
+					hll.add(hash64(b'%d' % i))
+				self.assertAlmostEqual(hll.estimate(), n, delta=max(2, n * 0.05))
+
+	def test_error_bound(self):
+		n = 20000
+		for p in (6, 10, 14):
+			with self.subTest(p=p):
+				hll = HyperLogLog(p)
+				for i in range(n):
+					hll.add(hash64(b'p%d %d' % (p, i)))
+				stderr = 1.04 / (1 << p) ** 0.5
+				self.assertLess(abs(hll.estimate() - n), 4 * stderr * n)
+
+	def test_merge_is_union(self):
+		a = HyperLogLog(8)
+		b = HyperLogLog(8)
+		both = HyperLogLog(8)
+		for i in range(5000):
+			h = hash64(b'%d' % i)
+			(a if i % 3 else b).add(h)
+			both.add(h)
+		a.merge(b)
+		self.assertEqual(a.registers, both.registers)
+		self.assertEqual(a.estimate(), both.estimate())
+
+	def test_merge(self):
+		a = HyperLogLog(10)
+		b = HyperLogLog(10)
+		for i in range(3000):
+			(a if i % 2 else b).add(hash64(b'%d' % i))
+		a.merge(b)
+		self.assertAlmostEqual(a.estimate(), 3000, delta=300)
+		with self.assertRaises(ValueError):
+			a.merge(HyperLogLog(11))
+
+	def test_bad_precision(self):
+		with self.assertRaises(ValueError):
+			HyperLogLog(30)
+
+
+class TestCountMinSketch(unittest.TestCase):
+
+	def test_never_too_low(self):
+		cms = CountMinSketch(width=64, depth=3)
+		for i in range(1000):
+			cms.add(hash64(b'%d' % (i % 100)))
+		for i in range(100):
+			self.assertGreaterEqual(cms.estimate(hash64(b'%d' % i)), 10)
+
+	def test_error_bound(self):
+		width, depth, total = 256, 4, 5000
+		cms = CountMinSketch(width, depth)
+		for i in range(total):
+			cms.add(hash64(b'%d' % (i % 1000)))
+		bound = 5 + 2 * total / width
+		over = sum(1 for i in range(1000) if cms.estimate(hash64(b'%d' % i)) > bound)
+		# each estimate is within the bound with probability 1 - 2**-depth
+		self.assertLess(over, 1000 * 2 ** -depth)
+
+	def test_add_returns_estimate(self):
+		cms = CountMinSketch(width=8, depth=2)
+		h = hash64(b'x')
+		self.assertEqual(cms.add(h, 3), 3)
+		self.assertEqual(cms.add(h), cms.estimate(h))
+		self.assertGreaterEqual(cms.estimate(h), 4)
+
+
+class TestTriage(unittest.TestCase):
+
+	def setUp(self):
+		d = DumpBuilder()
+		objcls = d.basics()
+		point = d.cls('com.example.Point', objcls, (('x', jtype.int), ('y', jtype.int)))
+		for i in range(100):
+			d.obj(point, i % 10, 0)
+		self.big = d.primarray(jtype.long, [7] * 100)
+		for i in range(20):
+			d.primarray(jtype.long, [7] * 100)
+		for i in range(50):
+			d.primarray(jtype.long, [i])
+		# the same class from another class loader
+		other = d.cls('com.example.Point', objcls, (('x', jtype.int), ('y', jtype.int)))
+		for i in range(5):
+			d.obj(other, 100 + i, 0)
+		# arrays without any duplicates
+		arrcls = d.cls('[Lcom/example/Point;', objcls)
+		for i in range(3):
+			d.objarray(arrcls, [objcls] * i)
+		fd, self.path = tempfile.mkstemp(suffix='.hprof')
+		with os.fdopen(fd, 'wb') as f:
+			f.write(d.build(segments=3))
+
+	def tearDown(self):
+		os.unlink(self.path)
+
+	def test_triage(self):
+		result = hprof.triage(self.path)
+		points = result['com.example.Point']
+		self.assertEqual((points.count, points.distinct, points.nbytes), (105, 15, 840))
+		self.assertEqual(points.duplicates, 90)
+		self.assertEqual(points.wasted_bytes, 720)
+		self.assertEqual([(n, size) for n, size, _ in points.top], [(10, 8)] * 10)
+
+		longs = result['long[]']
+		self.assertEqual(longs.count, 71)
+		self.assertAlmostEqual(longs.distinct, 51, delta=3)
+		n, size, objid = longs.top[0]
+		self.assertEqual((n, size, objid), (21, 800, self.big))
+		self.assertAlmostEqual(longs.wasted_bytes, 20 * 800, delta=3 * 8)
+
+		arrays = result['com.example.Point[]']
+		self.assertEqual((arrays.count, arrays.distinct, arrays.top, arrays.wasted_bytes), (3, 3, [], 0))
+		self.assertEqual(repr(arrays), '<ClassTriage count=3 distinct=3 wasted_bytes=0>')
+
+	def test_top_limit(self):
+		result = hprof.triage(self.path, top=3)
+		points = result['com.example.Point']
+		self.assertEqual([(n, size) for n, size, _ in points.top], [(10, 8)] * 3)
+		self.assertEqual(points.wasted_bytes, 720)
+		self.assertEqual(result['long[]'].top[0][:2], (21, 800))
+
+	def test_cli(self):
+		out = io.StringIO()
+		with redirect_stdout(out):
+			self.assertEqual(main(['triage', self.path, '--limit', '1', '--top', '1']), 0)
+		lines = out.getvalue().splitlines()
+		self.assertEqual(lines[1].split()[0], '71')
+		self.assertEqual(lines[1].split()[2], '17200')
+		self.assertEqual(lines[1].split()[4], 'long[]')
+		self.assertEqual(lines[2].split()[:2], ['21', '800'])
+		self.assertEqual(len(lines), 3)
+
+	def test_cli_all(self):
+		out = io.StringIO()
+		with redirect_stdout(out):
+			self.assertEqual(main(['triage', self.path, '--limit', '0', '--top', '0']), 0)
+		lines = out.getvalue().splitlines()
+		self.assertEqual(lines[0].split(), ['count', 'distinct', 'bytes', 'wasted', 'class'])
+		# classes without duplicates are left out
+		self.assertEqual([line.split()[-1] for line in lines[1:]], ['long[]', 'com.example.Point'])
+		self.assertEqual(lines[2].split(), ['105', '15', '840', '720', 'com.example.Point'])
@@ -0,0 +1,160 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import io
+import unittest
+import hprof
+
+from hprof._spill import SpillArray
+from hprof._parsing import jtype
+
+from .util import DumpBuilder
+
+class TestSpillArray(unittest.TestCase):
+
+	def test_in_memory(self):
+		a = SpillArray('=QB', 1000)
+		a.append((1, 2))
+		a.append((3, 4))
+		self.assertEqual(a.spilled, 0)
+		self.assertEqual(list(a), [(1, 2), (3, 4)])
+		self.assertEqual(a[-2], (1, 2))
+		with self.assertRaises(IndexError):
+			a[2]
+		# the buffer is read in place, and can grow again after reading
+		it = iter(a)
+		next(it)
+		it.close()
+		self.assertEqual(list(a.iter_range(1, 2)), [(3, 4)])
+		a.append((5, 6))
+		self.assertEqual(list(a), [(1, 2), (3, 4), (5, 6)])
+
+	def test_spilled(self):
+		a = SpillArray('=QI', 100)
+		for i in range(1000):
+			a.append((i, 1000 - i))
+		self.assertEqual(len(a), 1000)
+		self.assertGreater(a.spilled, 900)
+		self.assertEqual(a[0], (0, 1000))
+		self.assertEqual(a[999], (999, 1))
+		self.assertEqual(list(a), [(i, 1000 - i) for i in range(1000)])
+		# appending after reading
+		a.append((5, 5))
+		self.assertEqual(a[1000], (5, 5))
+		a.clear()
+		self.assertEqual(list(a), [])
+
+	def test_ranges(self):
+		a = SpillArray('=QI', 100)
+		for i in range(50):
+			a.append((i, 2 * i))
+		self.assertGreater(a.spilled, 0)
+		self.assertLess(a.spilled, 50)
+		expected = list(a)
+		for start, stop in ((0, 50), (0, 3), (3, 3), (a.spilled - 1, a.spilled + 2), (a.spilled, 50), (45, 99)):
+			self.assertEqual(list(a.iter_range(start, stop)), expected[start:stop])
+		a.clear()
+
+	def test_extend(self):
+		a = SpillArray('=QI', 100)
+		b = SpillArray('=QI', 100)
+		a.append((1, 1))
+		for i in range(30):
+			b.append((i, i))
+		a.extend(b)
+		self.assertEqual(list(a), [(1, 1)] + list(b))
+		with self.assertRaises(ValueError):
+			a.extend(SpillArray('=QB', None))
+		a.clear()
+		b.clear()
+
+	def test_write_read(self):
+		a = SpillArray('=QI', 100)
+		for i in range(30):
+			a.append((i, 3 * i))
+		self.assertGreater(a.spilled, 0)
+		f = io.BytesIO()
+		a.write_to(f)
+		self.assertEqual(len(f.getvalue()), a.nbytes)
+		for budget in (None, 50):
+			with self.subTest(budget=budget):
+				b = SpillArray('=QI', budget)
+				f.seek(0)
+				b.read_from(f, a.nbytes)
+				self.assertEqual(list(b), list(a))
+				b.clear()
+		a.clear()
+
+	def test_read_errors(self):
+		a = SpillArray('=QI', None)
+		with self.assertRaisesRegex(ValueError, 'not a whole number of records'):
+			a.read_from(io.BytesIO(bytes(24)), 13)
+		with self.assertRaisesRegex(EOFError, '12 bytes of records missing'):
+			a.read_from(io.BytesIO(bytes(24)), 36)
+		self.assertEqual(len(a), 2)
+
+	def test_over_budget_on_append(self):
+		a = SpillArray('=QI', 0) # every record goes to disk
+		a.append((1, 2))
+		self.assertEqual((len(a), a.spilled), (1, 1))
+		self.assertEqual(a[0], (1, 2))
+		a.clear()
+
+
+class TestMemoryBudget(unittest.TestCase):
+
+	def build(self, idsize):
+		d = DumpBuilder(idsize)
+		objcls = d.basics()
+		thing = d.cls('com.example.Thing', objcls, (('ref', jtype.object), ('n', jtype.int)))
+		thingarr = d.cls('[Lcom/example/Thing;', objcls)
+		things = [d.obj(thing, None, i) for i in range(50)]
+		arr = d.objarray(thingarr, things + [None])
+		d.obj(thing, arr, 99)
+		d.primarray(jtype.int, list(range(100)))
+		d.string('hello')
+		return d.build(segments=3)
+
+	def test_same_as_unbounded(self):
+		for idsize in (4, 8):
+			with self.subTest(idsize=idsize):
+				data = self.build(idsize)
+				with hprof.parse(data) as expected, hprof.parse(data, memory_budget=0) as actual:
+					self.assertEqual(self.describe(expected.heaps[0]), self.describe(actual.heaps[0]))
+
+	def describe(self, heap):
+		out = {}
+		for obj in heap.values():
+			if isinstance(obj, hprof.heap.JavaClass):
+				continue
+			objid = hprof.heap.JavaObject._hprof_id.__get__(obj)
+			if isinstance(obj, hprof.heap.JavaArray):
+				value = tuple(
+					hprof.heap.JavaObject._hprof_id.__get__(e) if isinstance(e, hprof.heap.JavaObject) else e
+					for e in obj
+				)
+			else:
+				value = str(obj)
+			out[objid] = (str(type(obj)), value)
+		return out
+
+	def test_object_array(self):
+		with hprof.parse(self.build(4), memory_budget=0) as hf:
+			holder = [o for o in hf.heaps[0].exact_instances('com.example.Thing') if o.n == 99][0]
+			arr = holder.ref
+			self.assertEqual(len(arr), 51)
+			self.assertEqual(arr[3].n, 3)
+			self.assertIsNone(arr[-1])
+			self.assertEqual([t.n for t in arr[1:3]], [1, 2])
+			with self.assertRaises(IndexError):
+				arr[51]
+			del holder, arr
+
+	def test_compact_by_default(self):
+		with hprof.parse(self.build(8)) as hf:
+			heap, = hf.heaps
+			self.assertIsNotNone(heap._data)
+			arr, = heap.exact_instances('com.example.Thing[]')
+			self.assertIsInstance(arr._hprof_array_data, hprof.heap._ObjectArrayData)
+			self.assertEqual(arr[5].n, 5)
+			del heap, arr
@@ -0,0 +1,140 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import sys
+import threading
+import unittest
+import hprof
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .util import DumpBuilder
+
+NTHREADS = 8
+
+def build():
+	d = DumpBuilder()
+	objcls = d.basics()
+	_, ids = d.nodes(objcls, 200)
+	arrcls = d.cls('[Lcom/example/Node;', objcls)
+	d.objarray(arrcls, ids[-1:] * 50)
+	return d.build()
+
+def walk(heap):
+	''' reads everything that is built or decoded on first use. '''
+	out = []
+	node, = heap.classes['com.example.Node']
+	out.append(heap.count(node))
+	out.append(sum(heap.instance_mask(node)))
+	out.append(str(heap.classtree.com.example.Node))
+	for obj in heap.exact_instances(node):
+		out.append((heap.index_of(obj), obj.n, str(obj.text), len(obj.text.value)))
+		nxt = obj.next
+		out.append(None if nxt is None else nxt.n)
+	arr, = heap.exact_instances(heap.classes['com.example.Node[]'][0])
+	out.append([e.n for e in arr])
+	offsets, targets = heap.reference_graph()
+	out.append(list(targets))
+	return out
+
+
+class TestThreads(unittest.TestCase):
+
+	def setUp(self):
+		self.interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6) # switch threads as often as possible
+
+	def tearDown(self):
+		sys.setswitchinterval(self.interval)
+
+	def hammer(self, fn, *args):
+		barrier = threading.Barrier(NTHREADS)
+		def task():
+			barrier.wait()
+			return fn(*args)
+		with ThreadPoolExecutor(NTHREADS) as pool:
+			futures = [pool.submit(task) for _ in range(NTHREADS)]
+			return [f.result() for f in futures]
+
+	def test_readers(self):
+		data = build()
+		with hprof.parse(data) as hf:
+			heap, = hf.heaps
+			expected = walk(heap)
+			del heap
+		for lazy in (False, True):
+			with self.subTest(lazy_references=lazy), hprof.parse(data, lazy_references=lazy) as hf:
+				heap, = hf.heaps
+				for result in self.hammer(walk, heap):
+					self.assertEqual(result, expected)
+				del heap
+
+	def test_materialized_once(self):
+		with hprof.parse(build()) as hf:
+			heap, = hf.heaps
+			arrays = list(heap.exact_instances('byte[]'))
+			def first_touch():
+				return [arr._hprof_array_data if len(arr) else None for arr in arrays]
+			results = self.hammer(first_touch)
+			for result in results[1:]:
+				for a, b in zip(result, results[0]):
+					self.assertIs(a, b)
+			del heap, arrays
+
+	def test_numbered_while_waiting(self):
+		# another thread numbers the classes while this one waits for the lock
+		with hprof.parse(build()) as hf:
+			heap, = hf.heaps
+			numbering = hprof._index.ClassNumbering(heap.classes)
+			class Lock(object):
+				def __enter__(self):
+					heap._numbering = numbering
+				def __exit__(self, *exc):
+					pass
+			heap._lock = Lock()
+			heap._numbering = None
+			self.assertIs(heap._get_numbering(), numbering)
+			del heap
+
+	def test_indexed_while_waiting(self):
+		# another thread builds the dense index while this one waits for the lock
+		with hprof.parse(build()) as hf:
+			heap, = hf.heaps
+			index = hprof._index.DenseIndex(heap)
+			class Lock(object):
+				def __enter__(self):
+					heap._index = index
+				def __exit__(self, *exc):
+					pass
+			heap._lock = Lock()
+			heap._index = None
+			self.assertIs(heap._get_index(), index)
+			del heap
+
+	def test_classtree_while_waiting(self):
+		# another thread builds the class tree while this one waits for the lock
+		with hprof.parse(build()) as hf:
+			heap, = hf.heaps
+			classnames = heap._classnames
+			class Lock(object):
+				def __enter__(self):
+					classnames.tree()
+				def __exit__(self, *exc):
+					pass
+			heap._lock = Lock()
+			classnames._tree = None
+			tree = heap.classtree
+			self.assertIs(heap.classtree, tree)
+			self.assertEqual(str(tree.com.example.Node), 'com.example.Node')
+			del heap
+
+	def test_names(self):
+		with hprof.parse(build()) as hf:
+			ids = [nameid for nameid in hf.names if nameid]
+			def lookup():
+				return [hf.names[nameid] for nameid in ids]
+			results = self.hammer(lookup)
+			self.assertIn('com.example.Node', results[0])
+			for result in results:
+				self.assertEqual(result, results[0])
+			self.assertEqual(len(hf.names), len(ids) + 1)
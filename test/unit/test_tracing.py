@@ -0,0 +1,98 @@
+# Copyright (C) 2020 Sony Mobile Communications Inc.
+# Licensed under the LICENSE.
+
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import hprof
+
+from unittest.mock import MagicMock
+
+class FakeClock(object):
+	def __init__(self):
+		self.now = 100.0
+
+	def __call__(self):
+		return self.now
+
+class TestChromeTrace(unittest.TestCase):
+	def setUp(self):
+		self.clock = FakeClock()
+		self.trace = hprof.tracing.ChromeTrace(clock=self.clock)
+
+	def report(self, when, label, done=None, total=None):
+		self.clock.now = 100.0 + when
+		self.trace(label, done, total)
+
+	def test_no_events(self):
+		self.trace.finish()
+		self.assertEqual(self.trace.spans(), [])
+		events = self.trace.events()
+		self.assertEqual(len(events), 1)
+		self.assertEqual(events[0]['ph'], 'M')
+
+	def test_spans(self):
+		self.report(0.5, 'opening')
+		self.report(1.0, 'extracting', 0, 10)
+		self.report(1.5, 'extracting', 5, 10)
+		self.report(3.0, 'parsing', 0, 20)
+		self.report(4.0, 'resolving heap 1/1', 0, 3)
+		self.assertEqual(self.trace.spans(), [
+			('opening', 0.5, 1.0),
+			('extracting', 1.0, 3.0),
+			('parsing', 3.0, 4.0),
+		])
+		self.clock.now = 106.0
+		self.trace.finish()
+		self.trace.finish() # no effect
+		self.assertEqual(self.trace.spans()[-1], ('resolving heap 1/1', 4.0, 6.0))
+
+	def test_events(self):
+		self.report(0.25, 'parsing', 0, 20)
+		self.report(0.5, 'parsing', 12, 20)
+		self.report(1.0, 'resolving stacktraces')
+		self.trace.finish()
+		events = self.trace.events()
+		spans = [e for e in events if e['ph'] == 'X']
+		counters = [e for e in events if e['ph'] == 'C']
+		self.assertEqual([(e['name'], e['ts'], e['dur']) for e in spans], [
+			('parsing', 250000, 750000),
+			('resolving stacktraces', 1000000, 0),
+		])
+		self.assertEqual([(e['name'], e['ts'], e['args']) for e in counters], [
+			('parsing', 250000, {'done': 0, 'remaining': 20}),
+			('parsing', 500000, {'done': 12, 'remaining': 8}),
+		])
+		for e in events:
+			self.assertEqual(e['pid'], os.getpid())
+
+	def test_forwarding(self):
+		forward = MagicMock()
+		trace = hprof.tracing.ChromeTrace(forward)
+		trace('parsing', 1, 2)
+		trace('resolving stacktraces', None, None)
+		self.assertEqual(forward.call_count, 2)
+		self.assertEqual(forward.call_args_list[0][0], ('parsing', 1, 2))
+		self.assertEqual(forward.call_args_list[1][0], ('resolving stacktraces', None, None))
+
+	def test_write_file(self):
+		self.report(0, 'parsing', 0, 1)
+		self.clock.now = 101.0
+		out = io.StringIO()
+		self.trace.write(out)
+		doc = json.loads(out.getvalue())
+		self.assertEqual(doc['displayTimeUnit'], 'ms')
+		self.assertEqual(doc['traceEvents'], self.trace.events())
+		self.assertEqual(self.trace.spans(), [('parsing', 0.0, 1.0)])
+
+	def test_write_path(self):
+		self.report(0, 'parsing', 0, 1)
+		with tempfile.TemporaryDirectory() as tmpdir:
+			path = os.path.join(tmpdir, 'trace.json')
+			self.trace.write(path)
+			with open(path) as f:
+				doc = json.load(f)
+		self.assertEqual(doc['traceEvents'], self.trace.events())
@@ -106,6 +106,7 @@ class HeapRecordTest(unittest.TestCase):
 	def setUp(self):
 		self.hf = hprof._parsing.HprofFile()
 		self.heap = hprof.heap.Heap()
+		hprof._heap_parsing.use_compact_queues(self.heap, None, self.idsize, None)
 		self.hf.heaps.append(self.heap)
 		load = hprof._parsing.ClassLoad(self.id(0x0b1ec7), 'java.lang.Object', 0)
 		self.hf.classloads_by_id[load.class_id] = load
@@ -113,7 +114,188 @@ class HeapRecordTest(unittest.TestCase):
 	def doit(self, rtype, data):
 		expected_pos = len(data)
 		data.extend(b'sentinel')
+		self.heap._data = bytes(data) # queued records refer into it
 		reader = hprof._parsing.PrimitiveReader(memoryview(data), self.idsize)
 		parser = hprof._heap_parsing.RECORD_PARSERS[rtype]
 		parser(self.hf, self.heap, reader)
 		self.assertEqual(reader._pos, expected_pos, 'parser read more or less than expected')
+
+	def queue_data(self, *chunks):
+		''' makes the chunks the heap's data; returns the (offset, length) of
+		each, for queue records that refer to them. '''
+		self.heap._data = b''.join(chunks)
+		out = []
+		offset = 0
+		for chunk in chunks:
+			out.append((offset, len(chunk)))
+			offset += len(chunk)
+		return out
+
+
+class DumpBuilder(object):
+	''' Builds complete (if small) hprof files, for tests that need to parse
+	a whole file rather than a single record. '''
+
+	def __init__(self, idsize=4):
+		self.idsize = idsize
+		self._names = {}
+		self._nextid = 0x1000
+		self._classes = {} # clsid -> (name, superid, ifields)
+		self._loads = [] # (clsid, nameid)
+		self._subrecords = []
+		self._strings = None
+
+	def _allocid(self):
+		self._nextid += 0x10
+		return self._nextid
+
+	def name(self, s):
+		''' returns the name id of string s, adding a name record if needed '''
+		if s not in self._names:
+			self._names[s] = self._allocid()
+		return self._names[s]
+
+	def cls(self, name, superid, ifields=(), sfields=(), constants=()):
+		''' add a class dump; returns the class id.
+
+		ifields is a sequence of (name, jtype) pairs; sfields is a sequence of
+		(name, jtype, value) triples; constants is a sequence of (index, jtype,
+		value) triples for the constant pool.
+		'''
+		from hprof._parsing import jtype
+		clsid = self._allocid()
+		nameid = self.name(name)
+		self._loads.append((clsid, nameid))
+		self._classes[clsid] = (name, superid, tuple(ifields))
+		b = Builder(self.idsize)
+		b.u1(0x20).id(clsid).u4(1).id(superid or 0)
+		b.id(0).id(0).id(0).id(0).id(0)
+		b.u4(0) # instance size
+		b.u2(len(constants))
+		for index, ftype, val in constants:
+			b.u2(index).u1(ftype.value)
+			self._value(b, ftype, val)
+		b.u2(len(sfields))
+		for fname, ftype, val in sfields:
+			b.id(self.name(fname)).u1(ftype.value)
+			self._value(b, ftype, val)
+		b.u2(len(ifields))
+		for fname, ftype in ifields:
+			b.id(self.name(fname)).u1(ftype.value)
+		self._subrecords.append(bytes(b))
+		return clsid
+
+	def _value(self, b, t, val):
+		import struct
+		from hprof._parsing import jtype
+		if t is jtype.object:
+			b.id(val or 0)
+		elif t is jtype.boolean:
+			b.u1(1 if val else 0)
+		elif t is jtype.char:
+			b.add(val.encode('utf-16-be'))
+		elif t is jtype.float:
+			b.add(struct.pack('>f', val))
+		elif t is jtype.double:
+			b.add(struct.pack('>d', val))
+		else:
+			b.i(val, t.size)
+
+	def obj(self, clsid, *vals):
+		''' add an instance; vals are given in hprof order (the exact class'
+		fields first, then its superclass', etc.). returns the object id. '''
+		objid = self._allocid()
+		data = Builder(self.idsize)
+		types = []
+		c = clsid
+		while c:
+			_, c, ifields = self._classes[c]
+			types.extend(t for _, t in ifields)
+		assert len(types) == len(vals), (types, vals)
+		for t, v in zip(types, vals):
+			self._value(data, t, v)
+		b = Builder(self.idsize)
+		b.u1(0x21).id(objid).u4(1).id(clsid).u4(len(data)).add(data)
+		self._subrecords.append(bytes(b))
+		return objid
+
+	def objarray(self, clsid, elems):
+		''' add an object array; returns its id. '''
+		objid = self._allocid()
+		b = Builder(self.idsize)
+		b.u1(0x22).id(objid).u4(1).u4(len(elems)).id(clsid)
+		for e in elems:
+			b.id(e or 0)
+		self._subrecords.append(bytes(b))
+		return objid
+
+	def primarray(self, t, vals):
+		''' add a primitive array of jtype t; returns its id. '''
+		objid = self._allocid()
+		b = Builder(self.idsize)
+		b.u1(0x23).id(objid).u4(1).u4(len(vals)).u1(t.value)
+		for v in vals:
+			self._value(b, t, v)
+		self._subrecords.append(bytes(b))
+		return objid
+
+	def root(self, objid, rtype=0xff):
+		''' add a (sticky class or unknown, by default) gc root record. '''
+		assert rtype in (0xff, 0x05, 0x07, 0x89, 0x8b, 0x8d)
+		self._subrecords.append(bytes(Builder(self.idsize).u1(rtype).id(objid)))
+
+	def basics(self):
+		''' add java.lang.Object, java.lang.String and byte[] classes; returns
+		the class id of java.lang.Object. '''
+		from hprof._parsing import jtype
+		objcls = self.cls('java.lang.Object', None)
+		self._strings = self.cls('java.lang.String', objcls,
+				(('value', jtype.object), ('coder', jtype.byte), ('hash', jtype.int)),
+				(('LATIN1', jtype.byte, 0), ('UTF16', jtype.byte, 1)))
+		for t in (jtype.boolean, jtype.char, jtype.float, jtype.double,
+				jtype.byte, jtype.short, jtype.int, jtype.long):
+			self.cls(t.name + '[]', objcls)
+		return objcls
+
+	def string(self, text):
+		''' add a latin-1 java.lang.String and its backing array; returns the
+		String id. basics() must have been called first. '''
+		from hprof._parsing import jtype
+		data = [(b ^ 0x80) - 0x80 for b in text.encode('latin-1')]
+		value = self.primarray(jtype.byte, data)
+		return self.obj(self._strings, value, 0, 0)
+
+	def nodes(self, objcls, count, text=True):
+		''' add a com.example.Node class, with fields next, text (unless text
+		is false) and n, and a chain of count instances; each one's next is
+		the one before, and its text is 'node <n>'. basics() must have been
+		called first. returns the class id and the list of instance ids. '''
+		from hprof._parsing import jtype
+		ifields = [('next', jtype.object), ('text', jtype.object), ('n', jtype.int)]
+		if not text:
+			del ifields[1]
+		clsid = self.cls('com.example.Node', objcls, ifields)
+		ids = []
+		prev = None
+		for n in range(count):
+			vals = (prev, self.string('node %d' % n), n) if text else (prev, n)
+			prev = self.obj(clsid, *vals)
+			ids.append(prev)
+		return clsid, ids
+
+	def build(self, segments=1):
+		''' returns the complete hprof file as bytes. '''
+		out = Builder(self.idsize)
+		out.add(b'JAVA PROFILE 1.0.2\0').u4(self.idsize).u8(0)
+		def record(rtype, payload):
+			out.u1(rtype).u4(0).u4(len(payload)).add(payload)
+		for s, nameid in self._names.items():
+			record(0x01, Builder(self.idsize).id(nameid).utf8(s))
+		record(0x05, Builder(self.idsize).u4(1).u4(0).u4(0))
+		for serial, (clsid, nameid) in enumerate(self._loads, start=1):
+			record(0x02, Builder(self.idsize).u4(serial).id(clsid).u4(1).id(nameid))
+		per_segment = max(1, -(-len(self._subrecords) // segments))
+		for start in range(0, max(1, len(self._subrecords)), per_segment):
+			record(0x1c, b''.join(self._subrecords[start:start+per_segment]))
+		record(0x2c, b'')
+		return bytes(out)